@@ -0,0 +1,80 @@
+"""
+Download large bodies from the local benchmark server with MockSSLObject.bulk_read off (one record per read call)
+and on (every complete record in the incoming BIO per read call), and report MB/s and the number of read calls.
+
+The cryptography record backend is used when available, since otherwise decryption dominates everything else.
+
+Usage: python benchmarks/bench_bulk_read.py [body size in MB] [downloads] [--http2] [--trio]
+"""
+import sys
+import tempfile
+import time
+import anyio
+from httpx_tls import AsyncTLSClient
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import generate_certificate, start_server
+from httpx_tls.mocks import MockSSLObject
+
+
+class CountingReads:
+    """Wraps MockSSLObject.read to count how many times anyio/trio call it"""
+
+    def __init__(self):
+        self.calls = 0
+        self.original = MockSSLObject.read
+
+    def __enter__(self):
+        counter = self
+
+        def read(self, *args, **kwargs):
+            counter.calls += 1
+            return counter.original(self, *args, **kwargs)
+
+        MockSSLObject.read = read
+        return self
+
+    def __exit__(self, *args):
+        MockSSLObject.read = self.original
+
+
+async def download(url, certfile, http2, downloads):
+    record_backend = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    async with AsyncTLSClient(verify=certfile, http2=http2, record_backend=record_backend) as client:
+        (await client.get(url.rsplit('/', 1)[0] + '/0')).raise_for_status()
+
+        received = 0
+        start = time.perf_counter()
+        for _ in range(downloads):
+            async with client.stream('GET', url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+        return received, time.perf_counter() - start
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    size = int(float(args[0]) * 2 ** 20) if args else 100 * 2 ** 20
+    downloads = int(args[1]) if len(args) > 1 else 3
+    http2 = '--http2' in sys.argv
+    backend = 'trio' if '--trio' in sys.argv else 'asyncio'
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+        url = f"https://localhost:{port}/bytes/{size}"
+
+        try:
+            print(f"{downloads} x {size / 2 ** 20:.0f} MB over {'HTTP/2' if http2 else 'HTTP/1.1'} on {backend}")
+            for bulk_read in (False, True):
+                MockSSLObject.bulk_read = bulk_read
+                with CountingReads() as reads:
+                    received, elapsed = anyio.run(download, url, certfile, http2, downloads, backend=backend)
+                print(f"    bulk_read={bulk_read!s:5}  {received / elapsed / 2 ** 20:8.1f} MB/s  "
+                      f"{reads.calls:8} read calls")
+        finally:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Measure how long creating a ClientHello takes with and without the profile templates (httpx_tls.hello), leaving out
+the key shares which take the same time either way. That the ClientHellos are the same either way is checked by
+test/test_hello.py.
+
+Usage: python benchmarks/bench_client_hello.py [iterations]
+"""
+import sys
+import time
+from httpx_tls.bench import database_profiles
+from httpx_tls.hello import TemplateTLSConnection
+from httpx_tls.profiles import TLSProfile
+
+
+class FixedKeyShareConnection(TemplateTLSConnection):
+    """Reuses the same key shares, which take as long with templates as without them"""
+
+    key_shares = {}
+
+    def _genKeyShareEntry(self, group, version):
+        if group not in self.key_shares:
+            self.key_shares[group] = super()._genKeyShareEntry(group, version)
+        return self.key_shares[group]
+
+
+class NullSocket:
+    def send(self, data):
+        return len(data)
+
+    def sendall(self, data):
+        pass
+
+
+def time_client_hello(profile, templates, iterations):
+    hello_templates = profile.get_hello_templates() if templates else None
+    settings = profile.get_settings()
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        connection = FixedKeyShareConnection(NullSocket(), hello_templates=hello_templates)
+        connection._handshakeStart(client=True)
+        for result in connection._clientSendClientHello(settings, None, None, (), (None, None), (), 'example.com',
+                                                         None, True, [b'h2', b'http/1.1']):
+            if result not in (0, 1):
+                break
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    for label, ja3, _ in database_profiles()[:4]:
+        profile = TLSProfile.create_from_ja3(ja3)
+        without = time_client_hello(profile, False, iterations)
+        time_client_hello(profile, True, 1)
+        with_templates = time_client_hello(profile, True, iterations)
+        print(f"    {label:40} {without * 1e6:8.1f} us without templates {with_templates * 1e6:8.1f} us with "
+              f"({without / with_templates:.1f}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+"""
+Compare how many handshakes a crawl of many subdomains of the same server takes with and without HTTP/2 connection
+coalescing, over a link with a high round trip time.
+
+The server's certificate is valid for *.cdn.test, and every subdomain resolves to 127.0.0.1 (the names are resolved
+by the benchmark itself, like curl's --resolve option). The round trip time is added by the delay proxy of
+bench_flow_control.py. The crawl requests the first subdomain (for each TLS profile), then all the others
+concurrently. Without coalescing, every subdomain gets a connection (and handshake) of its own. With it, they all use
+the first subdomain's connection. The last row alternates between two TLS profiles, and only requests with the same
+profile share a connection.
+
+Usage: python benchmarks/bench_coalescing.py [subdomains] [round trip time in ms]
+"""
+import socket
+import sys
+import tempfile
+import time
+import anyio
+from httpx_tls import AsyncTLSClient, TLSProfile
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import database_profiles, generate_certificate, start_server
+from bench_flow_control import start_proxy
+
+DOMAIN = 'cdn.test'
+
+_getaddrinfo = socket.getaddrinfo
+
+
+def getaddrinfo(host, *args, **kwargs):
+    # anyio passes the name IDNA encoded
+    name = host.decode('ascii') if isinstance(host, bytes) else host
+    if isinstance(name, str) and name.endswith('.' + DOMAIN):
+        host = '127.0.0.1'
+    return _getaddrinfo(host, *args, **kwargs)
+
+
+async def crawl(port, certfile, subdomains, coalesce, profiles):
+    userspace = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    async with AsyncTLSClient(verify=certfile, http2=True, record_backend=userspace, metrics=True,
+                              coalesce=coalesce, timeout=60) as client:
+
+        async def fetch(i):
+            extensions = {'tls_profile': profiles[i % len(profiles)]} if profiles else None
+            response = await client.get(f"https://s{i}.{DOMAIN}:{port}/bytes/1024", extensions=extensions)
+            response.raise_for_status()
+
+        first = len(profiles) if profiles else 1
+        start = time.perf_counter()
+        for i in range(first):
+            await fetch(i)
+        async with anyio.create_task_group() as tg:
+            for i in range(first, subdomains):
+                tg.start_soon(fetch, i)
+        return time.perf_counter() - start, client.metrics.handshakes
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    subdomains = int(args[0]) if args else 20
+    rtt = float(args[1]) / 1000 if len(args) > 1 else 0.1
+
+    socket.getaddrinfo = getaddrinfo
+    profiles = [TLSProfile.create_from_ja3(ja3) for _, ja3, _ in database_profiles()[:2]]
+
+    modes = [('separate', False, None),
+             ('coalesced', True, None),
+             ('coalesced, profiles', True, profiles)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory, names=('*.' + DOMAIN, 'localhost'))
+        server, port = start_server(certfile, keyfile)
+        proxy, proxy_port = start_proxy(rtt, port)
+
+        try:
+            print(f"{subdomains} subdomains over HTTP/2 with a {rtt * 1000:.0f} ms round trip time")
+            for name, coalesce, mode_profiles in modes:
+                elapsed, handshakes = anyio.run(crawl, proxy_port, certfile, subdomains, coalesce, mode_profiles)
+                print(f"    {name:20}  {elapsed * 1000:7.1f} ms  handshakes {handshakes}/{subdomains}")
+        finally:
+            proxy.terminate()
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
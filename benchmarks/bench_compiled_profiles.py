@@ -0,0 +1,105 @@
+"""
+Compare how long it takes to get a set of profiles by building them from their ja3/akamai strings with how long it
+takes to load them from a compiled profile file, both when opening the file and unpacking every profile up front, and
+when opening it and unpacking only a few of them.
+
+The profiles are variations of the ones in the database (shuffled cipher and extension orders, different SETTINGS
+values), so that every one of them is distinct.
+
+Usage: python benchmarks/bench_compiled_profiles.py [profiles]
+"""
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+from httpx_tls.bench import database_profiles
+from httpx_tls.compiled import CompiledProfiles
+from httpx_tls.profiles import ProfileFactory
+
+LAZY_PROFILES = 100
+CHECKED_PROFILES = 1000
+
+
+def generate_fingerprints(total):
+    rng = random.Random(0)
+    fingerprints = set()
+    database = database_profiles()
+
+    while len(fingerprints) < total:
+        _, ja3, akamai_str = rng.choice(database)
+
+        version, ciphers, extensions, groups, points = ja3.split(',')
+        ciphers, extensions = ciphers.split('-'), extensions.split('-')
+        rng.shuffle(ciphers)
+        rng.shuffle(extensions)
+        ja3 = ','.join([version, '-'.join(ciphers), '-'.join(extensions), groups, points])
+
+        settings, connection_flow, priority_frames, header_order = akamai_str.split('|')
+        connection_flow = str(rng.randint(1, 2 ** 24))
+        akamai_str = '|'.join([settings, connection_flow, priority_frames, header_order])
+
+        fingerprints.add((ja3, akamai_str))
+
+    return list(fingerprints)
+
+
+def build_all(fingerprints, compiled=None):
+    factory = ProfileFactory(maxsize=None, compiled=compiled)
+    for ja3, akamai_str in fingerprints:
+        factory.tls_from_ja3(ja3)
+        factory.h2_from_akamai_str(akamai_str)
+    return factory
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    ret = func(*args)
+    return ret, time.perf_counter() - start
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    fingerprints = generate_fingerprints(total)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'profiles.bin')
+
+        built, build_time = timed(build_all, fingerprints)
+        _, export_time = timed(built.export, path)
+
+        # Every measurement starts without the profiles of the previous one around, since the garbage collector
+        # takes longer the more objects there are
+        del built
+        gc.collect()
+        compiled, open_time = timed(CompiledProfiles, path)
+        loaded, load_time = timed(build_all, fingerprints, compiled)
+
+        del loaded
+        gc.collect()
+        lazy, lazy_open_time = timed(CompiledProfiles, path)
+        _, lazy_time = timed(build_all, fingerprints[:LAZY_PROFILES], lazy)
+
+        # Profiles loaded from the file must be the same as the ones built from the strings
+        sample = fingerprints[:CHECKED_PROFILES]
+        built, loaded = build_all(sample), build_all(sample, compiled)
+        for ja3, akamai_str in sample:
+            original, copy = built.tls_from_ja3(ja3), loaded.tls_from_ja3(ja3)
+            assert vars(original.settings) == vars(copy.settings)
+            assert original.get_kwargs().keys() == copy.get_kwargs().keys()
+            original, copy = built.h2_from_akamai_str(akamai_str), loaded.h2_from_akamai_str(akamai_str)
+            assert vars(original) == vars(copy)
+
+        print(f"{total} TLS + HTTP2 profiles, compiled file of {os.path.getsize(path) / 2 ** 20:.1f} MB "
+              f"(trusted={compiled.trusted}, written in {export_time:.2f}s)")
+        print(f"    built from strings       {build_time:8.3f}s")
+        print(f"    loaded from compiled     {open_time + load_time:8.3f}s  (open {open_time:.3f}s)")
+        print(f"    opened, {LAZY_PROFILES} loaded lazily {lazy_open_time + lazy_time:8.3f}s")
+
+        compiled.close()
+        lazy.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark for database version lookups: resolve ja3 and akamai strings for every browser, device and version in a
+range and compare the previous dictionary scan against the compiled VersionIndex. Results of both are checked to be
+identical before timing.
+
+Usage: python benchmarks/bench_database.py
+"""
+import time
+from httpx_tls import database
+from httpx_tls.constants import Flags
+
+VERSIONS = range(0, 200)
+ROUNDS = 20
+
+
+def scan_dict(cls, version, d, flag=Flags.REASONABLE):
+    """The lookup Browser._find_version_from_given_dict did before, kept here for comparison"""
+
+    closest = None
+    min_dif = float('inf')
+
+    for version_bounds, value in d.items():
+        if '-' not in version_bounds:
+            lower_bound = upper_bound = int(version_bounds)
+        else:
+            lower_bound, upper_bound = map(int, version_bounds.split('-'))
+
+        if lower_bound <= version <= upper_bound:
+            return value
+        else:
+            if abs(lower_bound - version) < min_dif:
+                min_dif = abs(lower_bound - version)
+                closest = value
+            if abs(upper_bound - version) < min_dif:
+                min_dif = abs(upper_bound - version)
+                closest = value
+
+    if min_dif <= cls.reasonable and flag == Flags.REASONABLE:
+        return closest
+
+    return None
+
+
+def lookups():
+    for browser_class in set(database._browser_mapping.values()):
+        dicts = [browser_class.ja3_versions]
+        dicts.extend(data_class.akamai_versions for data_class in browser_class.h2_mapping.values() if data_class)
+        for d in dicts:
+            for version in VERSIONS:
+                for flag in (Flags.STRICT, Flags.REASONABLE):
+                    yield browser_class, version, d, flag
+
+
+def check_identical(cases):
+    for browser_class, version, d, flag in cases:
+        expected = scan_dict(browser_class, version, d, flag=flag)
+        got = browser_class._find_version_from_given_dict(version, d, flag=flag)
+        if got != expected:
+            raise AssertionError(f"{browser_class.__name__} version {version} flag {flag}: {got!r} != {expected!r}")
+
+
+def measure(find, cases):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        for browser_class, version, d, flag in cases:
+            find(browser_class, version, d, flag)
+    return time.perf_counter() - start
+
+
+def main():
+    cases = list(lookups())
+    check_identical(cases)
+
+    total = len(cases) * ROUNDS
+    scan = measure(lambda cls, version, d, flag: scan_dict(cls, version, d, flag=flag), cases)
+    index = measure(lambda cls, version, d, flag: cls._find_version_from_given_dict(version, d, flag=flag), cases)
+    print(f"{total} lookups across all browsers")
+    print(f"    dict scan:     {total / scan:12.0f} lookups/s")
+    print(f"    version index: {total / index:12.0f} lookups/s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+"""
+Compare how long the first request of a resumed connection takes with and without TLS 1.3 early data (0-RTT), over a
+link with a high round trip time.
+
+The ssl module cannot accept early data, so the server is OpenSSL driven through ctypes, which answers requests as
+soon as they arrive, early data included. It runs behind the delay proxy of bench_flow_control.py. Every connection
+resumes the session of the one before it. Without early data, the request is only sent once the resumed handshake
+completes, a round trip after the ClientHello. With early data, it is sent along with the ClientHello, and the
+response arrives a round trip sooner. The last row is for a server which rejects early data, which the client then
+sends again once the handshake completes. For each mode, the number of requests the server answered from early data
+is reported along with the median time.
+
+Usage: python benchmarks/bench_early_data.py [round trip time in ms] [connections] [--http1]
+"""
+import ctypes
+import ctypes.util
+import json
+import multiprocessing
+import socket
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import anyio
+from httpx_tls import AsyncTLSClient
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import H2ServerProtocol, generate_certificate
+from httpx_tls.cache import SessionCache
+from bench_flow_control import start_proxy
+
+SSL_FILETYPE_PEM = 1
+SSL_READ_EARLY_DATA_ERROR = 0
+SSL_READ_EARLY_DATA_FINISH = 2
+SSL_TLSEXT_ERR_OK = 0
+SSL_TLSEXT_ERR_NOACK = 3
+OPENSSL_NPN_NEGOTIATED = 1
+MAX_EARLY_DATA = 16384
+SSL_OP_NO_ANTI_REPLAY = 1 << 24
+
+ALPN_PROTOCOLS = b'\x02h2\x08http/1.1'
+ALPN_SELECT_CB = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p),
+                                  ctypes.POINTER(ctypes.c_ubyte), ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p)
+
+
+# Server side
+
+def load_libssl():
+    libssl = ctypes.CDLL(ctypes.util.find_library('ssl'))
+    size_p = ctypes.POINTER(ctypes.c_size_t)
+    signatures = {
+        'TLS_server_method': ([], ctypes.c_void_p),
+        'SSL_CTX_new': ([ctypes.c_void_p], ctypes.c_void_p),
+        'SSL_CTX_use_certificate_chain_file': ([ctypes.c_void_p, ctypes.c_char_p], ctypes.c_int),
+        'SSL_CTX_use_PrivateKey_file': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int], ctypes.c_int),
+        'SSL_CTX_set_max_early_data': ([ctypes.c_void_p, ctypes.c_uint32], ctypes.c_int),
+        'SSL_CTX_set_options': ([ctypes.c_void_p, ctypes.c_uint64], ctypes.c_uint64),
+        'SSL_CTX_set_alpn_select_cb': ([ctypes.c_void_p, ALPN_SELECT_CB, ctypes.c_void_p], None),
+        'SSL_select_next_proto': ([ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_ubyte), ctypes.c_char_p,
+                                   ctypes.c_uint, ctypes.c_void_p, ctypes.c_uint], ctypes.c_int),
+        'SSL_new': ([ctypes.c_void_p], ctypes.c_void_p),
+        'SSL_set_fd': ([ctypes.c_void_p, ctypes.c_int], ctypes.c_int),
+        'SSL_read_early_data': ([ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_write_early_data': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_accept': ([ctypes.c_void_p], ctypes.c_int),
+        'SSL_read_ex': ([ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_write_ex': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_get0_alpn_selected': ([ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p),
+                                    ctypes.POINTER(ctypes.c_uint)], None),
+        'SSL_free': ([ctypes.c_void_p], None),
+    }
+    for name, (argtypes, restype) in signatures.items():
+        func = getattr(libssl, name)
+        func.argtypes = argtypes
+        func.restype = restype
+    return libssl
+
+
+STATS = {'requests': 0, 'early': 0}
+STATS_LOCK = threading.Lock()
+
+
+class EarlyDataServerProtocol(H2ServerProtocol):
+    """The benchmark server's protocol, which also counts the requests it answered from early data"""
+
+    early = False  # Whether the data being received is early data
+
+    def _body_for(self, path):
+        if path == '/stats':
+            return json.dumps(STATS).encode()
+
+        with STATS_LOCK:
+            STATS['requests'] += 1
+            STATS['early'] += self.early
+        return super()._body_for(path)
+
+
+class BlockingTransport:
+    """Stands in for the asyncio transport (and SSL object) of the protocol, collecting what it writes"""
+
+    def __init__(self, alpn):
+        self.alpn = alpn
+        self.closed = False
+        self._written = []
+
+    def get_extra_info(self, name):
+        return self if name == 'ssl_object' else None
+
+    def selected_alpn_protocol(self):
+        return self.alpn
+
+    def write(self, data):
+        self._written.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self._written = b''.join(self._written), []
+        return data
+
+
+def _selected_alpn(libssl, ssl):
+    data = ctypes.c_void_p()
+    size = ctypes.c_uint()
+    libssl.SSL_get0_alpn_selected(ssl, ctypes.byref(data), ctypes.byref(size))
+    return ctypes.string_at(data, size.value).decode() if size.value else None
+
+
+def _handle(libssl, ctx, sock, accept_early_data):
+    ssl = libssl.SSL_new(ctx)
+    libssl.SSL_set_fd(ssl, sock.fileno())
+    buf = ctypes.create_string_buffer(2 ** 16)
+    size = ctypes.c_size_t()
+    transport = protocol = None
+
+    def receive(data, early, write):
+        nonlocal transport, protocol
+        if protocol is None:
+            transport = BlockingTransport(_selected_alpn(libssl, ssl))
+            protocol = EarlyDataServerProtocol()
+            protocol.connection_made(transport)
+        protocol.early = early
+        if data:
+            protocol.data_received(data)
+        out = transport.take()
+        return not out or write(ssl, out, len(out), ctypes.byref(size)) == 1
+
+    try:
+        # Early data is answered straight away, before the client's Finished arrives. A server which does not read
+        # early data this way rejects it.
+        while accept_early_data:
+            status = libssl.SSL_read_early_data(ssl, buf, len(buf), ctypes.byref(size))
+            if status == SSL_READ_EARLY_DATA_ERROR:
+                return
+            if not receive(buf.raw[:size.value], True, libssl.SSL_write_early_data):
+                return
+            if status == SSL_READ_EARLY_DATA_FINISH:
+                break
+
+        if libssl.SSL_accept(ssl) != 1 or not receive(b'', False, libssl.SSL_write_ex):
+            return
+        while not transport.closed and libssl.SSL_read_ex(ssl, buf, len(buf), ctypes.byref(size)) == 1:
+            if not receive(buf.raw[:size.value], False, libssl.SSL_write_ex):
+                return
+    finally:
+        libssl.SSL_free(ssl)
+        sock.close()
+
+
+def _serve(certfile, keyfile, accept_early_data, conn):
+    libssl = load_libssl()
+    ctx = libssl.SSL_CTX_new(libssl.TLS_server_method())
+    libssl.SSL_CTX_use_certificate_chain_file(ctx, certfile.encode())
+    libssl.SSL_CTX_use_PrivateKey_file(ctx, keyfile.encode(), SSL_FILETYPE_PEM)
+    # Session tickets only allow early data if the server accepts some
+    libssl.SSL_CTX_set_max_early_data(ctx, MAX_EARLY_DATA)
+    # With OpenSSL's anti-replay protection, the ticket sent on a resumed connection cannot be resumed in turn, which
+    # would leave every other connection with a full handshake
+    libssl.SSL_CTX_set_options(ctx, SSL_OP_NO_ANTI_REPLAY)
+
+    @ALPN_SELECT_CB
+    def select_alpn(ssl, out, outlen, client, client_len, arg):
+        if libssl.SSL_select_next_proto(out, outlen, ALPN_PROTOCOLS, len(ALPN_PROTOCOLS), client,
+                                        client_len) != OPENSSL_NPN_NEGOTIATED:
+            return SSL_TLSEXT_ERR_NOACK
+        return SSL_TLSEXT_ERR_OK
+
+    libssl.SSL_CTX_set_alpn_select_cb(ctx, select_alpn, None)
+
+    server = socket.create_server(('127.0.0.1', 0))
+    conn.send(server.getsockname()[1])
+    while True:
+        sock, _ = server.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=_handle, args=(libssl, ctx, sock, accept_early_data), daemon=True).start()
+
+
+def start_early_data_server(certfile, keyfile, accept_early_data=True):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(certfile, keyfile, accept_early_data, child_conn),
+                                      daemon=True)
+    process.start()
+    return process, parent_conn.recv()
+
+
+# Client
+
+async def first_requests(base_url, certfile, early_data, http2, connections):
+    userspace = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    session_cache = SessionCache()
+    durations = []
+    early = 0
+
+    # The first connection is a full handshake, which only gets the session to resume
+    for i in range(connections + 1):
+        async with AsyncTLSClient(verify=certfile, http2=http2, session_cache=session_cache, early_data=early_data,
+                                  record_backend=userspace, timeout=60) as client:
+            start = time.perf_counter()
+            (await client.get(base_url + '/bytes/1024')).raise_for_status()
+            if i:
+                durations.append(time.perf_counter() - start)
+
+            # A resumed session's tickets arrive once the handshake has completed, which can be after the response
+            # to early data. The next connection resumes the session with the tickets read along with this response.
+            stats = json.loads((await client.get(base_url + '/stats')).content)
+            if not i:
+                early = stats['early']
+
+    return durations, session_cache.resumed, stats['early'] - early
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    rtt = float(args[0]) / 1000 if args else 0.1
+    connections = int(args[1]) if len(args) > 1 else 10
+    http2 = '--http1' not in sys.argv
+
+    modes = [('1-RTT (resumed)', False, True),
+             ('0-RTT', True, True),
+             ('0-RTT, rejected', True, False)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        print(f"{connections} resumed connections over {'HTTP/2' if http2 else 'HTTP/1.1'} with a "
+              f"{rtt * 1000:.0f} ms round trip time")
+
+        for name, early_data, accept_early_data in modes:
+            server, port = start_early_data_server(certfile, keyfile, accept_early_data)
+            proxy, proxy_port = start_proxy(rtt, port)
+            try:
+                durations, resumed, early = anyio.run(first_requests, f"https://localhost:{proxy_port}", certfile,
+                                                      early_data, http2, connections)
+            finally:
+                proxy.terminate()
+                server.terminate()
+
+            print(f"    {name:16}  first request {statistics.median(durations) * 1000:7.1f} ms  "
+                  f"resumed {resumed}/{connections}  answered from early data {early}/{connections}")
+
+
+if __name__ == '__main__':
+    main()
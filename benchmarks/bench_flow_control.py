@@ -0,0 +1,129 @@
+"""
+Compare HTTP/2 download throughput with the profile's fixed flow control windows and with AdaptiveFlowControl, over a
+link with a high round trip time.
+
+The round trip time is added by a proxy in front of the local benchmark server, which holds back everything it
+forwards for half of it in each direction. The HTTP2 profile is Safari's (10 MB connection window), which limits a
+single connection to about 10 MB per round trip. For each mode, the size of the connection window once the downloads
+are done is reported along with the throughput, the last row showing a window kept within a 4 MB bound.
+
+Usage: python benchmarks/bench_flow_control.py [body size in MB] [round trip time in ms] [downloads]
+"""
+import asyncio
+import multiprocessing
+import sys
+import tempfile
+import time
+import anyio
+from httpx_tls import AsyncTLSClient, Http2Profile
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import generate_certificate, start_server
+from httpx_tls.flowcontrol import AdaptiveFlowControl
+
+AKAMAI = '2:0,4:4194304,3:100|10485760|0|m,s,p,a'
+
+
+# Delay proxy
+
+class DelayedPipe(asyncio.Protocol):
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.transport = None
+        self.peer = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        asyncio.get_running_loop().call_later(self.delay, self.peer.transport.write, data)
+
+    def connection_lost(self, exc):
+        asyncio.get_running_loop().call_later(self.delay, self.peer.transport.close)
+
+
+class DelayProxy(DelayedPipe):
+
+    def __init__(self, delay, upstream_port):
+        super().__init__(delay)
+        self.upstream_port = upstream_port
+
+    def connection_made(self, transport):
+        super().connection_made(transport)
+        transport.pause_reading()
+        asyncio.ensure_future(self._connect())
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        _, self.peer = await loop.create_connection(lambda: DelayedPipe(self.delay), '127.0.0.1', self.upstream_port)
+        self.peer.peer = self
+        self.transport.resume_reading()
+
+
+def _serve_proxy(delay, upstream_port, conn):
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(lambda: DelayProxy(delay, upstream_port), '127.0.0.1', 0)
+        conn.send(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_proxy(rtt, upstream_port):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve_proxy, args=(rtt / 2, upstream_port, child_conn), daemon=True)
+    process.start()
+    return process, parent_conn.recv()
+
+
+# Client
+
+async def download(url, certfile, flow_control, downloads):
+    userspace = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    async with AsyncTLSClient(h2_config=Http2Profile.create_from_akamai_str(AKAMAI), verify=certfile, http2=True,
+                              record_backend=userspace, flow_control=flow_control, timeout=60) as client:
+        (await client.get(url.rsplit('/', 1)[0] + '/0')).raise_for_status()
+
+        received = 0
+        start = time.perf_counter()
+        for _ in range(downloads):
+            async with client.stream('GET', url) as response:
+                response.raise_for_status()
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+        elapsed = time.perf_counter() - start
+
+        h2_state = client._transport._pool._pool[0]._connection._h2_state
+        return received, elapsed, h2_state._inbound_flow_control_window_manager.max_window_size
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    size = int(float(args[0]) * 2 ** 20) if args else 100 * 2 ** 20
+    rtt = float(args[1]) / 1000 if len(args) > 1 else 0.3
+    downloads = int(args[2]) if len(args) > 2 else 2
+
+    modes = [('fixed', None),
+             ('adaptive', AdaptiveFlowControl()),
+             ('adaptive, 4 MB', AdaptiveFlowControl(max_window=2 ** 22))]
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+        proxy, proxy_port = start_proxy(rtt, port)
+        url = f"https://localhost:{proxy_port}/bytes/{size}"
+
+        try:
+            print(f"{downloads} x {size / 2 ** 20:.0f} MB over HTTP/2 with a {rtt * 1000:.0f} ms round trip time")
+            for name, flow_control in modes:
+                received, elapsed, window = anyio.run(download, url, certfile, flow_control, downloads)
+                print(f"    {name:16}  {received / elapsed / 2 ** 20:8.1f} MB/s  connection window "
+                      f"{window / 2 ** 20:6.1f} MB")
+        finally:
+            proxy.terminate()
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
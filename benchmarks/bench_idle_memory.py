@@ -0,0 +1,97 @@
+"""
+Measure the memory held by each idle keep-alive connection with tracemalloc.
+
+Opens connections to the local benchmark server with AsyncTLSTransport.prewarm, downloads a body over each one so
+that its buffers have seen a large read, and reports how much more memory is allocated once they are all idle than
+before they were opened, per connection, along with the files which allocated most of it.
+
+Usage: python benchmarks/bench_idle_memory.py [connections] [body size in KB] [--http1] [--python]
+"""
+import gc
+import sys
+import tempfile
+import tracemalloc
+import anyio
+import httpcore
+from httpx_tls import Http2Profile, TLSProfile
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import generate_certificate, start_server
+from httpx_tls.transport import AsyncTLSTransport
+
+JA3 = '771,4865-4866-4867-49195-49199-49196-49200-52393-52392-49171-49172-156-157-47-53,' \
+      '0-23-65281-10-11-35-16-5-13-18-51-45-43-27-17513-21,29-23-24,0'
+AKAMAI = '1:65536,2:0,4:6291456,6:262144|15663105|0|m,a,s,p'
+
+
+async def download(transport, connection, port, size):
+    request = httpcore.Request(b'GET', httpcore.URL(scheme=b'https', host=b'localhost', port=port,
+                                                    target=f'/bytes/{size}'.encode()),
+                               headers=[(b'Host', f'localhost:{port}'.encode())],
+                               extensions={'h2_profile': transport.h2_config})
+    response = await connection.handle_async_request(request)
+    async for _ in response.aiter_stream():
+        pass
+    await response.aclose()
+
+
+async def open_idle_connections(transport, port, connections, size):
+    results = await transport.prewarm([f'https://localhost:{port}'], connections_per_origin=connections)
+    failed = sum(result['failed'] for result in results.values())
+    if failed:
+        raise RuntimeError(f"{failed} connections failed: {next(iter(results.values()))['errors'][0]!r}")
+
+    for connection in list(transport._pool._pool):
+        await download(transport, connection, port, size)
+
+
+async def measure(certfile, port, connections, size, http2, record_backend):
+    transport = AsyncTLSTransport(TLSProfile.create_from_ja3(JA3), Http2Profile.create_from_akamai_str(AKAMAI),
+                                  verify=certfile, http1=not http2, http2=http2, record_backend=record_backend)
+    limits = connections + 1
+    transport._pool._max_connections = transport._pool._max_keepalive_connections = limits
+
+    # A first connection loads everything which is only allocated once (modules, profile templates, trust store)
+    await open_idle_connections(transport, port, 1, size)
+
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    await open_idle_connections(transport, port, connections, size)
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+
+    await transport.aclose()
+    return after.compare_to(before, 'filename')
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    connections = int(args[0]) if args else 200
+    size = int(float(args[1]) * 1024) if len(args) > 1 else 64 * 1024
+    http2 = '--http1' not in sys.argv
+    if cryptography_loaded and '--python' not in sys.argv:
+        record_backend = RecordBackends.CRYPTOGRAPHY
+    else:
+        record_backend = RecordBackends.PYTHON
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+
+        try:
+            tracemalloc.start()
+            stats = anyio.run(measure, certfile, port, connections, size, http2, record_backend)
+            tracemalloc.stop()
+        finally:
+            server.terminate()
+
+    total = sum(stat.size_diff for stat in stats)
+    print(f"{connections} idle {'HTTP/2' if http2 else 'HTTP/1.1'} connections after a {size // 1024} KB download "
+          f"each, {record_backend} record backend: {total / connections:,.0f} bytes per connection")
+    for stat in sorted(stats, key=lambda stat: stat.size_diff, reverse=True)[:12]:
+        if stat.size_diff <= 0:
+            break
+        print(f"    {stat.size_diff / connections:10,.0f}  {stat.traceback[0].filename}")
+
+
+if __name__ == '__main__':
+    main()
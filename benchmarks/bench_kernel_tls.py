@@ -0,0 +1,91 @@
+"""
+Compare download throughput on loopback with the cryptography and kernel (Linux kTLS) record backends. The python
+backend is only measured without the cryptography package, as it is orders of magnitude slower than either.
+
+With the kernel backend, every connection reports whether the kernel took over its record protection. Where it
+cannot (no tls kernel module, not Linux, or a cipher the kernel does not support), connections fall back to the
+cryptography backend (python without it), and the kernel row measures that fallback instead. The server is the local
+benchmark server, which has its own (OpenSSL) record layer.
+
+Usage: python benchmarks/bench_kernel_tls.py [body size in MB] [downloads] [--http2] [--sync]
+"""
+import sys
+import tempfile
+import time
+import anyio
+from httpx_tls import AsyncTLSClient, TLSClient
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.bench import generate_certificate, start_server
+
+
+def uses_kernel_tls(response):
+    ssl_object = response.extensions['network_stream'].get_extra_info('ssl_object')
+    return ssl_object is not None and ssl_object.kernel_tls is not None
+
+
+async def download_async(url, certfile, record_backend, http2, downloads):
+    async with AsyncTLSClient(verify=certfile, http2=http2, record_backend=record_backend) as client:
+        (await client.get(url.rsplit('/', 1)[0] + '/0')).raise_for_status()
+
+        received = 0
+        kernel = []
+        start = time.perf_counter()
+        for _ in range(downloads):
+            async with client.stream('GET', url) as response:
+                response.raise_for_status()
+                kernel.append(uses_kernel_tls(response))
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+        return received, time.perf_counter() - start, kernel
+
+
+def download_sync(url, certfile, record_backend, http2, downloads):
+    with TLSClient(verify=certfile, http2=http2, record_backend=record_backend) as client:
+        client.get(url.rsplit('/', 1)[0] + '/0').raise_for_status()
+
+        received = 0
+        kernel = []
+        start = time.perf_counter()
+        for _ in range(downloads):
+            with client.stream('GET', url) as response:
+                response.raise_for_status()
+                kernel.append(uses_kernel_tls(response))
+                for chunk in response.iter_raw():
+                    received += len(chunk)
+        return received, time.perf_counter() - start, kernel
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    size = int(float(args[0]) * 2 ** 20) if args else 50 * 2 ** 20
+    downloads = int(args[1]) if len(args) > 1 else 3
+    http2 = '--http2' in sys.argv
+    sync = '--sync' in sys.argv
+
+    userspace = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    backends = [userspace, RecordBackends.KERNEL]
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+        url = f"https://localhost:{port}/bytes/{size}"
+
+        try:
+            print(f"{downloads} x {size / 2 ** 20:.0f} MB over {'HTTP/2' if http2 else 'HTTP/1.1'} with the "
+                  f"{'sync' if sync else 'async'} client")
+            for record_backend in backends:
+                if sync:
+                    received, elapsed, kernel = download_sync(url, certfile, record_backend, http2, downloads)
+                else:
+                    received, elapsed, kernel = anyio.run(download_async, url, certfile, record_backend, http2,
+                                                          downloads)
+                note = ''
+                if record_backend == RecordBackends.KERNEL:
+                    note = f"  kernel TLS on {sum(kernel)}/{len(kernel)} connections"
+                print(f"    {record_backend:12}  {received / elapsed / 2 ** 20:8.1f} MB/s{note}")
+        finally:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
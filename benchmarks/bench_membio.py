@@ -0,0 +1,73 @@
+"""
+Microbenchmark for MockOpenSSLMemBIO: drain multi-megabyte bodies in small reads and report MB/s for the previous
+slice-and-copy implementation and the current chunked one.
+
+Usage: python benchmarks/bench_membio.py [body size in MB ...]
+"""
+import sys
+import time
+from httpx_tls.mocks import MockOpenSSLMemBIO
+
+WRITE_SIZE = 16 * 1024 + 5 + 16  # One max size TLS record plus header and AEAD tag
+READ_SIZE = 4096
+
+
+class SliceMemBIO:
+    """The implementation MockOpenSSLMemBIO used before, kept here for comparison"""
+
+    def __init__(self):
+        self._pipe = bytearray()
+
+    @property
+    def pending(self):
+        return len(self._pipe)
+
+    def read(self, n=-1):
+        if n < 0:
+            n = len(self._pipe)
+        ret = self._pipe[:n]
+        self._pipe = self._pipe[n:]
+        return ret
+
+    def write(self, buf):
+        self._pipe += buf
+        return len(buf)
+
+
+def drain_with_read(bio, body):
+    for i in range(0, len(body), WRITE_SIZE):
+        bio.write(body[i:i + WRITE_SIZE])
+    while bio.pending:
+        bio.read(READ_SIZE)
+
+
+def drain_with_readinto(bio, body):
+    buf = bytearray(READ_SIZE)
+    for i in range(0, len(body), WRITE_SIZE):
+        bio.write(body[i:i + WRITE_SIZE])
+    while bio.pending:
+        bio.readinto(buf)
+
+
+def measure(bio_class, drain, body, rounds=3):
+    best = float('inf')
+    for _ in range(rounds):
+        bio = bio_class()
+        start = time.perf_counter()
+        drain(bio, body)
+        best = min(best, time.perf_counter() - start)
+
+    return len(body) / best / 2 ** 20
+
+
+def main(sizes):
+    for size in sizes:
+        body = bytes(size * 2 ** 20)
+        print(f"{size} MB body, {READ_SIZE} byte reads")
+        print(f"    slice-and-copy read:  {measure(SliceMemBIO, drain_with_read, body):10.1f} MB/s")
+        print(f"    chunked read:         {measure(MockOpenSSLMemBIO, drain_with_read, body):10.1f} MB/s")
+        print(f"    chunked readinto:     {measure(MockOpenSSLMemBIO, drain_with_readinto, body):10.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or [1, 4, 16])
@@ -0,0 +1,102 @@
+"""
+Measure what the global patches applied once a httpx-tls client is created cost traffic which does not use tlslite at
+all (plain httpx.AsyncClient with the stdlib ssl module), and compare AsyncTLSClient with httpx.AsyncClient over
+AsyncTLSTransport, which uses no patches.
+
+- call overhead: time per anyio TLSStream._call_sslobject_method call on a stream wrapping a real ssl.SSLObject,
+  with the patches applied and removed
+- requests: requests/s of a plain httpx.AsyncClient against the local benchmark server, patched and unpatched
+
+Usage: python benchmarks/bench_patch_overhead.py [requests] [--http2]
+"""
+import ssl
+import sys
+import tempfile
+import time
+import anyio
+import anyio.streams.tls
+import httpx
+import httpx_tls
+from httpx_tls import AsyncTLSClient
+from httpx_tls.bench import generate_certificate, start_server
+from httpx_tls.transport import AsyncTLSTransport
+
+CALLS = 200000
+
+
+class NullStream:
+    """Transport stream which is never used, since the SSL object method called never needs the network"""
+
+
+async def call_overhead():
+    bio_in, bio_out = ssl.MemoryBIO(), ssl.MemoryBIO()
+    ssl_object = ssl.create_default_context().wrap_bio(bio_in, bio_out, server_hostname='localhost')
+    stream = anyio.streams.tls.TLSStream(transport_stream=NullStream(), standard_compatible=False,
+                                         _ssl_object=ssl_object, _read_bio=bio_in, _write_bio=bio_out)
+
+    start = time.perf_counter()
+    for _ in range(CALLS):
+        await stream._call_sslobject_method(ssl_object.pending)
+    return (time.perf_counter() - start) / CALLS
+
+
+async def requests_per_second(client, url, total):
+    (await client.get(url)).raise_for_status()
+
+    start = time.perf_counter()
+    async with anyio.create_task_group() as tg:
+        for _ in range(total):
+            tg.start_soon(client.get, url)
+    return total / (time.perf_counter() - start)
+
+
+async def plain_requests(url, certfile, http2, total):
+    async with httpx.AsyncClient(verify=certfile, http2=http2) as client:
+        return await requests_per_second(client, url, total)
+
+
+async def tls_requests(url, certfile, http2, total, isolated):
+    if isolated:
+        client = httpx.AsyncClient(transport=AsyncTLSTransport(verify=certfile, http2=http2))
+    else:
+        client = AsyncTLSClient(verify=certfile, http2=http2)
+
+    async with client:
+        return await requests_per_second(client, url, total)
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    total = int(args[0]) if args else 1000
+    http2 = '--http2' in sys.argv
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+        url = f"https://localhost:{port}/bytes/0"
+
+        try:
+            results = {}
+            for patched in (True, False):
+                if patched:
+                    httpx_tls.patch()
+                else:
+                    httpx_tls.unpatch_all()
+
+                results[patched] = (anyio.run(call_overhead), anyio.run(plain_requests, url, certfile, http2, total))
+
+            print(f"plain httpx.AsyncClient, {'HTTP/2' if http2 else 'HTTP/1.1'}, {total} requests")
+            for patched, (overhead, rps) in results.items():
+                print(f"    {'patched' if patched else 'unpatched':10} {overhead * 1e9:8.0f} ns per "
+                      f"_call_sslobject_method call {rps:10.1f} requests/s")
+
+            print("tlslite clients")
+            for name, isolated in (('AsyncTLSClient', False), ('AsyncTLSTransport', True)):
+                rps = anyio.run(tls_requests, url, certfile, http2, total, isolated)
+                print(f"    {name:18} {rps:10.1f} requests/s")
+        finally:
+            server.terminate()
+
+
+if __name__ == '__main__':
+    main()
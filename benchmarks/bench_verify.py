@@ -0,0 +1,100 @@
+"""
+Measure what certificate verification (httpx_tls.verify) costs: the time to verify a chain of a local PKI (root,
+intermediate and leaf certificates, with RSA and ECDSA keys) with a new trust store (parsing the CA certificates
+included), with the store already indexed, and with the chain already verified (cached), for the certifi CA bundle plus
+the local root. That verification accepts and rejects the same chains as the ssl module is checked by
+test/test_verify.py.
+
+Requires the cryptography package to generate the certificates.
+
+Usage: python benchmarks/bench_verify.py [iterations]
+"""
+import datetime
+import ssl
+import sys
+import time
+import certifi
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from httpx_tls.verify import TrustStore
+
+HOSTNAME = 'www.verify.localhost'
+
+
+def new_key(kind):
+    if kind == 'rsa':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return ec.generate_private_key(ec.SECP256R1() if kind == 'p256' else ec.SECP384R1())
+
+
+def issue(name, key, issuer_name=None, issuer_key=None, ca=False, path_length=None, dns_names=(), days=30,
+          offset_days=-1):
+    now = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=offset_days)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    builder = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(issuer_name or subject) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=days)) \
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False) \
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key((issuer_key or key).public_key()),
+                       critical=False)
+    if ca is not None:
+        builder = builder.add_extension(x509.BasicConstraints(ca=ca, path_length=path_length), critical=True)
+    if ca:
+        builder = builder.add_extension(x509.KeyUsage(digital_signature=False, content_commitment=False,
+                                                      key_encipherment=False, data_encipherment=False,
+                                                      key_agreement=False, key_cert_sign=True, crl_sign=True,
+                                                      encipher_only=False, decipher_only=False), critical=True)
+    if dns_names:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in dns_names]),
+                                        critical=False)
+        builder = builder.add_extension(x509.ExtendedKeyUsage([ExtendedKeyUsageOID.SERVER_AUTH]), critical=False)
+    return builder.sign(issuer_key or key, hashes.SHA256())
+
+
+def build_chain(kind):
+    root_key, intermediate_key, leaf_key = new_key(kind), new_key(kind), new_key(kind)
+    root = issue(f'{kind} root', root_key, ca=True)
+    intermediate = issue(f'{kind} intermediate', intermediate_key, root.subject, root_key, ca=True, path_length=0)
+    leaf = issue(HOSTNAME, leaf_key, intermediate.subject, intermediate_key, dns_names=[HOSTNAME])
+    return [c.public_bytes(serialization.Encoding.DER) for c in (leaf, intermediate, root)]
+
+
+def time_verification(chain, iterations):
+    certificates = TrustStore.load_certificates(ssl.create_default_context(cafile=certifi.where()))
+    certificates.append(chain.pop())
+
+    start = time.perf_counter()
+    store = TrustStore(certificates)
+    store.verify(chain, HOSTNAME)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        store.verified_chains.clear()
+        store.verify(chain, HOSTNAME)
+    indexed = (time.perf_counter() - start) / iterations
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        store.verify(chain, HOSTNAME)
+    cached = (time.perf_counter() - start) / iterations
+    return len(certificates), cold, indexed, cached
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+    for kind in ('rsa', 'p256', 'p384'):
+        size, cold, indexed, cached = time_verification(build_chain(kind), iterations)
+        print(f"{kind:5} chain against {size} CA certificates: new store {cold * 1e3:7.1f} ms, "
+              f"indexed {indexed * 1e3:6.2f} ms, cached {cached * 1e6:6.1f} us")
+
+
+if __name__ == '__main__':
+    main()
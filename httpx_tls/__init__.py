@@ -1,6 +1,4 @@
 from httpx_tls.patch import unpatch_all, patch
-from httpx_tls.profiles import TLSProfile, Http2Profile
-from httpx_tls.client import AsyncTLSClient
-
-patch()
+from httpx_tls.profiles import TLSProfile, Http2Profile, ProfileFactory
+from httpx_tls.client import AsyncTLSClient, TLSClient
 
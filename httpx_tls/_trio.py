@@ -0,0 +1,59 @@
+import functools
+import trio
+from httpcore._backends.trio import TrioBackend, TrioStream
+from httpcore._exceptions import ConnectError, ConnectTimeout, map_exceptions
+from httpx_tls.patch._async import retry_tlslite
+from httpx_tls.patch._trio import TrioSSLStreamPatch
+
+# The trio counterparts of the stream and backend classes in httpx_tls.transport
+
+
+async def _trio_retry(ssl_stream, fn, *args, ignore_want_read=False, is_handshake=False):
+    call_original = functools.partial(TrioSSLStreamPatch.get_original('_retry'), ssl_stream,
+                                      ignore_want_read=ignore_want_read, is_handshake=is_handshake)
+    return await retry_tlslite(call_original, fn, *args)
+
+
+async def _trio_aclose(ssl_stream):
+    ssl_stream._ssl_object.connection_closed()
+    await TrioSSLStreamPatch.get_original('aclose')(ssl_stream)
+
+
+class TLSTrioStream(TrioStream):
+
+    async def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        # Same as TrioStream.start_tls, except that trio.SSLStream cannot be subclassed, so its retry loop (and aclose)
+        # are replaced on this one instance instead
+        timeout_or_inf = float("inf") if timeout is None else timeout
+        exc_map = {
+            trio.TooSlowError: ConnectTimeout,
+            trio.BrokenResourceError: ConnectError,
+        }
+        ssl_stream = trio.SSLStream(
+            self._stream,
+            ssl_context=ssl_context,
+            server_hostname=server_hostname,
+            https_compatible=True,
+            server_side=False,
+        )
+        ssl_stream._retry = functools.partial(_trio_retry, ssl_stream)
+        ssl_stream.aclose = functools.partial(_trio_aclose, ssl_stream)
+        with map_exceptions(exc_map):
+            try:
+                with trio.fail_after(timeout_or_inf):
+                    await ssl_stream.do_handshake()
+            except Exception as exc:
+                await self.aclose()
+                raise exc
+        return TrioStream(ssl_stream)
+
+
+class TLSTrioBackend(TrioBackend):
+
+    async def connect_tcp(self, *args, **kwargs):
+        stream = await super().connect_tcp(*args, **kwargs)
+        return TLSTrioStream(stream._stream)
+
+    async def connect_unix_socket(self, *args, **kwargs):
+        stream = await super().connect_unix_socket(*args, **kwargs)
+        return TLSTrioStream(stream._stream)
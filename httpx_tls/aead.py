@@ -0,0 +1,86 @@
+try:
+    from cryptography.exceptions import InvalidTag
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+except ImportError:
+    cryptography_loaded = False
+else:
+    cryptography_loaded = True
+
+__all__ = ["RecordBackends",
+           "cryptography_loaded",
+           "install_native_aead"]
+
+
+class RecordBackends:
+    PYTHON = 'python'
+    CRYPTOGRAPHY = 'cryptography'
+    # Linux kernel TLS (see httpx_tls.ktls), for the sync client and the async one on asyncio. Connections the kernel
+    # cannot take over (and trio ones) use the cryptography backend if it is available, and the python one otherwise.
+    KERNEL = 'kernel'
+
+    ALL = (PYTHON, CRYPTOGRAPHY, KERNEL)
+
+
+class CryptographyAEAD:
+    """
+    Drop-in replacement for tlslite's AEAD cipher objects (AESGCM, CHACHA20_POLY1305) which hands the actual record
+    protection to the cryptography package. It exposes the same attributes the tlslite record layer reads, and like
+    tlslite, returns None from open() if the tag does not match.
+    """
+
+    implementation = RecordBackends.CRYPTOGRAPHY
+    isBlockCipher = False
+    isAEAD = True
+    nonceLength = 12
+    tagLength = 16
+
+    def __init__(self, name, key):
+        self.name = name
+        self.key = key
+        if name == "chacha20-poly1305":
+            self._aead = ChaCha20Poly1305(bytes(key))
+        else:
+            self._aead = AESGCM(bytes(key))
+
+    def seal(self, nonce, plaintext, data):
+        return bytearray(self._aead.encrypt(bytes(nonce), bytes(plaintext), bytes(data)))
+
+    def open(self, nonce, ciphertext, data):
+        try:
+            return bytearray(self._aead.decrypt(bytes(nonce), bytes(ciphertext), bytes(data)))
+        except InvalidTag:
+            return None
+
+
+def _replace_enc_context(state, tls13):
+    context = state.encContext
+    if context is None or context.implementation == RecordBackends.CRYPTOGRAPHY:
+        return
+
+    if context.name in ("aes128gcm", "aes256gcm"):
+        state.encContext = CryptographyAEAD(context.name, context.key)
+
+    # The draft version of ChaCha20-Poly1305 used in TLS 1.2 (with a 4 byte fixed nonce) is not the RFC 7539
+    # construction the cryptography package implements, so we leave it to tlslite
+    elif context.name == "chacha20-poly1305" and (tls13 or len(state.fixedNonce) == 12):
+        state.encContext = CryptographyAEAD(context.name, context.key)
+
+
+def install_native_aead(tls_connection):
+    """
+    Swap the encryption contexts of an established tlslite connection with ones backed by the cryptography package.
+    Must only be called after the handshake has completed so the ClientHello (and hence the fingerprint) is left as
+    is. Ciphers the cryptography package cannot handle stay on the pure python implementation.
+
+    :param tlslite.TLSConnection tls_connection: Connection whose record layer should be switched
+    :return: bool, whether the cryptography package is available to do the switch
+    """
+
+    if not cryptography_loaded:
+        return False
+
+    record_layer = tls_connection._recordLayer
+    tls13 = tls_connection.version > (3, 3)
+    _replace_enc_context(record_layer._writeState, tls13)
+    _replace_enc_context(record_layer._readState, tls13)
+    return True
@@ -0,0 +1,395 @@
+"""
+End-to-end load benchmark for httpx-tls.
+
+Starts a local TLS + HTTP/2 server (stdlib ssl and h2) on loopback in a separate process, then drives it with
+AsyncTLSClient using the TLS and HTTP2 profiles from the database, and with plain httpx.AsyncClient as a baseline, on
+every requested async backend. Results are printed as JSON.
+
+Usage: python -m httpx_tls.bench [--help]
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import anyio
+import httpx
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+from httpx_tls import database
+from httpx_tls.client import AsyncTLSClient
+from httpx_tls.profiles import ProfileFactory
+
+__all__ = ["main",
+           "run_benchmarks"]
+
+BASELINE = 'httpx'
+
+
+# Server side
+
+class H2ServerProtocol(asyncio.Protocol):
+    """
+    Minimal HTTP server used as the benchmark target. Speaks HTTP/2 when negotiated through ALPN and falls back to a
+    bare-bones HTTP/1.1 otherwise. GET /bytes/<n> responds with n bytes, every other path with an empty body.
+    """
+
+    def __init__(self):
+        self.transport = None
+        self.conn = None
+        self.pending = {}  # Response data waiting for flow control window, by stream id
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == 'h2':
+            self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False,
+                                                                             header_encoding='utf-8'))
+            self.conn.initiate_connection()
+            self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        if self.conn is None:
+            return self._http11_data_received(data)
+
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                headers = dict(event.headers)
+                self._respond(event.stream_id, self._body_for(headers.get(':path', '/')))
+            elif isinstance(event, h2.events.WindowUpdated):
+                for stream_id in list(self.pending):
+                    self._send_pending(stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                self.pending.pop(event.stream_id, None)
+
+        self.transport.write(self.conn.data_to_send())
+
+    @staticmethod
+    def _body_for(path):
+        if path.startswith('/bytes/'):
+            return bytes(int(path[len('/bytes/'):]))
+        return b''
+
+    def _respond(self, stream_id, body):
+        self.conn.send_headers(stream_id, [(':status', '200'), ('content-length', str(len(body)))],
+                               end_stream=not body)
+        if body:
+            self.pending[stream_id] = memoryview(body)
+            self._send_pending(stream_id)
+
+    def _send_pending(self, stream_id):
+        data = self.pending[stream_id]
+        while data:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0:
+                self.pending[stream_id] = data
+                return
+
+            chunk, data = data[:window], data[window:]
+            self.conn.send_data(stream_id, chunk.tobytes(), end_stream=not data)
+
+        del self.pending[stream_id]
+
+    def _http11_data_received(self, data):
+        self.buffer += data
+        while b'\r\n\r\n' in self.buffer:
+            head, self.buffer = self.buffer.split(b'\r\n\r\n', 1)
+            path = head.split(b'\r\n', 1)[0].split(b' ')[1].decode()
+            body = self._body_for(path)
+            self.transport.write(b'HTTP/1.1 200 OK\r\ncontent-length: %d\r\n\r\n' % len(body) + body)
+
+
+def _serve(certfile, keyfile, conn):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(['h2', 'http/1.1'])
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(H2ServerProtocol, '127.0.0.1', 0, ssl=context, backlog=4096)
+        conn.send(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def generate_certificate(directory, names=('localhost',)):
+    """
+    Create a self-signed certificate for localhost with the cryptography package if available, otherwise with the
+    openssl command line tool.
+
+    :param tuple names: DNS names the certificate is valid for, the first of which is also its common name
+    :return: tuple of certificate and key file paths
+    """
+
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+
+    try:
+        import datetime
+        from cryptography import x509
+        from cryptography.x509.oid import NameOID
+        from cryptography.hazmat.primitives import hashes, serialization
+        from cryptography.hazmat.primitives.asymmetric import ec
+    except ImportError:
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'ec', '-pkeyopt', 'ec_paramgen_curve:prime256v1',
+                        '-nodes', '-days', '1', '-subj', f'/CN={names[0]}',
+                        '-addext', 'subjectAltName=' + ','.join(f'DNS:{name}' for name in names),
+                        '-keyout', keyfile, '-out', certfile], check=True, capture_output=True)
+        return certfile, keyfile
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(name) for name in names]), critical=False)
+            .sign(key, hashes.SHA256()))
+
+    with open(certfile, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+def start_server(certfile, keyfile):
+    """
+    Start the benchmark server in a separate process
+
+    :return: tuple of the process and the port it listens on
+    """
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=_serve, args=(certfile, keyfile, child_conn), daemon=True)
+    process.start()
+    if not parent_conn.poll(30):
+        process.terminate()
+        raise RuntimeError("benchmark server did not start")
+    return process, parent_conn.recv()
+
+
+# Client side
+
+def database_profiles():
+    """
+    Every distinct (ja3, akamai string) combination in the database, labelled with one browser, device and version
+    which uses it.
+
+    :return: list of (label, ja3, akamai string) tuples
+    """
+
+    seen = {}
+    for browser_name, browser_class in database._browser_mapping.items():
+        for version_bounds in browser_class.ja3_versions:
+            version = int(version_bounds.split('-')[-1])
+            for device, data_class in browser_class.h2_mapping.items():
+                if data_class is None or device == 'ios':
+                    continue
+                ja3 = browser_class.get_ja3_from_version(version)
+                akamai_str = browser_class.get_akamai_str_from_version(version, device)
+                seen.setdefault((ja3, akamai_str), f"{browser_name}-{version}-{device}")
+
+    return [(label, ja3, akamai_str) for (ja3, akamai_str), label in seen.items()]
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Scenario:
+    """One client configuration to benchmark"""
+
+    def __init__(self, label, certfile, http2, factory=None, ja3=None, akamai_str=None, client_kwargs=None):
+        self.label = label
+        self.certfile = certfile
+        self.http2 = http2
+        self.tls_config = factory.tls_from_ja3(ja3) if ja3 else None
+        self.h2_config = factory.h2_from_akamai_str(akamai_str) if akamai_str else None
+        self.client_kwargs = client_kwargs or {}
+
+    def create_client(self, **kwargs):
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+        if self.label == BASELINE:
+            return httpx.AsyncClient(verify=self.certfile, http2=self.http2, limits=limits, **kwargs)
+
+        return AsyncTLSClient(tls_config=self.tls_config, h2_config=self.h2_config, verify=self.certfile,
+                              http2=self.http2, limits=limits, **self.client_kwargs, **kwargs)
+
+
+async def _run_concurrently(concurrency, total, func):
+    """Call the coroutine function func total times with at most concurrency calls in flight, return durations"""
+
+    durations = []
+    semaphore = anyio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await func()
+            durations.append(time.perf_counter() - start)
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(total):
+            tg.start_soon(one)
+
+    return durations
+
+
+async def bench_handshakes(scenario, url, concurrency, total):
+    # Every call uses a new client, and hence a new connection with a full handshake (no session resumption)
+    async def handshake():
+        kwargs = {} if scenario.label == BASELINE else {'session_cache': None}
+        async with scenario.create_client(**kwargs) as client:
+            (await client.get(url)).raise_for_status()
+
+    start = time.perf_counter()
+    await _run_concurrently(concurrency, total, handshake)
+    return {'handshakes_per_sec': total / (time.perf_counter() - start)}
+
+
+async def bench_requests(scenario, url, concurrency, total):
+    async with scenario.create_client() as client:
+        # Warm up the connection so the handshake is not part of the latencies
+        (await client.get(url)).raise_for_status()
+
+        async def request():
+            (await client.get(url)).raise_for_status()
+
+        start = time.perf_counter()
+        latencies = await _run_concurrently(concurrency, total, request)
+        elapsed = time.perf_counter() - start
+
+    return {'requests_per_sec': total / elapsed,
+            'latency_p50_ms': statistics.median(latencies) * 1000,
+            'latency_p99_ms': percentile(latencies, 0.99) * 1000}
+
+
+async def bench_throughput(scenario, url, size, total):
+    async with scenario.create_client() as client:
+        (await client.get(url)).raise_for_status()
+
+        start = time.perf_counter()
+        received = 0
+        for _ in range(total):
+            response = await client.get(url)
+            response.raise_for_status()
+            received += len(response.content)
+        elapsed = time.perf_counter() - start
+
+    return {'mb_per_sec': received / elapsed / 2 ** 20}
+
+
+async def bench_scenario(scenario, base_url, args):
+    result = {'scenario': scenario.label, 'http2': scenario.http2}
+    result.update(await bench_handshakes(scenario, base_url + '/bytes/0', args.concurrency, args.handshakes))
+    result.update(await bench_requests(scenario, base_url + '/bytes/0', args.concurrency, args.requests))
+    result.update(await bench_throughput(scenario, f"{base_url}/bytes/{args.body_size}", args.body_size,
+                                         args.bulk_requests))
+    return result
+
+
+def run_benchmarks(args):
+    """
+    Run every scenario on every requested backend against a freshly started local server
+
+    :param argparse.Namespace args: Parsed command line arguments (see parse_args)
+    :return: dict with the environment details and a list of results
+    """
+
+    with tempfile.TemporaryDirectory() as directory:
+        certfile, keyfile = generate_certificate(directory)
+        server, port = start_server(certfile, keyfile)
+        base_url = f"https://localhost:{port}"
+
+        try:
+            factory = ProfileFactory()
+            client_kwargs = {'record_backend': args.record_backend}
+            scenarios = [Scenario(BASELINE, certfile, args.http2)]
+            results = []
+            profiles = database_profiles()
+            if args.profiles is not None:
+                profiles = profiles[:args.profiles]
+            for label, ja3, akamai_str in profiles:
+                try:
+                    scenarios.append(Scenario(label, certfile, args.http2, factory, ja3, akamai_str, client_kwargs))
+                except ValueError as e:
+                    results.append({'scenario': label, 'http2': args.http2, 'error': repr(e)})
+
+            for backend in args.backends:
+                for scenario in scenarios:
+                    try:
+                        result = anyio.run(bench_scenario, scenario, base_url, args, backend=backend)
+                    except Exception as e:
+                        result = {'scenario': scenario.label, 'http2': scenario.http2, 'error': repr(e)}
+                    result['backend'] = backend
+                    results.append(result)
+                    print(f"{backend} {scenario.label} done", file=sys.stderr)
+        finally:
+            server.terminate()
+
+    return {'python': platform.python_version(),
+            'httpx': httpx.__version__,
+            'settings': vars(args),
+            'results': results}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m httpx_tls.bench',
+                                     description="End-to-end load benchmark against a local TLS + HTTP/2 server")
+    parser.add_argument('--backends', default='asyncio,trio', type=lambda s: s.split(','),
+                        help="comma separated async backends to run on (default: asyncio,trio)")
+    parser.add_argument('--concurrency', type=int, default=10, help="requests in flight at a time (default: 10)")
+    parser.add_argument('--handshakes', type=int, default=20, help="new connections to open (default: 20)")
+    parser.add_argument('--requests', type=int, default=200, help="small requests to send (default: 200)")
+    parser.add_argument('--body-size', type=int, default=2 ** 20,
+                        help="response size in bytes for the throughput test (default: 1 MB)")
+    parser.add_argument('--bulk-requests', type=int, default=3,
+                        help="requests to send for the throughput test (default: 3)")
+    parser.add_argument('--profiles', type=int, default=None,
+                        help="only use the first N database profiles (default: all)")
+    parser.add_argument('--record-backend', default='python', help="record backend for AsyncTLSClient")
+    parser.add_argument('--no-http2', dest='http2', action='store_false', help="use HTTP/1.1 instead of HTTP/2")
+    parser.add_argument('--output', default=None, help="write the JSON report to this file instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = run_benchmarks(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import collections
+import copy
+import threading
+
+__all__ = ["LRUCache",
+           "SessionCache"]
+
+
+class LRUCache:
+    """
+    A bounded mapping that evicts the least recently used entry once it grows past maxsize. Lookups through get()
+    are counted so that callers can find out how effective the cache is.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize is not None and maxsize < 0:
+            raise ValueError("maxsize cannot be less than 0")
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize == 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+                    self.evictions += 1
+
+    def items(self):
+        """
+        :return: list of (key, value) pairs, from the least to the most recently used
+        """
+
+        with self._lock:
+            return list(self._data.items())
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Return a snapshot of the cache counters
+
+        :return: dict
+        """
+
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'size': len(self._data),
+                'maxsize': self.maxsize}
+
+
+class SessionCache(LRUCache):
+    """
+    Stores tlslite sessions after a completed handshake so that later connections to the same server using the same
+    TLS profile can offer them for resumption. The stored session object is the one tlslite keeps on the connection,
+    which means TLS 1.3 tickets the server sends after the handshake are picked up without storing it again.
+    """
+
+    def __init__(self, maxsize=128):
+        super().__init__(maxsize)
+        self.resumed = 0
+
+    def get_session(self, server_hostname, profile):
+        """
+        Fetch a resumable session for the server and profile, if one is stored
+
+        :param str server_hostname: Hostname sent in the SNI extension
+        :param profile: TLSProfile used for the connection, or None
+        :return: tlslite.Session or None
+        """
+
+        if not server_hostname:
+            return None
+
+        key = (server_hostname, profile)
+        with self._lock:
+            session = self._data.get(key)
+
+            # The session might have stopped being resumable since we stored it (for example, the connection it
+            # belonged to was closed abruptly or all its tickets expired). We count these as misses since no
+            # resumption is offered.
+            if session is not None and not session.valid():
+                del self._data[key]
+                session = None
+
+            if session is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return session
+
+    def take_session(self, server_hostname, profile):
+        """
+        Fetch a resumable session for the server and profile like get_session, but holding only the first of its TLS
+        1.3 tickets, which is taken out of the stored session. Servers accept early data only once per ticket, since an
+        attacker could replay it otherwise, so connections sending early data each need a ticket of their own.
+
+        :param str server_hostname: Hostname sent in the SNI extension
+        :param profile: TLSProfile used for the connection, or None
+        :return: tlslite.Session or None
+        """
+
+        session = self.get_session(server_hostname, profile)
+        if session is None:
+            return None
+
+        with self._lock:
+            # Another connection may have taken the last ticket in the meantime
+            if not session.tickets:
+                return session
+            ticket = session.tickets.pop(0)
+
+        session = copy.copy(session)
+        session.tickets = [ticket]
+        return session
+
+    def record_resumption(self):
+        with self._lock:
+            self.resumed += 1
+
+    def stats(self):
+        stats = super().stats()
+        stats['resumed'] = self.resumed
+        return stats
+
+    def set_session(self, server_hostname, profile, session):
+        if not server_hostname or session is None or not session.resumable:
+            return
+
+        self.set((server_hostname, profile), session)
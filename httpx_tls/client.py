@@ -1,24 +1,101 @@
-from httpx import AsyncClient, create_ssl_context
-from httpx_tls.mocks import SSLContextProxy
+from httpx import AsyncClient, Client
+from httpx._config import DEFAULT_LIMITS
+from httpx_tls.aead import RecordBackends
+from httpx_tls.flowcontrol import AdaptiveFlowControl
+from httpx_tls.patch import patch_for_clients
+from httpx_tls.transport import AsyncTLSTransport, create_ssl_context_proxy
 
-__all__ = ["AsyncTLSClient"]
+__all__ = ["AsyncTLSClient",
+           "TLSClient"]
 
 
-class AsyncTLSClient(AsyncClient):
+class TLSClientMixin:
+    """Functionality shared between the async and sync clients, to be used alongside httpx.AsyncClient/httpx.Client"""
+    _coalesce = False
 
-    def __init__(self, tls_config=None, h2_config=None, verify=True, cert=None, trust_env=True, **kwargs):
+    def __init__(self, tls_config=None, h2_config=None, verify=True, cert=None, trust_env=True, session_cache=128,
+                 record_backend=RecordBackends.PYTHON, key_share_pool=None, metrics=False, flow_control=None,
+                 **kwargs):
 
-        context = create_ssl_context(verify=verify, cert=cert, trust_env=trust_env)
-        verify = SSLContextProxy(context, tls_config)
+        # Patches are only applied once a client is created, so that importing httpx_tls alone changes nothing
+        patch_for_clients()
+
+        verify = create_ssl_context_proxy(tls_config, verify=verify, cert=cert, trust_env=trust_env,
+                                          session_cache=session_cache, record_backend=record_backend,
+                                          key_share_pool=key_share_pool, metrics=metrics, coalesce=self._coalesce)
         self.h2_config = h2_config
+        # Opt-in tuning of the HTTP2 flow control windows, see httpx_tls.flowcontrol
+        self.flow_control = AdaptiveFlowControl() if flow_control is True else flow_control
+        self.session_cache = verify.get_session_cache()
+        self.metrics = verify.get_metrics()
 
         super().__init__(verify=verify, cert=cert, trust_env=trust_env, **kwargs)
 
     def build_request(self, *args, **kwargs):
         request = super().build_request(*args, **kwargs)
-        request.extensions['h2_profile'] = self.h2_config
+        if request.extensions.get('h2_profile', None) is None:
+            request.extensions['h2_profile'] = self.h2_config
+        if self.flow_control is not None and request.extensions.get('h2_flow_control', None) is None:
+            request.extensions['h2_flow_control'] = self.flow_control
+        if self.metrics is not None:
+            request.extensions['tls_metrics'] = self.metrics
         return request
 
 
+class AsyncTLSClient(TLSClientMixin, AsyncClient):
+    """
+    Async client using tlslite with the given TLS and HTTP2 profiles. Each request can also ask for its own profiles
+    through the 'tls_profile' and 'h2_profile' extensions, which are then used instead of the client's:
+
+        await client.get(url, extensions={'tls_profile': tls_config, 'h2_profile': h2_config})
+
+    Connections are only reused by requests with the same profiles, while the client's limits apply to the
+    connections of all profiles together.
+
+    With early_data=True, the first request of a connection resuming a TLS 1.3 session is sent along with the
+    ClientHello (0-RTT) if the server's ticket allows it and the request is a GET, HEAD or OPTIONS. With
+    coalesce=True, requests for an origin without a connection of its own may use an HTTP2 connection to another
+    origin whose certificate covers it at the same address. See AsyncTLSTransport for both.
+    """
+
+    def __init__(self, *args, early_data=False, coalesce=False, **kwargs):
+        self._early_data = early_data
+        self._coalesce = coalesce
+        super().__init__(*args, **kwargs)
+
+    def _init_transport(self, verify=True, cert=None, http1=True, http2=False, limits=DEFAULT_LIMITS, transport=None,
+                        app=None, trust_env=True):
+        if transport is not None or app is not None:
+            return super()._init_transport(verify=verify, cert=cert, http1=http1, http2=http2, limits=limits,
+                                           transport=transport, app=app, trust_env=trust_env)
+
+        # verify is the SSLContextProxy created in TLSClientMixin.__init__, which the transport uses as is. Proxied
+        # requests still go through httpx's own transports and the patches.
+        return AsyncTLSTransport(verify=verify, cert=cert, http1=http1, http2=http2, limits=limits,
+                                 trust_env=trust_env, early_data=self._early_data)
+
+    async def prewarm(self, origins, connections_per_origin=1, tls_profile=None, h2_profile=None):
+        """
+        Open connections to the given origins ahead of time and keep them in the pool for the requests that follow,
+        which then skip the handshake. See AsyncTLSTransport.prewarm for details. Origins reached through a proxy
+        are not prewarmed.
+
+        :param origins: Iterable of origins (str or httpx.URL) to connect to, such as "https://example.com"
+        :param int connections_per_origin: Number of connections to open to each origin
+        :param TLSProfile tls_profile: TLS profile for the connections, the client's if None
+        :param Http2Profile h2_profile: HTTP2 profile for the connections, the client's if None
+        :return: dict mapping each origin to the number of connections opened and failed, their durations and errors
+        """
+
+        if not isinstance(self._transport, AsyncTLSTransport):
+            raise ValueError("prewarming is only supported when the client uses its own transport")
+
+        return await self._transport.prewarm(origins, connections_per_origin, tls_profile=tls_profile,
+                                             h2_profile=h2_profile or self.h2_config, timeout=self.timeout.as_dict())
 
 
+class TLSClient(TLSClientMixin, Client):
+    """
+    Sync counterpart of AsyncTLSClient. tlslite runs directly over the blocking sockets httpcore opens, so no event
+    loop or thread pool is involved.
+    """
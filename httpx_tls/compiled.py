@@ -0,0 +1,167 @@
+import hashlib
+import json
+import marshal
+import mmap
+import struct
+import sys
+import tlslite
+from httpx_tls.profiles import TLSProfile, Http2Profile
+
+__all__ = ["CompiledProfiles",
+           "dump_profiles"]
+
+# Compiled profile files hold profiles exactly as they were after being built and validated, so that loading them is
+# only a matter of unpacking the stored attributes. The layout is:
+#
+#   header   MAGIC, FORMAT_VERSION, sha256 checksum, index length, payload length
+#   index    JSON: the fingerprint string of every profile along with the offset and length of its record
+#   payload  the marshal'd record of every profile
+#
+# The checksum covers the index and payload along with the environment the file was written in (python, tlslite and
+# the format version), since marshal's format and tlslite's settings are only valid there. When it does not match,
+# the stored records are not trusted and profiles are built (and validated) from their fingerprint strings instead.
+# FORMAT_VERSION must be bumped whenever the compiled state of the profiles changes.
+
+MAGIC = b"HXTLSPRF"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<8sH32sQQ")
+
+
+def _environment():
+    return f"{FORMAT_VERSION}:{sys.version_info[0]}.{sys.version_info[1]}:{marshal.version}:" \
+           f"{tlslite.__version__}".encode()
+
+
+def _checksum(index, payload):
+    digest = hashlib.sha256(_environment())
+    digest.update(index)
+    digest.update(payload)
+    return digest.digest()
+
+
+def _dump_record(key, state):
+    try:
+        return marshal.dumps(state)
+    except ValueError:
+        raise ValueError(f"profile for '{key}' holds objects which cannot be compiled")
+
+
+def dump_profiles(path, tls_profiles=None, h2_profiles=None):
+    """
+    Write compiled profiles to a file, to be loaded with CompiledProfiles.
+
+    :param str path: Path of the file to write
+    :param dict tls_profiles: Mapping of ja3 strings to the TLSProfile created from them
+    :param dict h2_profiles: Mapping of akamai strings to the Http2Profile created from them
+    :return: None
+    """
+
+    records = []
+    offset = 0
+    index = {'tls': [], 'h2': []}
+
+    for key, profile in (tls_profiles or {}).items():
+        record = _dump_record(key, profile.get_compiled_state())
+        index['tls'].append((key, profile.get_record_size(), offset, len(record)))
+        records.append(record)
+        offset += len(record)
+
+    for key, profile in (h2_profiles or {}).items():
+        record = _dump_record(key, profile.get_compiled_state())
+        index['h2'].append((key, offset, len(record)))
+        records.append(record)
+        offset += len(record)
+
+    index = json.dumps(index, separators=(',', ':')).encode()
+    payload = b"".join(records)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, _checksum(index, payload), len(index), len(payload)))
+        f.write(index)
+        f.write(payload)
+
+
+class CompiledProfiles:
+    """
+    Profiles loaded from a file written by dump_profiles. The file is memory-mapped and each profile is only unpacked
+    the first time it is asked for.
+
+    If the file was written by another version of python, tlslite or httpx-tls (or was modified since), profiles are
+    built from their fingerprint strings instead, which is as slow as not using a compiled file at all. The trusted
+    attribute tells which of the two is the case.
+    """
+
+    def __init__(self, path):
+        """
+        :param str path: Path of a file written by dump_profiles
+        :raise ValueError: If the file is not a compiled profile file or is of an unknown format version
+        """
+
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < HEADER.size:
+            raise ValueError("not a compiled profile file")
+        magic, version, checksum, index_length, payload_length = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError("not a compiled profile file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported compiled profile file version ({version})")
+
+        index = self._mmap[HEADER.size:HEADER.size + index_length]
+        self._payload_start = HEADER.size + index_length
+        payload = memoryview(self._mmap)[self._payload_start:self._payload_start + payload_length]
+        try:
+            self.trusted = _checksum(index, payload) == checksum
+        finally:
+            payload.release()
+
+        index = json.loads(index)
+        self._tls_index = {key: (record_size, offset, length) for key, record_size, offset, length in index['tls']}
+        self._h2_index = {key: (offset, length) for key, offset, length in index['h2']}
+
+    def __len__(self):
+        return len(self._tls_index) + len(self._h2_index)
+
+    def tls_keys(self):
+        return list(self._tls_index)
+
+    def h2_keys(self):
+        return list(self._h2_index)
+
+    def _load_record(self, offset, length):
+        start = self._payload_start + offset
+        return marshal.loads(self._mmap[start:start + length])
+
+    def get_tls(self, key):
+        """
+        :param str key: ja3 string the profile was stored under
+        :return: TLSProfile, or None if there is no such profile in the file
+        """
+
+        try:
+            record_size, offset, length = self._tls_index[key]
+        except KeyError:
+            return None
+
+        if not self.trusted:
+            return TLSProfile.create_from_ja3(key, record_size=record_size)
+
+        return TLSProfile.from_compiled_state(self._load_record(offset, length))
+
+    def get_h2(self, key):
+        """
+        :param str key: akamai string the profile was stored under
+        :return: Http2Profile, or None if there is no such profile in the file
+        """
+
+        try:
+            offset, length = self._h2_index[key]
+        except KeyError:
+            return None
+
+        if not self.trusted:
+            return Http2Profile.create_from_akamai_str(key)
+        return Http2Profile.from_compiled_state(self._load_record(offset, length))
+
+    def close(self):
+        self._mmap.close()
@@ -120,11 +120,15 @@ class TLSExtConstants:
     }
 
     NOT_SUPPORTED = (2, 3, 4, 6, 7, 8, 12, 14, 17, 19, 20, 24, 25, 26, 29,
-                     30, 31, 32, 33, 36, 37, 38, 39, 41, 42, 44,
+                     30, 31, 32, 33, 36, 37, 38, 39, 41, 44,
                      47, 48, 50, 52, 53, 54, 55, 56, 57, 58, 59, 60)
 
     AUTOMATIC = (0, 9, 10, 11, 13, 28, 43, 45, 49, 51,)
 
+    # Only sent in the ClientHello of resumed TLS 1.3 connections which send early data (httpx_tls.earlydata), and only
+    # by profiles which list it
+    EARLY_DATA = 42
+
     CONFIGURABLE = {5: DefaultValue('use_status_request_ext', on=True, off=False),
                     15: DefaultValue('use_heartbeat_extension', on=True, off=False),
                     16: DefaultValue('alpn', on=[b'http/1.1', b'h2'], off=None, kwarg=True),
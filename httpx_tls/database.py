@@ -1,5 +1,5 @@
 import re
-import user_agents
+import bisect
 from .constants import Flags
 
 __all__ = ["Chrome",
@@ -53,6 +53,93 @@ class SafariMobile(Http2Data):
     }
 
 
+class VersionIndex:
+    """
+    Sorted interval array compiled from a version dictionary (like Browser.ja3_versions) whose keys are either a
+    single version ('13') or an inclusive range ('106-114'). Lookups are done with bisect instead of re-parsing and
+    scanning every key of the dictionary.
+    """
+
+    _compiled = {}
+
+    def __init__(self, d: dict):
+        ranges = []
+        for order, (version_bounds, value) in enumerate(d.items()):
+            if '-' not in version_bounds:
+                lower_bound = upper_bound = int(version_bounds)
+            else:
+                lower_bound, upper_bound = map(int, version_bounds.split('-'))
+
+            # order is the position of the key in the dictionary, which is used to break ties when looking for the
+            # closest version
+            ranges.append((lower_bound, upper_bound, order, value))
+
+        # Ranges may overlap, in which case the first one in the dictionary wins, like it did when the dictionary was
+        # scanned. So the ranges are split at every bound into ones which do not overlap, each taking the value of the
+        # first range which contains it.
+        bounds = sorted({range_[0] for range_ in ranges} | {range_[1] + 1 for range_ in ranges})
+        entries = []
+        for lower_bound, next_bound in zip(bounds, bounds[1:]):
+            containing = [range_ for range_ in ranges if range_[0] <= lower_bound <= range_[1]]
+            if containing:
+                order, value = min(containing, key=lambda range_: range_[2])[2:]
+                entries.append((lower_bound, next_bound - 1, order, value))
+
+        self._lower_bounds = [entry[0] for entry in entries]
+        self._entries = entries
+
+    @classmethod
+    def for_dict(cls, d: dict):
+        # The dictionaries are class attributes that live for as long as the process, but we still keep a reference
+        # to each one alongside its index so that its id can never be reused by another object. They can still be
+        # changed at runtime, so the index is compiled again whenever the items no longer match the ones it was
+        # compiled from.
+        items = tuple(d.items())
+        try:
+            compiled_items, index = cls._compiled[id(d)][1:]
+            if compiled_items == items:
+                return index
+        except KeyError:
+            pass
+
+        index = cls(d)
+        cls._compiled[id(d)] = (d, items, index)
+        return index
+
+    def find(self, version: int, reasonable: int = None):
+        """
+        Find the value whose range contains the version. If there is none, and reasonable is not None, return the
+        value of the closest range if it is at most reasonable versions away.
+
+        :return: Matching value, or None
+        """
+
+        i = bisect.bisect_right(self._lower_bounds, version)
+        candidates = []
+
+        # The range before the insertion point is the only one which can contain the version, and is also the
+        # closest one below it
+        if i > 0:
+            lower_bound, upper_bound, order, value = self._entries[i - 1]
+            if version <= upper_bound:
+                return value
+            candidates.append((version - upper_bound, order, value))
+
+        # The range after the insertion point is the closest one above the version
+        if i < len(self._entries):
+            lower_bound, upper_bound, order, value = self._entries[i]
+            candidates.append((lower_bound - version, order, value))
+
+        if not candidates or reasonable is None:
+            return None
+
+        min_dif, order, closest = min(candidates, key=lambda candidate: candidate[:2])
+        if min_dif <= reasonable:
+            return closest
+
+        return None
+
+
 class Browser:
     ja3_versions = {}
     h2_mapping = {
@@ -65,6 +152,10 @@ class Browser:
     chromium_pattern = re.compile(r' Chrome/(.+?)(?: |$)')
     reasonable = 10
 
+    # Largest plaintext the browser puts in the application data records it sends. Chromium (BoringSSL), Firefox (NSS)
+    # and Safari all fill their records up to the maximum TLS allows.
+    record_size = 2 ** 14
+
     @classmethod
     def get_ja3_from_version(cls, version: int, ios_version: int = None, flag=Flags.REASONABLE):
         cls.assert_flags_ok(flag)
@@ -116,30 +207,8 @@ class Browser:
 
     @classmethod
     def _find_version_from_given_dict(cls, version: int, d: dict, flag=Flags.REASONABLE):
-
-        closest = None
-        min_dif = float('inf')
-
-        for version_bounds, value in d.items():
-            if '-' not in version_bounds:
-                lower_bound = upper_bound = int(version_bounds)
-            else:
-                lower_bound, upper_bound = map(int, version_bounds.split('-'))
-
-            if lower_bound <= version <= upper_bound:
-                return value
-            else:
-                if abs(lower_bound - version) < min_dif:
-                    min_dif = abs(lower_bound - version)
-                    closest = value
-                if abs(upper_bound - version) < min_dif:
-                    min_dif = abs(upper_bound - version)
-                    closest = value
-
-        if min_dif <= cls.reasonable and flag == Flags.REASONABLE:
-            return closest
-
-        return None
+        reasonable = cls.reasonable if flag == Flags.REASONABLE else None
+        return VersionIndex.for_dict(d).find(version, reasonable=reasonable)
 
     @classmethod
     def get_chromium_version(cls, user_agent: str):
@@ -243,6 +312,10 @@ class Safari(Browser):
 
 def get_device_and_browser_from_ua(user_agent_str: str):
 
+    # user_agents loads its whole regex database on import, which takes longer than importing the rest of httpx-tls.
+    # Most users never parse a user-agent, so we only import it once someone does.
+    import user_agents
+
     device, browser, version, ios_version = None, None, None, None
     parsed_ua = user_agents.parse(user_agent_str)
     ua_os = parsed_ua.os
@@ -0,0 +1,235 @@
+import copy
+from tlslite.constants import CipherSuite, ContentType, ExtensionType, HandshakeType
+from tlslite.extensions import TLSExtension
+from tlslite.handshakehelpers import HandshakeHelpers
+from tlslite.messages import ApplicationData, ChangeCipherSpec, ClientHello, EncryptedExtensions, Message
+from tlslite.recordlayer import RecordLayer
+from tlslite.utils.cryptomath import derive_secret, secureHMAC
+from httpx_tls.hello import TemplateTLSConnection, TemplateKeySharePoolTLSConnection, add_pre_shared_key
+
+__all__ = ["SAFE_METHODS",
+           "EarlyData",
+           "EarlyDataTLSConnection",
+           "EarlyDataKeySharePoolTLSConnection",
+           "max_early_data_size"]
+
+TLS13 = (3, 4)
+
+# Requests which may be sent as early data, which an attacker can replay to the server: those with a safe method
+# (RFC 9110 section 9.2.1), which change nothing on the server. Idempotent methods such as PUT and DELETE do change it,
+# and a replay can undo a change made in between (RFC 8470 section 4.1). TRACE, which echoes the request back, is left
+# out as well.
+SAFE_METHODS = frozenset([b"GET", b"HEAD", b"OPTIONS"])
+
+# EndOfEarlyData has no message class in tlslite. It has an empty body.
+END_OF_EARLY_DATA = bytes([HandshakeType.end_of_early_data, 0, 0, 0])
+
+
+def max_early_data_size(ticket):
+    """
+    :param tlslite.messages.NewSessionTicket ticket: TLS 1.3 session ticket sent by the server
+    :return: Largest amount of early data the server accepts on connections resuming the ticket, 0 if it accepts none
+    """
+
+    for ext in ticket.extensions or ():
+        if ext.extType == ExtensionType.early_data and ext.extData is not None and len(ext.extData) == 4:
+            return int.from_bytes(ext.extData, 'big')
+    return 0
+
+
+class EarlyData:
+    """Early data offered in the ClientHello of a connection, and what became of it"""
+
+    __slots__ = ("max_size", "size", "alpn", "record_layer", "accepted", "ended", "sent", "held")
+
+    def __init__(self, max_size, alpn, record_layer):
+        self.max_size = max_size
+        self.size = 0
+        self.alpn = alpn  # ALPN protocol of the resumed session, which the early data is for
+        self.record_layer = record_layer  # Protects the early data with the client's early traffic secret
+        self.accepted = None  # Set once the server's EncryptedExtensions arrive
+        self.ended = False
+        self.sent = []  # Data sent as early data, to send again if the server rejects it
+        self.held = []  # Data written after the early data ran out, to send once the handshake completes
+
+    def fits(self, size):
+        return not self.held and self.size + size <= self.max_size
+
+
+class EarlyDataMixin:
+    """
+    Sends application data in the first flight of a resumed TLS 1.3 handshake (0-RTT), when the session's ticket allows
+    it. The early_data extension is added to the ClientHello that the connection would otherwise send, which is only
+    done if the ALPN protocol and cipher suite of the session are offered again, as the server only accepts early data
+    for those, and if the profile (when there is one) lists the extension. The data itself is sent through send_early_data() while the handshake waits for the server, and whether
+    the server accepted it is known once its EncryptedExtensions arrive (early_data.accepted). Data the server rejected
+    is up to the caller to send again.
+    """
+
+    def __init__(self, *args, profile_extensions=None, **kwargs):
+        """
+        :param list profile_extensions: Extensions of the TLS profile the connection uses, in order, or None without
+            a profile
+        """
+
+        super().__init__(*args, **kwargs)
+        self.profile_extensions = profile_extensions
+        self.early_data = None
+
+        # Settings, session and ALPN protocols of the handshake, until its first ClientHello is sent
+        self._early_data_params = None
+
+    def _clientSendClientHello(self, settings, session, srpUsername, srpParams, certParams, anonParams, serverName,
+                               nextProtos, reqTack, alpn):
+        self._early_data_params = (settings, session, alpn)
+        for result in super()._clientSendClientHello(settings, session, srpUsername, srpParams, certParams,
+                                                     anonParams, serverName, nextProtos, reqTack, alpn):
+            yield result
+
+    def _sendMsg(self, msg, randomizeFirstBlock=True, update_hashes=True):
+        if isinstance(msg, ClientHello) and (self._early_data_params is not None or self.early_data is not None):
+            return self._send_client_hello(msg)
+        return super()._sendMsg(msg, randomizeFirstBlock, update_hashes)
+
+    def _send_client_hello(self, client_hello):
+        if self.early_data is not None:
+            # The ClientHello sent again after a HelloRetryRequest, which tlslite updated from its own ClientHello
+            # without the early_data extension. The server skips the early data sent so far, which is sent again once
+            # the handshake completes.
+            self.early_data.accepted = False
+            for result in super()._sendMsg(client_hello):
+                yield result
+            return
+
+        settings, session, alpn = self._early_data_params
+        self._early_data_params = None
+        max_size = self._get_max_early_data_size(settings, session, alpn, client_hello)
+        if not max_size:
+            for result in super()._sendMsg(client_hello):
+                yield result
+            return
+
+        # The ClientHello tlslite keeps is left as it is, since it is also what the profile's template is created from
+        client_hello = self._add_early_data_extension(client_hello, settings, session)
+        for result in super()._sendMsg(client_hello):
+            yield result
+
+        # The early data is protected with keys derived from the PSK of the first ticket, which is the one offered
+        # first, and the ClientHello
+        prf_name = 'sha384' if session.cipherSuite in CipherSuite.sha384PrfSuites else 'sha256'
+        prf_size = 48 if prf_name == 'sha384' else 32
+        identity = client_hello.getExtension(ExtensionType.pre_shared_key).identities[0]
+        psk = HandshakeHelpers.calc_res_binder_psk(identity, session.resumptionMasterSecret, session.tickets)
+        early_secret = secureHMAC(bytearray(prf_size), psk, prf_name)
+        traffic_secret = derive_secret(early_secret, bytearray(b'c e traffic'), self._handshake_hash, prf_name)
+
+        record_layer = RecordLayer(self.sock)
+        record_layer.client = True
+        record_layer.version = TLS13
+        record_layer.tls13record = True
+
+        # In middlebox compatibility mode, the ChangeCipherSpec comes before the first encrypted record. It is sent
+        # through the early data's record layer, whose records already carry the TLS 1.2 version TLS 1.3 requires
+        # after the ClientHello, unlike tlslite's until the ServerHello arrives.
+        if client_hello.session_id and not self._ccs_sent:
+            for result in record_layer.sendRecord(ChangeCipherSpec().create()):
+                yield result
+            self._ccs_sent = True
+
+        record_layer.calcTLS1_3PendingState(session.cipherSuite, traffic_secret, traffic_secret,
+                                            settings.cipherImplementations)
+        record_layer.changeWriteState()
+        self.early_data = EarlyData(max_size, session.appProto, record_layer)
+
+    def _get_max_early_data_size(self, settings, session, alpn, client_hello):
+        if settings.maxVersion < TLS13 or not session or not session.tickets or settings.pskConfigs:
+            return 0
+        if client_hello.getExtension(ExtensionType.pre_shared_key) is None:
+            return 0
+
+        # The server only accepts early data for the cipher suite and ALPN protocol of the session it resumes
+        if session.cipherSuite not in client_hello.cipher_suites:
+            return 0
+        if session.appProto not in (alpn or [None]):
+            return 0
+
+        # A profile's ClientHello only carries the early_data extension if the profile lists it
+        if self.profile_extensions is not None and ExtensionType.early_data not in self.profile_extensions:
+            return 0
+        return max_early_data_size(session.tickets[0])
+
+    def _add_early_data_extension(self, client_hello, settings, session):
+        client_hello = copy.copy(client_hello)
+
+        # The PSK extension must stay last, and the padding depends on the length of the extensions before it, so both
+        # are added again once the early_data extension is in place
+        psk_ext = client_hello.getExtension(ExtensionType.pre_shared_key)
+        extensions = [ext for ext in client_hello.extensions
+                      if ext.extType not in (ExtensionType.pre_shared_key, ExtensionType.client_hello_padding)]
+
+        # Where the profile puts it, and after the other extensions without a profile
+        order = self.profile_extensions
+        index = len(extensions)
+        if order is not None:
+            after = order[order.index(ExtensionType.early_data) + 1:]
+            index = next((i for i, ext in enumerate(extensions) if ext.extType in after), index)
+        extensions.insert(index, TLSExtension(extType=ExtensionType.early_data).create(bytearray(0)))
+        client_hello.extensions = extensions
+
+        if settings.usePaddingExtension:
+            HandshakeHelpers.alignClientHelloPadding(client_hello)
+        add_pre_shared_key(client_hello, psk_ext.identities, list(psk_ext.binders), self._handshake_hash, settings,
+                           session)
+        return client_hello
+
+    def send_early_data(self, data):
+        """
+        Send data as early data, while the handshake waits for the server's reply to the ClientHello. The caller
+        should check that it fits within the early data the server accepts (early_data.fits()) beforehand.
+
+        :param bytes data: Application data to send
+        """
+
+        early_data = self.early_data
+        early_data.size += len(data)
+        early_data.sent.append(bytes(data))
+
+        for start in range(0, len(data), self.recordSize):
+            msg = ApplicationData().create(bytearray(data[start:start + self.recordSize]))
+            for result in early_data.record_layer.sendRecord(msg):
+                yield result
+
+    def _getMsg(self, expectedType, secondaryType=None, constructorType=None):
+        if secondaryType != HandshakeType.encrypted_extensions or self.early_data is None:
+            return super()._getMsg(expectedType, secondaryType, constructorType)
+        return self._get_encrypted_extensions(expectedType, secondaryType, constructorType)
+
+    def _get_encrypted_extensions(self, expectedType, secondaryType, constructorType):
+        for result in super()._getMsg(expectedType, secondaryType, constructorType):
+            if isinstance(result, EncryptedExtensions):
+                early_data = self.early_data
+                early_data.accepted = early_data.accepted is None and \
+                    result.getExtension(ExtensionType.early_data) is not None
+            yield result
+
+    def _changeWriteState(self):
+        # The first switch of the write state is to the handshake keys, once the server's Finished was verified.
+        # Accepted early data is ended with EndOfEarlyData before that, the last message sent with the early keys,
+        # which the client's Finished covers. Records are written to memory, so sending them never has to wait.
+        early_data = self.early_data
+        if early_data is not None and early_data.accepted and not early_data.ended:
+            early_data.ended = True
+            self._handshake_hash.update(END_OF_EARLY_DATA)
+            # The record layer appends the content type to the data of the message it is given
+            for _ in early_data.record_layer.sendRecord(Message(ContentType.handshake, bytearray(END_OF_EARLY_DATA))):
+                pass
+
+        super()._changeWriteState()
+
+
+class EarlyDataTLSConnection(EarlyDataMixin, TemplateTLSConnection):
+    """TemplateTLSConnection which sends early data on resumed connections"""
+
+
+class EarlyDataKeySharePoolTLSConnection(EarlyDataMixin, TemplateKeySharePoolTLSConnection):
+    """TemplateKeySharePoolTLSConnection which sends early data on resumed connections"""
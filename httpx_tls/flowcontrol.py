@@ -0,0 +1,141 @@
+import time
+import h2.events
+
+__all__ = ["AdaptiveFlowControl",
+           "FlowControlTuner"]
+
+LARGEST_FLOW_CONTROL_WINDOW = 2 ** 31 - 1
+
+
+class AdaptiveFlowControl:
+    """
+    Opt-in tuning of the HTTP2 flow control windows we give the server, based on how fast each window is used up
+    compared to the round trip time. The SETTINGS and WINDOW_UPDATE frames of the HTTP2 profile are still sent as they
+    are when a connection and each of its streams are opened, so the fingerprint does not change. Only the
+    WINDOW_UPDATE frames sent while responses are received differ.
+
+    h2 hands a window back to the server every time half of it has been used. If that took less than GROW_RTTS round
+    trips, the server was waiting on us rather than on the network, so the window is doubled (up to the upper bound).
+    If it took more than SHRINK_RTTS round trips, the window is far larger than the connection needs, and is halved
+    (down to the lower bound) so that the server cannot make us buffer more than that. Windows the profile made larger
+    than the upper bound are brought down to it. Windows cannot be taken back once given, so a smaller window only
+    takes effect as the server uses up the current one.
+
+    The round trip time is the shortest time between sending the headers of a request and receiving those of its
+    response on the connection. It is an upper bound which includes the time the server took to respond, but unlike
+    PING frames (which browsers do not send for this) it costs nothing on the wire.
+    """
+
+    GROW_RTTS = 2
+    SHRINK_RTTS = 8
+
+    def __init__(self, min_window=2 ** 16, max_window=2 ** 25, max_stream_window=None):
+        """
+        :param int min_window: Smallest size windows are shrunk to
+        :param int max_window: Largest size the connection window is grown to, which bounds how much response data
+            the server may send on a connection before we read it
+        :param int max_stream_window: Largest size the window of each stream is grown to, max_window if None
+        """
+
+        if max_stream_window is None:
+            max_stream_window = max_window
+        if not 1 <= min_window <= max_window <= LARGEST_FLOW_CONTROL_WINDOW:
+            raise ValueError(f"window sizes must be between 1 and {LARGEST_FLOW_CONTROL_WINDOW}, with min_window no "
+                             f"larger than max_window")
+        if not min_window <= max_stream_window <= max_window:
+            raise ValueError("max_stream_window must be between min_window and max_window")
+
+        self.min_window = min_window
+        self.max_window = max_window
+        self.max_stream_window = max_stream_window
+
+    def create_tuner(self, h2_state):
+        """
+        :param h2.connection.H2Connection h2_state: State machine of the connection whose windows should be tuned
+        :return: FlowControlTuner
+        """
+        return FlowControlTuner(self, h2_state)
+
+
+class _Window:
+    __slots__ = ("received", "since")
+
+    def __init__(self, since):
+        self.received = 0  # Bytes received since the window was last handed back to the server
+        self.since = since
+
+
+class FlowControlTuner:
+    """Tunes the windows of a single HTTP2 connection as described in AdaptiveFlowControl"""
+
+    __slots__ = ("config", "h2_state", "rtt", "_sent", "_windows")
+
+    def __init__(self, config, h2_state):
+        self.config = config
+        self.h2_state = h2_state
+        self.rtt = None
+        self._sent = {}  # Time the request headers of each stream were sent, until its response headers arrive
+        self._windows = {}  # By stream id, 0 for the connection window
+
+    def request_sent(self, stream_id):
+        self._sent[stream_id] = time.monotonic()
+
+    def event_received(self, event):
+        """
+        Update the round trip time or the windows with an event httpcore is about to process. Window updates are
+        left in the h2 state, which httpcore writes out after acknowledging the data it received.
+
+        :param h2.events.Event event: Event received on one of the connection's streams
+        :return: None
+        """
+
+        if isinstance(event, h2.events.ResponseReceived):
+            sent = self._sent.pop(event.stream_id, None)
+            if sent is not None:
+                rtt = time.monotonic() - sent
+                self.rtt = rtt if self.rtt is None else min(self.rtt, rtt)
+
+        elif isinstance(event, h2.events.DataReceived) and event.flow_controlled_length and self.rtt is not None:
+            now = time.monotonic()
+            self._tune(None, self.h2_state._inbound_flow_control_window_manager, self.config.max_window,
+                       event.flow_controlled_length, now)
+
+            # The stream window is of no more use once the stream is closed, which h2 may already have done if the
+            # frame ending it came in along with this data
+            stream = self.h2_state.streams.get(event.stream_id)
+            if stream is not None and not stream.closed:
+                self._tune(event.stream_id, stream._inbound_window_manager, self.config.max_stream_window,
+                           event.flow_controlled_length, now)
+
+    def stream_closed(self, stream_id):
+        self._sent.pop(stream_id, None)
+        self._windows.pop(stream_id, None)
+
+    def _tune(self, stream_id, manager, max_window, size, now):
+        window = self._windows.get(stream_id or 0)
+        if window is None:
+            window = self._windows[stream_id or 0] = _Window(now)
+
+        window.received += size
+        if window.received < manager.max_window_size // 2:
+            return
+
+        elapsed = now - window.since
+        window.received = 0
+        window.since = now
+
+        if manager.max_window_size > max_window:
+            # The profile's windows may be larger than the upper bound to begin with
+            target = max_window
+        elif elapsed < self.config.GROW_RTTS * self.rtt and manager.max_window_size < max_window:
+            target = min(manager.max_window_size * 2, max_window)
+            # h2 raises the window's maximum to the new size along with the window itself
+            self.h2_state.increment_flow_control_window(target - manager.current_window_size, stream_id=stream_id)
+            return
+        elif elapsed > self.config.SHRINK_RTTS * self.rtt and manager.max_window_size > self.config.min_window:
+            target = max(manager.max_window_size // 2, self.config.min_window)
+        else:
+            return
+
+        # h2 would hand back a negative amount if the maximum were lower than the window the server still has
+        manager.max_window_size = max(target, manager.current_window_size)
@@ -0,0 +1,322 @@
+import copy
+import threading
+import time
+from tlslite import TLSConnection
+from tlslite.constants import CipherSuite, ExtensionType
+from tlslite.extensions import ClientKeyShareExtension, PreSharedKeyExtension, PskIdentity, SNIExtension
+from tlslite.handshakehelpers import HandshakeHelpers
+from tlslite.messages import ClientHello
+from tlslite.utils.codec import Writer
+from tlslite.utils.cryptomath import getRandomBytes
+from httpx_tls.keyshares import KeySharePoolTLSConnection
+
+__all__ = ["ClientHelloTemplate",
+           "ClientHelloTemplates",
+           "TemplateTLSConnection",
+           "TemplateKeySharePoolTLSConnection"]
+
+TLS13 = (3, 4)
+
+# Extensions whose contents change from one connection to the next. The rest of a ClientHello only depends on the
+# profile and on the handshake options the template is stored under (ALPN and so on).
+PER_CONNECTION_EXTENSIONS = frozenset([ExtensionType.server_name,
+                                       ExtensionType.key_share,
+                                       ExtensionType.client_hello_padding,
+                                       ExtensionType.pre_shared_key])
+
+
+class TemplateClientHello(ClientHello):
+    """ClientHello created from a ClientHelloTemplate, which reuses the serialized form of the template's extensions"""
+
+    def write(self):
+        template = self.template
+
+        w = Writer()
+        w.add(self.client_version[0], 1)
+        w.add(self.client_version[1], 1)
+        w.bytes += self.random
+        w.addVarSeq(self.session_id, 1, 1)
+        if self.cipher_suites is template.cipher_suites and \
+                self.compression_methods is template.compression_methods:
+            w.bytes += template.suites_bytes
+        else:
+            w.addVarSeq(self.cipher_suites, 2, 2)
+            w.addVarSeq(self.compression_methods, 1, 1)
+
+        # tlslite may still change the extensions after the ClientHello is created (after a HelloRetryRequest for
+        # example), so only the ones which are still the template's own are taken from the template
+        if self.extensions is not None:
+            static = template.static
+            extensions = bytearray()
+            for ext in self.extensions:
+                data = static.get(id(ext))
+                extensions += data if data is not None else ext.write()
+
+            w.add(len(extensions), 2)
+            w.bytes += extensions
+        return self.postWrite(w)
+
+
+class ClientHelloTemplate:
+    """
+    The ClientHello of a profile, with everything except for the random, session ID, key shares, SNI, padding and PSK
+    already serialized. ClientHellos created from it are byte for byte the same as the ones tlslite creates for the
+    profile from its HandshakeSettings, which is checked by from_client_hello before a template is ever used.
+    """
+
+    def __init__(self, client_hello):
+        """
+        :param tlslite.messages.ClientHello client_hello: ClientHello created by tlslite, which the template copies
+        """
+
+        self.attrs = dict(vars(client_hello))
+        self.extensions = [ext for ext in client_hello.extensions if ext.extType != ExtensionType.pre_shared_key]
+        self.session_id_length = len(client_hello.session_id)
+
+        key_share = client_hello.getExtension(ExtensionType.key_share)
+        self.key_share_groups = [entry.group for entry in key_share.client_shares] if key_share else None
+
+        self.cipher_suites = client_hello.cipher_suites
+        self.compression_methods = client_hello.compression_methods
+        w = Writer()
+        w.addVarSeq(self.cipher_suites, 2, 2)
+        w.addVarSeq(self.compression_methods, 1, 1)
+        self.suites_bytes = w.bytes
+
+        # Keyed by id, since extensions are not hashable. The template keeps the extensions alive so ids are never
+        # reused.
+        self.static = {id(ext): ext.write() for ext in self.extensions
+                       if ext.extType not in PER_CONNECTION_EXTENSIONS}
+
+    @classmethod
+    def from_client_hello(cls, client_hello, settings):
+        """
+        Create the template of a ClientHello created by tlslite, if the ClientHellos created from it would be the same
+
+        :param tlslite.messages.ClientHello client_hello: ClientHello created by tlslite
+        :param tlslite.HandshakeSettings settings: Settings the ClientHello was created with
+        :return: ClientHelloTemplate or None
+        """
+
+        if client_hello.ssl2 or client_hello.extensions is None:
+            return None
+
+        template = cls(client_hello)
+
+        # Create the same ClientHello from the template and compare them, leaving out the PSK which is never part of
+        # the template
+        expected = copy.copy(client_hello)
+        expected.extensions = [ext for ext in client_hello.extensions
+                               if ext.extType != ExtensionType.pre_shared_key]
+        created = template._create(settings, client_hello.random, client_hello.session_id,
+                                   client_hello.getExtension(ExtensionType.key_share),
+                                   client_hello.getExtension(ExtensionType.server_name))
+        if ClientHello.write(expected) != created.write():
+            return None
+        return template
+
+    def create(self, connection, settings, server_name):
+        """
+        Create a ClientHello for a new connection
+
+        :param tlslite.TLSConnection connection: Connection the ClientHello is for, which generates the key shares
+        :param tlslite.HandshakeSettings settings: Settings of the handshake
+        :param str server_name: Hostname to send in the SNI extension, if any
+        :return: tlslite.messages.ClientHello
+        """
+
+        key_share = None
+        if self.key_share_groups is not None:
+            key_share = ClientKeyShareExtension().create([connection._genKeyShareEntry(group, TLS13)
+                                                          for group in self.key_share_groups])
+        sni = SNIExtension().create(bytearray(server_name, 'utf-8')) if server_name is not None else None
+        session_id = getRandomBytes(32) if self.session_id_length else bytearray(0)
+        return self._create(settings, getRandomBytes(32), session_id, key_share, sni)
+
+    def _create(self, settings, random, session_id, key_share, sni):
+        client_hello = TemplateClientHello.__new__(TemplateClientHello)
+        vars(client_hello).update(self.attrs)
+        client_hello.template = self
+        client_hello.random = random
+        client_hello.session_id = session_id
+
+        extensions = []
+        for ext in self.extensions:
+            if ext.extType == ExtensionType.key_share:
+                ext = key_share
+            elif ext.extType == ExtensionType.server_name:
+                ext = sni
+            elif ext.extType == ExtensionType.client_hello_padding:
+                continue
+            if ext is not None:
+                extensions.append(ext)
+        client_hello.extensions = extensions
+
+        # The padding depends on the length of everything else, the SNI included
+        if settings.usePaddingExtension:
+            HandshakeHelpers.alignClientHelloPadding(client_hello)
+        return client_hello
+
+
+class ClientHelloTemplates:
+    """
+    The ClientHelloTemplates of a profile, keyed by the handshake options they were created for. A profile is shared
+    by every connection (and client) using it, which may be created on other threads (by sync clients), so templates
+    can only be added, and the first one added for a key is the one kept.
+    """
+
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._templates)
+
+    def get(self, key, default=None):
+        return self._templates.get(key, default)
+
+    def add(self, key, template):
+        """
+        Store the template (or None, if the profile has none) for the handshake options, unless one already is
+
+        :return: The template stored for the key
+        """
+
+        with self._lock:
+            return self._templates.setdefault(key, template)
+
+    def values(self):
+        with self._lock:
+            return list(self._templates.values())
+
+
+class ClientHelloTemplateMixin:
+    """
+    Creates ClientHellos from the templates of the connection's profile rather than building every extension from the
+    HandshakeSettings again. The first ClientHello of a profile (for a given set of handshake options) is still created
+    by tlslite, and becomes the template for the ones after it.
+    """
+
+    def __init__(self, *args, hello_templates=None, **kwargs):
+        """
+        :param ClientHelloTemplates hello_templates: Templates of the profile the connection uses (see
+        TLSProfile.get_hello_templates), or None to let tlslite create every ClientHello
+        """
+        super().__init__(*args, **kwargs)
+        self.hello_templates = hello_templates
+
+    @staticmethod
+    def _can_use_template(settings, session, srpParams, certParams, anonParams):
+        # Resuming a TLS 1.2 session changes the session ID and session ticket extension, and a client certificate
+        # adds the post_handshake_auth extension. Neither is worth a template of its own.
+        if srpParams or anonParams or not certParams or certParams[1]:
+            return False
+        if settings.maxVersion == (3, 0):
+            return False
+        return not (session and (session.sessionID or session.tls_1_0_tickets))
+
+    def _clientSendClientHello(self, settings, session, srpUsername, srpParams, certParams, anonParams, serverName,
+                               nextProtos, reqTack, alpn):
+        args = (settings, session, srpUsername, srpParams, certParams, anonParams, serverName, nextProtos, reqTack,
+                alpn)
+        templates = self.hello_templates
+        if templates is None or not self._can_use_template(settings, session, srpParams, certParams, anonParams):
+            for result in super()._clientSendClientHello(*args):
+                yield result
+            return
+
+        key = (tuple(alpn) if alpn else None, serverName is not None, nextProtos is not None, reqTack)
+        template = templates.get(key, False)
+        if template is False:
+            for result in super()._clientSendClientHello(*args):
+                if result not in (0, 1):
+                    # None is stored too, so that a profile we cannot create templates for is only checked once
+                    templates.add(key, ClientHelloTemplate.from_client_hello(result, settings))
+                yield result
+            return
+
+        if template is None:
+            for result in super()._clientSendClientHello(*args):
+                yield result
+            return
+
+        if settings.use_heartbeat_extension:
+            self.heartbeat_can_receive = True
+
+        client_hello = template.create(self, settings, serverName)
+        if settings.maxVersion >= TLS13:
+            self._add_pre_shared_key(client_hello, settings, session)
+
+        for result in self._sendMsg(client_hello):
+            yield result
+        yield client_hello
+
+    def _add_pre_shared_key(self, client_hello, settings, session):
+        identities, binders = get_psk_identities(settings, session)
+        if identities:
+            add_pre_shared_key(client_hello, identities, binders, self._handshake_hash, settings, session)
+
+
+def get_psk_identities(settings, session):
+    """
+    Create the PSK identities a TLS 1.3 ClientHello offers, the same way tlslite does: the first ticket of the session
+    which has not expired, then the external PSKs of the settings.
+
+    :param tlslite.HandshakeSettings settings: Settings of the handshake
+    :param tlslite.Session session: Session offered for resumption, or None
+    :return: tuple of the list of identities and the list of their (empty) binders
+    """
+
+    identities = []
+    binders = []
+    if session and session.tickets:
+        # Tickets must not be cached for longer than 7 days (RFC 8446)
+        now = time.time()
+        session.tickets[:] = (ticket for ticket in session.tickets
+                              if ticket.time + ticket.ticket_lifetime > now and
+                              ticket.time + 7 * 24 * 60 * 60 > now)
+        if session.tickets:
+            ticket = session.tickets[0]
+            # The obfuscated ticket age is in milliseconds
+            ticket_time = int(time.time() * 1000 - ticket.time * 1000 + ticket.ticket_age_add) % 2 ** 32
+            identities.append(PskIdentity().create(ticket.ticket, ticket_time))
+            binder_length = 48 if session.cipherSuite in CipherSuite.sha384PrfSuites else 32
+            binders.append(bytearray(binder_length))
+
+    for psk in settings.pskConfigs:
+        # PSKs without identities cannot be used with TLS 1.3
+        if not psk[0]:
+            continue
+        identities.append(PskIdentity().create(psk[0], 0))
+        psk_hash = psk[2] if len(psk) > 2 else 'sha256'
+        binders.append(bytearray(32 if psk_hash == 'sha256' else 48))
+
+    return identities, binders
+
+
+def add_pre_shared_key(client_hello, identities, binders, handshake_hash, settings, session):
+    """
+    Add the pre_shared_key extension to a ClientHello and sign it with the binders, like tlslite does. The extension
+    must come last, since the binders sign the rest of the ClientHello, so it is added after every other one.
+
+    :param tlslite.messages.ClientHello client_hello: ClientHello without the extension
+    :param list identities: PSK identities to offer (see get_psk_identities)
+    :param list binders: Binders of the identities, which are replaced by the signatures
+    :param tlslite.handshakehashes.HandshakeHashes handshake_hash: Transcript of the handshake before the ClientHello
+    :param tlslite.HandshakeSettings settings: Settings of the handshake
+    :param tlslite.Session session: Session offered for resumption, or None
+    :return: None
+    """
+
+    client_hello.extensions.append(PreSharedKeyExtension().create(identities, binders))
+    HandshakeHelpers.update_binders(client_hello, handshake_hash, settings.pskConfigs,
+                                    session.tickets if session else None,
+                                    session.resumptionMasterSecret if session else None)
+
+
+class TemplateTLSConnection(ClientHelloTemplateMixin, TLSConnection):
+    """TLSConnection which creates its ClientHello from the profile's template"""
+
+
+class TemplateKeySharePoolTLSConnection(ClientHelloTemplateMixin, KeySharePoolTLSConnection):
+    """KeySharePoolTLSConnection which creates its ClientHello from the profile's template"""
@@ -0,0 +1,157 @@
+import collections
+import concurrent.futures
+import os
+import threading
+from tlslite import TLSConnection, constants
+
+__all__ = ["KeySharePool",
+           "KeySharePoolTLSConnection",
+           "get_default_key_share_pool"]
+
+TLS13 = (3, 4)
+
+
+class KeySharePool:
+    """
+    Pool of pre-generated TLS 1.3 ephemeral key shares. Generating the key shares for a ClientHello is pure python
+    and happens right on the critical path of every handshake, so the pool generates them ahead of time in background
+    threads instead. Threads still share the GIL with the event loop, which means the work mostly gets done while the
+    loop is waiting on the network.
+
+    Every key share is handed out once. If the pool is empty for a group, None is returned and the caller generates
+    the key share itself.
+    """
+
+    def __init__(self, depth=8, refill_workers=1):
+        """
+        :param int depth: Number of key shares to keep ready for each group
+        :param int refill_workers: Number of threads generating key shares
+        """
+
+        if depth < 1:
+            raise ValueError("depth must be at least 1")
+        if refill_workers < 1:
+            raise ValueError("refill_workers must be at least 1")
+
+        self.depth = depth
+        self.refill_workers = refill_workers
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self._shares = collections.defaultdict(collections.deque)
+        self._refilling = set()
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = os.getpid()
+
+    def _check_pid(self):
+        # Key shares generated before a fork would otherwise be used by both the parent and the child process
+        if self._pid != os.getpid():
+            with self._lock:
+                self._shares.clear()
+                self._refilling.clear()
+                self._executor = None
+                self._pid = os.getpid()
+
+    def register_groups(self, groups):
+        """
+        Start generating key shares for the groups (numeric ids), if not done already
+
+        :param groups: Iterable of group ids
+        :return: None
+        """
+
+        self._check_pid()
+        for group in groups:
+            self._schedule_refill(group)
+
+    def take(self, group):
+        """
+        Take a pre-generated key share for the group
+
+        :param int group: Group id
+        :return: tlslite.messages.KeyShareEntry or None if no key share is available
+        """
+
+        self._check_pid()
+        try:
+            entry = self._shares[group].popleft()
+        except IndexError:
+            entry = None
+
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        self._schedule_refill(group)
+        return entry
+
+    def _schedule_refill(self, group):
+        with self._lock:
+            if group in self._refilling or len(self._shares[group]) >= self.depth:
+                return
+
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.refill_workers,
+                                                                       thread_name_prefix='httpx-tls-keyshares')
+            self._refilling.add(group)
+            executor = self._executor
+
+        executor.submit(self._refill, group)
+
+    def _refill(self, group):
+        try:
+            while len(self._shares[group]) < self.depth:
+                entry = TLSConnection._genKeyShareEntry(group, TLS13)
+                self._shares[group].append(entry)
+                with self._lock:
+                    self.generated += 1
+        finally:
+            with self._lock:
+                self._refilling.discard(group)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'generated': self.generated,
+                'ready': {constants.GroupName.toRepr(group): len(shares) for group, shares in self._shares.items()}}
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._shares.clear()
+
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+class KeySharePoolTLSConnection(TLSConnection):
+    """TLSConnection which takes its TLS 1.3 ClientHello key shares from a KeySharePool when it can"""
+
+    def __init__(self, sock, key_share_pool):
+        super().__init__(sock)
+        self.key_share_pool = key_share_pool
+
+    def _genKeyShareEntry(self, group, version):
+        if version == TLS13:
+            entry = self.key_share_pool.take(group)
+            if entry is not None:
+                return entry
+
+        return super()._genKeyShareEntry(group, version)
+
+
+_default_key_share_pool = None
+_default_key_share_pool_lock = threading.Lock()
+
+
+def get_default_key_share_pool():
+    global _default_key_share_pool
+
+    with _default_key_share_pool_lock:
+        if _default_key_share_pool is None:
+            _default_key_share_pool = KeySharePool()
+
+    return _default_key_share_pool
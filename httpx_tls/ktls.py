@@ -0,0 +1,259 @@
+import errno
+import socket
+import ssl
+import struct
+import sys
+import time
+from tlslite.constants import AlertDescription, AlertLevel, ContentType, HandshakeType, KeyUpdateMessageType
+from tlslite.errors import TLSRemoteAlert
+from tlslite.messages import Alert, KeyUpdate, NewSessionTicket
+from tlslite.utils.codec import Parser
+
+__all__ = ["KernelTLS",
+           "kernel_tls_supported"]
+
+# Linux kernel TLS (kTLS) moves the record protection of an established connection into the kernel, so that the
+# application reads and writes plaintext on the TCP socket. The handshake stays in tlslite (and with it the
+# fingerprint); only the traffic keys, IVs and sequence numbers it ends up with are handed to the kernel. The values
+# below are from linux/tls.h and linux/tcp.h, which the socket module does not expose.
+TCP_ULP = 31
+SOL_TLS = 282
+TLS_TX = 1
+TLS_RX = 2
+TLS_SET_RECORD_TYPE = 1
+TLS_GET_RECORD_TYPE = 2
+
+TLS_1_2_VERSION = 0x0303
+TLS_1_3_VERSION = 0x0304
+TLS_CIPHER_AES_GCM_128 = 51
+TLS_CIPHER_AES_GCM_256 = 52
+TLS_CIPHER_AES_CCM_128 = 53
+TLS_CIPHER_CHACHA20_POLY1305 = 54
+
+kernel_tls_supported = sys.platform.startswith('linux')
+
+# Room for the record type the kernel attaches to records other than application data
+ANCILLARY_SIZE = socket.CMSG_SPACE(1) if kernel_tls_supported else 0
+
+# Set to False once the kernel turns out not to have the tls module, so that later connections do not try again
+_kernel_tls_loaded = None
+
+
+def crypto_info(version, state):
+    """
+    Pack the key, IV and sequence number of one direction of a tlslite connection the way setsockopt(SOL_TLS, ...)
+    expects them (struct tls12_crypto_info_*)
+
+    :param tuple version: Negotiated TLS version, (3, 3) or (3, 4)
+    :param tlslite.recordlayer.ConnectionState state: Read or write state of the connection's record layer
+    :return: bytes, or None if the kernel has no support for the cipher
+    """
+
+    context = state.encContext
+    if context is None or not context.isAEAD:
+        return None
+    if version == (3, 4):
+        tls_version = TLS_1_3_VERSION
+    elif version == (3, 3):
+        tls_version = TLS_1_2_VERSION
+    else:
+        return None
+
+    key = bytes(context.key)
+    nonce = bytes(state.fixedNonce)
+    rec_seq = state.seqnum.to_bytes(8, 'big')
+
+    if context.name in ("aes128gcm", "aes256gcm", "aes128ccm"):
+        cipher = {"aes128gcm": TLS_CIPHER_AES_GCM_128,
+                  "aes256gcm": TLS_CIPHER_AES_GCM_256,
+                  "aes128ccm": TLS_CIPHER_AES_CCM_128}[context.name]
+        # TLS 1.3 splits the 12 byte IV into the salt and the IV. TLS 1.2 only has a 4 byte implicit part (the salt),
+        # and sends the rest of the nonce with every record; tlslite uses the sequence number for it, like the kernel.
+        if tls_version == TLS_1_3_VERSION:
+            salt, iv = nonce[:4], nonce[4:]
+        else:
+            salt, iv = nonce, rec_seq
+        return struct.pack('=HH', tls_version, cipher) + iv + key + salt + rec_seq
+
+    # Only the RFC 7905 construction with a 12 byte IV, not the draft one tlslite also supports for TLS 1.2
+    if context.name == "chacha20-poly1305" and len(nonce) == 12:
+        return struct.pack('=HH', tls_version, TLS_CIPHER_CHACHA20_POLY1305) + nonce + key + rec_seq
+    return None
+
+
+def _record_type(ancdata):
+    for level, kind, data in ancdata:
+        if level == SOL_TLS and kind == TLS_GET_RECORD_TYPE:
+            return data[0]
+    return ContentType.application_data
+
+
+class KernelTLS:
+    """
+    Record protection of an established tlslite connection, moved to the kernel. Reads and writes are generators in
+    the style of tlslite's: they yield 0 while waiting for the socket to be readable and 1 while waiting for it to be
+    writable (which only happens on non-blocking sockets), and their last value is the result.
+
+    Application data is read and written as is, while the records the kernel hands back unchanged (post-handshake
+    messages and alerts) are processed here. TLS 1.3 session tickets are added to the tlslite connection, so they
+    still reach the session cache.
+    """
+
+    __slots__ = ("sock", "tls_connection", "closed", "_handshake_buffer")
+
+    def __init__(self, sock, tls_connection):
+        self.sock = sock
+        self.tls_connection = tls_connection
+        self.closed = False
+        self._handshake_buffer = bytearray()
+
+    @classmethod
+    def install(cls, sock, tls_connection):
+        """
+        Hand the record protection of a tlslite connection whose handshake has completed to the kernel. Nothing may be
+        left to read from the tlslite connection: every record received so far must have been processed by tlslite,
+        and the rest must still be in the socket.
+
+        :param socket.socket sock: TCP socket of the connection
+        :param tlslite.TLSConnection tls_connection: Connection whose handshake has completed
+        :return: KernelTLS, or None if the kernel cannot take over the connection, which can then keep using tlslite
+        """
+        global _kernel_tls_loaded
+
+        if not kernel_tls_supported or _kernel_tls_loaded is False:
+            return None
+        if tls_connection._readBuffer or not tls_connection._defragmenter.is_empty():
+            return None
+
+        record_layer = tls_connection._recordLayer
+        rx = crypto_info(tls_connection.version, record_layer._readState)
+        tx = crypto_info(tls_connection.version, record_layer._writeState)
+        if rx is None or tx is None:
+            return None
+
+        try:
+            sock.setsockopt(socket.SOL_TCP, TCP_ULP, b'tls')
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                _kernel_tls_loaded = False
+            return None
+        _kernel_tls_loaded = True
+
+        # Without keys the tls module passes records through unchanged, so the connection can still fall back to
+        # tlslite if the kernel rejects the first one. Every kernel with receive support for a cipher also has send
+        # support for it, so the receive keys go first.
+        try:
+            sock.setsockopt(SOL_TLS, TLS_RX, rx)
+        except OSError:
+            return None
+        try:
+            sock.setsockopt(SOL_TLS, TLS_TX, tx)
+        except OSError as e:
+            raise ssl.SSLError(f"kernel TLS only accepted the receive keys: {e}") from e
+        return cls(sock, tls_connection)
+
+    def recv(self, bufsize):
+        """
+        Read application data, processing the other records in the way
+
+        :param int bufsize: Maximum number of bytes to read
+        :return: Generator, whose last value is the data read (b'' once the connection is closed)
+        """
+
+        while not self.closed:
+            try:
+                data, ancdata, _, _ = self.sock.recvmsg(bufsize, ANCILLARY_SIZE)
+            except BlockingIOError:
+                yield 0
+                continue
+
+            record_type = _record_type(ancdata)
+            if record_type == ContentType.application_data:
+                yield data
+                return
+            for result in self._process_record(record_type, data):
+                yield result
+        yield b''
+
+    def send(self, data, record_type=None):
+        """
+        Write application data, or a record of another type
+
+        :return: Generator
+        """
+
+        view = memoryview(data).cast('B')
+        ancdata = [(SOL_TLS, TLS_SET_RECORD_TYPE, bytes([record_type]))] if record_type is not None else []
+        while view:
+            try:
+                sent = self.sock.sendmsg([view], ancdata)
+            except BlockingIOError:
+                yield 1
+                continue
+            # Other record types are written all at once or not at all
+            view = view[sent:]
+
+    def close(self):
+        """Send close_notify if the socket can take it right away, without waiting for the peer"""
+        if self.closed:
+            return
+        self.closed = True
+        alert = Alert().create(AlertDescription.close_notify, AlertLevel.warning).write()
+        try:
+            self.sock.sendmsg([alert], [(SOL_TLS, TLS_SET_RECORD_TYPE, bytes([ContentType.alert]))], socket.MSG_DONTWAIT)
+        except OSError:
+            pass
+
+    def _process_record(self, record_type, data):
+        if record_type == ContentType.alert:
+            alert = Alert().parse(Parser(bytearray(data)))
+            if alert.description != AlertDescription.close_notify:
+                raise TLSRemoteAlert(alert)
+            self.closed = True
+            return
+
+        if record_type != ContentType.handshake:
+            raise ssl.SSLError(f"unexpected record of type {record_type} on a kernel TLS connection")
+
+        # Handshake messages may span records, and records may hold more than one
+        buffer = self._handshake_buffer
+        buffer += data
+        while len(buffer) >= 4 and len(buffer) >= 4 + int.from_bytes(buffer[1:4], 'big'):
+            length = 4 + int.from_bytes(buffer[1:4], 'big')
+            parser = Parser(buffer[:length])
+            del buffer[:length]
+            message_type = parser.get(1)
+
+            if message_type == HandshakeType.new_session_ticket and self.tls_connection.version > (3, 3):
+                ticket = NewSessionTicket().parse(parser)
+                ticket.time = time.time()
+                self.tls_connection.tickets.append(ticket)
+            elif message_type == HandshakeType.key_update:
+                for result in self._key_update(KeyUpdate().parse(parser)):
+                    yield result
+            # Anything else (such as a TLS 1.2 HelloRequest) is ignored, as by tlslite
+
+    def _key_update(self, key_update):
+        # Same as TLSRecordLayer._handle_keyupdate_request, with the new keys handed to the kernel. Linux only allows
+        # changing the keys of a socket since 6.13.
+        tls_connection = self.tls_connection
+        record_layer = tls_connection._recordLayer
+        session = tls_connection.session
+
+        session.cl_app_secret, session.sr_app_secret = record_layer.calcTLS1_3KeyUpdate_sender(
+            session.cipherSuite, session.cl_app_secret, session.sr_app_secret)
+        self._set_keys(TLS_RX, record_layer._readState)
+
+        if key_update.message_type == KeyUpdateMessageType.update_requested:
+            reply = KeyUpdate().create(KeyUpdateMessageType.update_not_requested).write()
+            for result in self.send(reply, ContentType.handshake):
+                yield result
+            session.cl_app_secret, session.sr_app_secret = record_layer.calcTLS1_3KeyUpdate_reciever(
+                session.cipherSuite, session.cl_app_secret, session.sr_app_secret)
+            self._set_keys(TLS_TX, record_layer._writeState)
+
+    def _set_keys(self, direction, state):
+        try:
+            self.sock.setsockopt(SOL_TLS, direction, crypto_info(self.tls_connection.version, state))
+        except OSError as e:
+            raise ssl.SSLError(f"the kernel did not accept the keys of a TLS 1.3 KeyUpdate: {e}") from e
@@ -0,0 +1,182 @@
+import bisect
+import threading
+import time
+
+__all__ = ["Histogram",
+           "Metrics",
+           "MeteredSocket"]
+
+
+class Histogram:
+    """Fixed bucket histogram. Each bucket counts the observations less than or equal to its upper bound."""
+
+    def __init__(self, bounds):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)  # The last bucket holds everything above the largest bound
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        return {'bounds': self.bounds,
+                'counts': list(self.counts),
+                'count': self.count,
+                'sum': self.sum}
+
+
+class Metrics:
+    """
+    Counters and histograms for the connections of a client. Everything is updated by the mocked TLS objects and the
+    HTTP2 patches through the methods below, and only when a client was created with metrics enabled, so there is no
+    cost otherwise. Sync clients can be used from any number of threads, so every update is made under a lock.
+    """
+
+    HANDSHAKE_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+    STREAMS_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+    def __init__(self):
+        self.handshakes = 0
+        self.handshake_failures = 0
+        self.resumed_handshakes = 0
+        self.handshake_duration = Histogram(self.HANDSHAKE_BOUNDS)
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.records_sent = 0
+        self.records_received = 0
+        self.active_connections = 0
+        self.active_streams = 0
+        self.streams_opened = 0
+        self.streams_per_connection = Histogram(self.STREAMS_BOUNDS)
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """
+        Return a copy of the current values, suitable for exporting to a monitoring system
+
+        :return: dict
+        """
+
+        with self._lock:
+            return {'handshakes': self.handshakes,
+                    'handshake_failures': self.handshake_failures,
+                    'resumed_handshakes': self.resumed_handshakes,
+                    'handshake_duration': self.handshake_duration.snapshot(),
+                    'bytes_sent': self.bytes_sent,
+                    'bytes_received': self.bytes_received,
+                    'records_sent': self.records_sent,
+                    'records_received': self.records_received,
+                    'active_connections': self.active_connections,
+                    'active_streams': self.active_streams,
+                    'streams_opened': self.streams_opened,
+                    'streams_per_connection': self.streams_per_connection.snapshot()}
+
+    def handshake_started(self):
+        # Nothing is counted until the handshake is over, so there is nothing to lock either
+        return time.perf_counter()
+
+    def handshake_finished(self, started, resumed):
+        duration = time.perf_counter() - started
+        with self._lock:
+            self.handshake_duration.observe(duration)
+            self.handshakes += 1
+            self.active_connections += 1
+            if resumed:
+                self.resumed_handshakes += 1
+
+    def handshake_failed(self):
+        with self._lock:
+            self.handshake_failures += 1
+
+    def connection_closed(self):
+        """Count a connection whose handshake finished as closed, which MockSSLObject makes sure happens only once"""
+        with self._lock:
+            self.active_connections -= 1
+
+    def data_sent(self, size):
+        with self._lock:
+            self.bytes_sent += size
+
+    def data_received(self, size):
+        with self._lock:
+            self.bytes_received += size
+
+    def stream_opened(self):
+        with self._lock:
+            self.streams_opened += 1
+            self.active_streams += 1
+
+    def stream_closed(self):
+        with self._lock:
+            self.active_streams -= 1
+
+    def http2_connection_closed(self, streams):
+        """
+        :param int streams: Number of streams which were opened on the HTTP2 connection
+        """
+        with self._lock:
+            self.streams_per_connection.observe(streams)
+
+    def count_records(self, record_layer):
+        """
+        Wrap the record sending and receiving generators of a tlslite RecordLayer instance to count records
+
+        :param tlslite.recordlayer.RecordLayer record_layer: Record layer to count the records of
+        :return: None
+        """
+
+        send_record = record_layer.sendRecord
+        recv_record = record_layer.recvRecord
+
+        lock = self._lock
+
+        def sendRecord(*args, **kwargs):
+            yield from send_record(*args, **kwargs)
+            with lock:
+                self.records_sent += 1
+
+        def recvRecord(*args, **kwargs):
+            for result in recv_record(*args, **kwargs):
+                # Anything other than 0 or 1 (waiting for the socket) is the record that was read
+                if result not in (0, 1):
+                    with lock:
+                        self.records_received += 1
+                yield result
+
+        record_layer.sendRecord = sendRecord
+        record_layer.recvRecord = recvRecord
+
+
+class MeteredSocket:
+    """Socket wrapper which counts the bytes passed through it, handed to tlslite in place of the socket itself"""
+
+    __slots__ = ("_sock", "_metrics")
+
+    def __init__(self, sock, metrics):
+        self._sock = sock
+        self._metrics = metrics
+
+    def send(self, data):
+        sent = self._sock.send(data)
+        self._metrics.data_sent(sent)
+        return sent
+
+    def sendall(self, data):
+        self._sock.sendall(data)
+        self._metrics.data_sent(len(data))
+
+    def recv(self, bufsize):
+        data = self._sock.recv(bufsize)
+        self._metrics.data_received(len(data))
+        return data
+
+    def recv_into(self, buffer, nbytes=0):
+        received = self._sock.recv_into(buffer, nbytes)
+        self._metrics.data_received(received)
+        return received
+
+    def __getattr__(self, item):
+        return getattr(self._sock, item)
@@ -1,11 +1,21 @@
-from tlslite import TLSConnection
+from tlslite.errors import TLSError
 from ssl import SSLError, SSLContext
+from httpx_tls.aead import RecordBackends, install_native_aead
+from httpx_tls.earlydata import EarlyDataTLSConnection, EarlyDataKeySharePoolTLSConnection
+from httpx_tls.hello import TemplateTLSConnection, TemplateKeySharePoolTLSConnection
+from httpx_tls.ktls import KernelTLS
+from httpx_tls.metrics import MeteredSocket
+from httpx_tls.verify import get_subject_alt_names, get_trust_store
+import collections
+import copy
 import errno
 import time
 import socket
+import ssl
 
 __all__ = ["SSLContextProxy",
-           "MockSSLObject"]
+           "MockSSLObject",
+           "MockSSLSocket"]
 
 
 class SSLContextProxy:
@@ -14,14 +24,32 @@ class SSLContextProxy:
         "_context",
         "_http_config",
         "_alpn_protocols",
-        "_client_cert"
+        "_client_cert",
+        "_session_cache",
+        "_record_backend",
+        "_key_share_pool",
+        "_metrics",
+        "_trust_store",
+        "_ca_locations",
+        "_early_data",
+        "_coalesce"
     }
 
-    def __init__(self, context: SSLContext, http_config):
+    def __init__(self, context: SSLContext, http_config, session_cache=None, record_backend=RecordBackends.PYTHON,
+                 key_share_pool=None, metrics=None, trust_store=None, ca_locations=(), early_data=False,
+                 coalesce=False):
         self._context = context
         self._http_config = http_config
         self._alpn_protocols = None
         self._client_cert = (None, None)  # certificate, keyfile
+        self._session_cache = session_cache
+        self._record_backend = record_backend
+        self._key_share_pool = key_share_pool
+        self._metrics = metrics
+        self._trust_store = trust_store
+        self._ca_locations = tuple(ca_locations)
+        self._early_data = early_data
+        self._coalesce = coalesce
 
     def get_alpn_protocols(self):
         return self._alpn_protocols
@@ -32,6 +60,48 @@ class SSLContextProxy:
     def get_cert(self):
         return self._client_cert
 
+    def get_session_cache(self):
+        return self._session_cache
+
+    def get_record_backend(self):
+        return self._record_backend
+
+    def get_key_share_pool(self):
+        return self._key_share_pool
+
+    def get_metrics(self):
+        return self._metrics
+
+    def get_trust_store(self):
+        return self._trust_store
+
+    def get_early_data(self):
+        return self._early_data
+
+    def get_coalesce(self):
+        return self._coalesce
+
+    def with_profile(self, http_config, early_data=False):
+        """
+        Create a proxy for another TLS profile which shares the SSL context, client certificate, session cache and
+        every other option with this one.
+
+        :param TLSProfile http_config: The TLS profile for the new proxy
+        :param bool early_data: Whether connections made with the new proxy send their first data as early data
+            when resuming a session which allows it, see httpx_tls.earlydata
+        :return: SSLContextProxy
+        """
+
+        proxy = SSLContextProxy(self._context, http_config, session_cache=self._session_cache,
+                                record_backend=self._record_backend, key_share_pool=self._key_share_pool,
+                                metrics=self._metrics,
+                                trust_store=self._trust_store, ca_locations=self._ca_locations,
+                                early_data=early_data, coalesce=self._coalesce)
+        proxy._client_cert = self._client_cert
+        if self._key_share_pool is not None and http_config is not None:
+            self._key_share_pool.register_groups(http_config.get_key_share_groups())
+        return proxy
+
     def __getattr__(self, item):
         return getattr(self._context, item)
 
@@ -49,15 +119,30 @@ class SSLContextProxy:
         """
         return MockSSLObject(self, server_side, server_hostname, incoming, outgoing)
 
-    def load_verify_locations(self, *args, **kwargs):
+    def wrap_socket(self, sock, server_side=False, do_handshake_on_connect=True, suppress_ragged_eofs=True,
+                    server_hostname=None, session=None):
+        """
+        Intercept call to wrap_socket (used by the sync httpcore backend) and return a mocked SSLSocket instead,
+        which runs tlslite directly over the blocking socket.
+
+        :return: MockSSLSocket
+        """
+        ssl_sock = MockSSLSocket(self, server_side, server_hostname, sock)
+        if do_handshake_on_connect:
+            ssl_sock.do_handshake()
+        return ssl_sock
+
+    def load_verify_locations(self, cafile=None, capath=None, cadata=None):
         """
-        Intercept and ignore call to load CA trusted certificates since tlslite does
-        not perform certificate verification anyway
+        Load CA certificates into the SSL context, and switch to the trust store of the context's new set of CA
+        certificates
 
         :return: None
         """
 
-        return
+        self._context.load_verify_locations(cafile, capath, cadata)
+        self._ca_locations += tuple(location for location in (cafile, capath) if location is not None)
+        self._trust_store = get_trust_store(self._context, self._ca_locations)
 
     def load_cert_chain(self, certfile, keyfile=None, password=None):
         """
@@ -92,58 +177,165 @@ class SSLContextProxy:
 
 
 class MockOpenSSLMemBIO:
+    """
+    In-memory BIO which mirrors ssl.MemoryBIO. Written data is kept as a queue of chunks along with a read offset into
+    the first one, so that draining the buffer in small reads does not copy the remaining data on every call.
+    """
+
+    __slots__ = ("_chunks", "_offset", "_pending", "_eof")
 
     def __init__(self):
-        self._pipe = bytearray()
+        self._chunks = collections.deque()
+        self._offset = 0  # Read offset into the first chunk
+        self._pending = 0
         self._eof = False
 
     @property
     def pending(self):
-        return len(self._pipe)
+        return self._pending
 
     @property
     def eof(self):
-        return self._eof is True and len(self._pipe) == 0
+        return self._eof is True and self._pending == 0
 
     def write_eof(self):
         self._eof = True
 
     def read(self, n=-1):
-        if n < 0:
-            n = len(self._pipe)
-        ret = self._pipe[:n]
-        self._pipe = self._pipe[n:]
-        return ret
+        if n < 0 or n > self._pending:
+            n = self._pending
+
+        if n == 0:
+            return b''
+
+        # Fast path: the read consumes exactly the first chunk, which we can hand out without copying
+        chunk = self._chunks[0]
+        if self._offset == 0 and len(chunk) == n:
+            self._chunks.popleft()
+            self._pending -= n
+            return chunk
+
+        buf = bytearray(n)
+        self.readinto(buf)
+        return bytes(buf)
+
+    def readinto(self, b):
+        """
+        Read up to len(b) bytes into the writable buffer b without creating intermediate bytes objects
+
+        :param b: Any object supporting the writable buffer protocol (bytearray, memoryview, etc.)
+        :return: Number of bytes read
+        """
+
+        target = memoryview(b).cast('B')
+        total = min(len(target), self._pending)
+        copied = 0
+
+        while copied < total:
+            chunk = self._chunks[0]
+            size = min(len(chunk) - self._offset, total - copied)
+            target[copied:copied + size] = memoryview(chunk)[self._offset:self._offset + size]
+            copied += size
+            self._offset += size
+
+            if self._offset == len(chunk):
+                self._chunks.popleft()
+                self._offset = 0
+
+        self._pending -= total
+        return total
 
     def write(self, buf):
         if self.eof:
             raise SSLError('cannot write() after write_eof()')
 
-        self._pipe += buf
-        return len(buf)
+        # The caller is free to reuse its buffer after we return, so we need to take our own copy here
+        data = bytes(buf)
+        if data:
+            self._chunks.append(data)
+            self._pending += len(data)
+        return len(data)
 
 
 class MockTLSSocket:
+    __slots__ = ("_incoming", "_outgoing", "_closed", "_lookahead", "_corked")
 
     def __init__(self, incoming: MockOpenSSLMemBIO, outgoing: MockOpenSSLMemBIO):
         self._incoming = incoming
         self._outgoing = outgoing
         self._closed = False
 
+        # Data taken out of the incoming BIO to look for complete records, see record_pending. It is always read
+        # before anything still in the BIO. A bytearray gives its memory back once it is emptied, so an idle
+        # connection does not keep the lookahead of its last large read around.
+        self._lookahead = bytearray()
+        self._corked = None
+
     def send(self, data):
         self._check_closed()
+        if self._corked is not None:
+            self._corked.append(data)
+            return len(data)
         return self._outgoing.write(data)
 
     def sendall(self, data):
         return self.send(data)
 
+    def cork(self):
+        """Hold back everything sent from now on until uncork() is called, to write it to the BIO all at once"""
+        self._corked = []
+
+    def uncork(self):
+        corked, self._corked = self._corked, None
+        if corked:
+            self._outgoing.write(b''.join(corked))
+
+    def record_pending(self):
+        """
+        Check whether a complete TLS record is waiting to be read. Neither ssl.MemoryBIO nor MockOpenSSLMemBIO let us
+        peek at their contents, so whatever is in the incoming BIO is moved to our own lookahead buffer first.
+
+        :return: bool
+        """
+
+        if self._incoming.pending:
+            self._lookahead += self._incoming.read()
+
+        lookahead = self._lookahead
+        return len(lookahead) >= 5 and len(lookahead) >= 5 + (lookahead[3] << 8 | lookahead[4])
+
     def recv(self, bufsize):
         self._check_closed()
 
+        if self._lookahead:
+            data = bytes(self._lookahead[:bufsize])
+            del self._lookahead[:bufsize]
+            return data
         if self._incoming.pending == 0:
             raise socket.error(errno.EWOULDBLOCK)
         return self._incoming.read(bufsize)
 
+    def recv_into(self, buffer, nbytes=0):
+        self._check_closed()
+
+        if nbytes:
+            buffer = memoryview(buffer)[:nbytes]
+        if self._lookahead:
+            size = min(len(buffer), len(self._lookahead))
+            memoryview(buffer)[:size] = self._lookahead[:size]
+            del self._lookahead[:size]
+            return size
+        if self._incoming.pending == 0:
+            raise socket.error(errno.EWOULDBLOCK)
+
+        # ssl.MemoryBIO, which is what trio and anyio hand to wrap_bio, has no readinto
+        if hasattr(self._incoming, 'readinto'):
+            return self._incoming.readinto(buffer)
+
+        data = self._incoming.read(len(buffer))
+        memoryview(buffer)[:len(data)] = data
+        return len(data)
+
     def _check_closed(self):
         if self._closed:
             raise OSError("OSError: [WinError 10038] An operation was attempted on something that is not a socket")
@@ -155,7 +347,54 @@ class MockTLSSocket:
         raise NotImplementedError
 
 
+class CorkedSocket:
+    """
+    Blocking socket wrapper with the cork() and uncork() methods of MockTLSSocket, so that the records of a single
+    write reach the network in one sendall call instead of one call per record.
+    """
+
+    __slots__ = ("_sock", "_corked")
+
+    def __init__(self, sock):
+        self._sock = sock
+        self._corked = None
+
+    def send(self, data):
+        if self._corked is not None:
+            self._corked.append(data)
+            return len(data)
+        return self._sock.send(data)
+
+    def sendall(self, data):
+        if self._corked is not None:
+            self._corked.append(data)
+        else:
+            self._sock.sendall(data)
+
+    def recv(self, bufsize):
+        return self._sock.recv(bufsize)
+
+    def recv_into(self, buffer, nbytes=0):
+        return self._sock.recv_into(buffer, nbytes)
+
+    def record_pending(self):
+        # We cannot tell without blocking, so reads over a blocking socket always stop after one record
+        return False
+
+    def cork(self):
+        self._corked = []
+
+    def uncork(self):
+        corked, self._corked = self._corked, None
+        if corked:
+            self._sock.sendall(b''.join(corked))
+
+    def __getattr__(self, item):
+        return getattr(self._sock, item)
+
+
 class MockSSLSession:
+    __slots__ = ("timeout", "time", "id")
 
     def __init__(self):
         self.timeout = 7200
@@ -166,13 +405,64 @@ class MockSSLSession:
 class MockSSLObject:
     """This is where we add methods like do_handshake and shit for tlsConnection"""
 
+    # Idle keep-alive connections can number in the thousands, so none of the objects kept per connection have an
+    # instance dictionary
+    __slots__ = ("context", "server_side", "server_hostname", "tls_connection", "kernel_tls", "_tls_socket",
+                 "_native_aead", "_outgoing", "_pending_handshake", "peer_names", "_active_metrics")
+
+    # Whether read() should decrypt all the complete records already received in one call, rather than one record
+    # per call. Only used over memory BIOs, where we can tell whether a record is complete without blocking.
+    bulk_read = True
+
     def __init__(self, context, server_side, server_hostname, incoming, outgoing):
         sock = MockTLSSocket(incoming, outgoing)
         self._outgoing = outgoing
+        self._init_connection(context, server_side, server_hostname, sock)
+
+    def _init_connection(self, context, server_side, server_hostname, sock):
         self.context = context
         self.server_side = server_side
         self.server_hostname = server_hostname
-        self.tls_connection = TLSConnection(sock)
+        self._tls_socket = sock
+
+        # KernelTLS the record protection was handed to once the handshake completed, with the kernel record backend
+        self.kernel_tls = None
+
+        # Rest of a handshake which was left to complete on the first read, after sending early data
+        self._pending_handshake = None
+
+        # Names the server's verified certificate is valid for, kept for connection coalescing (see
+        # TLSConnectionPool._coalesce_origin) once the handshake completes
+        self.peer_names = None
+
+        # Metrics the connection counts as active in, from the end of the handshake until it is closed
+        self._active_metrics = None
+        metrics = context.get_metrics()
+        if metrics is not None:
+            sock = MeteredSocket(sock, metrics)
+
+        # Profiles keep the templates their ClientHellos are created from. Without a profile, tlslite creates every
+        # ClientHello itself.
+        profile = context.get_profile()
+        hello_templates = profile.get_hello_templates() if profile is not None else None
+
+        kwargs = {'hello_templates': hello_templates}
+        if context.get_early_data():
+            # The early_data extension only goes in the ClientHellos of profiles which list it
+            kwargs['profile_extensions'] = profile.extensions if profile is not None else None
+
+        key_share_pool = context.get_key_share_pool()
+        if key_share_pool is not None:
+            connection_class = EarlyDataKeySharePoolTLSConnection if context.get_early_data() \
+                else TemplateKeySharePoolTLSConnection
+            self.tls_connection = connection_class(sock, key_share_pool, **kwargs)
+        else:
+            connection_class = EarlyDataTLSConnection if context.get_early_data() else TemplateTLSConnection
+            self.tls_connection = connection_class(sock, **kwargs)
+
+        if metrics is not None:
+            metrics.count_records(self.tls_connection._recordLayer)
+        self._native_aead = context.get_record_backend() in (RecordBackends.CRYPTOGRAPHY, RecordBackends.KERNEL)
 
     def _prepare_alpn_protocol(self, alpn_protocols):
         in_bytes = []
@@ -215,26 +505,205 @@ class MockSSLObject:
         return self._outgoing.pending
 
     def selected_alpn_protocol(self):
-        alpn = self.tls_connection.session.appProto
+        # Until the handshake completes, the protocol is the one of the resumed session the early data is sent for
+        if self._pending_handshake is not None:
+            alpn = self.tls_connection.early_data.alpn
+        else:
+            alpn = self.tls_connection.session.appProto
         return alpn.decode() if alpn is not None else alpn
 
-    def read(self, max_bytes):
-        for result in self.tls_connection.readAsync(max=max_bytes):
+    def read(self, max_bytes=1024, buffer=None):
+        if buffer is not None and not max_bytes:
+            max_bytes = len(buffer)
+
+        if self._pending_handshake is not None:
+            for result in self._complete_handshake():
+                yield result
+
+        data = None
+        for data in self.tls_connection.readAsync(max=max_bytes):
+            if data in (0, 1):
+                yield data
+
+        # Every round trip through anyio/trio costs more than decrypting a record, so once we have waited for the
+        # first record we also decrypt the ones which have been received along with it, without waiting for more.
+        if self.bulk_read and data and len(data) < max_bytes:
+            chunks = [data]
+            size = len(data)
+            while size < max_bytes and self._tls_socket.record_pending():
+                chunk = None
+                for chunk in self.tls_connection.readAsync(max=max_bytes - size, min=0):
+                    # Only if the record held part of a handshake message (like a session ticket) split across
+                    # records. The data decrypted so far is kept here until the rest of the message arrives.
+                    if chunk in (0, 1):
+                        yield chunk
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                size += len(chunk)
+
+            if len(chunks) > 1:
+                data = chunks if buffer is not None else b''.join(chunks)
+
+        # A TLS 1.3 KeyUpdate makes tlslite derive new (pure python) encryption contexts, so we switch them again
+        if self._native_aead:
+            install_native_aead(self.tls_connection)
+
+        if buffer is None:
+            yield data
+            return
 
-            yield result
+        # Like ssl.SSLObject.read, return the number of bytes written into the given buffer instead
+        view = memoryview(buffer).cast('B')
+        offset = 0
+        for chunk in (data if isinstance(data, list) else (data,)):
+            view[offset:offset + len(chunk)] = chunk
+            offset += len(chunk)
+        yield offset
 
     def write(self, buf):
-        for result in self.tls_connection.writeAsync(buf):
+        if self._pending_handshake is not None:
+            for result in self._write_early_data(buf):
+                yield result
+            return
+
+        # tlslite sends every record it splits the data into on its own, so we collect them and pass them on together
+        self._tls_socket.cork()
+        try:
+            for result in self.tls_connection.writeAsync(buf):
+                yield result
+        finally:
+            self._tls_socket.uncork()
+
+    def _write_early_data(self, buf):
+        # Writes must not wait for the handshake, which trio does not read the network for while writing. What does
+        # not fit in the early data the server accepts is held back until the handshake completes instead.
+        early_data = self.tls_connection.early_data
+        if not early_data.fits(len(buf)):
+            early_data.held.append(bytes(buf))
+            return
+
+        self._tls_socket.cork()
+        try:
+            for result in self.tls_connection.send_early_data(buf):
+                yield result
+        finally:
+            self._tls_socket.uncork()
+
+    def _complete_handshake(self):
+        for result in self._pending_handshake:
             yield result
+        self._pending_handshake = None
+
+        # Early data the server rejected is sent again as application data, as if the handshake had completed before
+        # it was written. That is only the same data if the protocol stayed the same.
+        early_data = self.tls_connection.early_data
+        self.tls_connection.early_data = None
+        pending = early_data.held
+        if not early_data.accepted:
+            if self.tls_connection.session.appProto != early_data.alpn:
+                raise SSLError("the server rejected the early data and negotiated another ALPN protocol")
+            pending = early_data.sent + pending
+
+        if pending:
+            for result in self.write(b''.join(pending)):
+                yield result
 
     def do_handshake(self):
-        kwargs = self._get_kwargs()
-        for result in self.tls_connection.handshakeClientCert(async_=True, **kwargs):
+        handshake = self._do_handshake()
+        for result in handshake:
+            # Once the ClientHello is written and offers early data, the handshake is left to complete on the first
+            # read, so that the data written until then is sent as early data along with the ClientHello
+            if result == 0 and self.context.get_early_data() and self.tls_connection.early_data is not None:
+                self._pending_handshake = handshake
+                return
             yield result
 
+    def _do_handshake(self):
+        kwargs = self._get_kwargs()
+        metrics = self.context.get_metrics()
+        started = metrics.handshake_started() if metrics is not None else None
+
+        try:
+            for result in self.tls_connection.handshakeClientCert(async_=True, **kwargs):
+                yield result
+            self._verify_peer()
+            if self.context.get_coalesce():
+                self._keep_peer_names(kwargs.get('session'))
+        except Exception:
+            if metrics is not None:
+                metrics.handshake_failed()
+            raise
+
+        if metrics is not None:
+            metrics.handshake_finished(started, self.tls_connection.resumed)
+            self._active_metrics = metrics
+
+        # Only switch the record protection and size once the handshake is over, so they have no effect on the
+        # fingerprint
+        if self._native_aead:
+            install_native_aead(self.tls_connection)
+        profile = self.context.get_profile()
+        if profile is not None:
+            # tlslite still keeps to a smaller limit if the server asked for one through the record_size_limit
+            # extension
+            self.tls_connection.recordSize = profile.get_record_size()
+
+        self._store_session()
+        release_handshake_state(self.tls_connection, client_certificate='certChain' in kwargs)
+
+    def _verify_peer(self):
+        # A resumed session was verified in the handshake which created it, and sends no certificates
+        trust_store = self.context.get_trust_store()
+        if trust_store is None or self.context.verify_mode == ssl.CERT_NONE or self.tls_connection.resumed:
+            return
+
+        chain = self.tls_connection.session.serverCertChain
+        trust_store.verify([x509.bytes for x509 in chain.x509List] if chain is not None else [],
+                           self.server_hostname, check_hostname=self.context.check_hostname)
+
+    def _keep_peer_names(self, offered_session):
+        # Only the names of a verified certificate are kept. A resumed session sends no certificate, so the names come
+        # from the session it resumed, and the new session keeps them for the connections which resume it in turn.
+        session = self.tls_connection.session
+        if self.tls_connection.resumed:
+            peer_names = getattr(offered_session, 'peer_names', None)
+        elif self.context.get_trust_store() is None or self.context.verify_mode == ssl.CERT_NONE or \
+                session.serverCertChain is None:
+            peer_names = None
+        else:
+            peer_names = get_subject_alt_names(session.serverCertChain.x509List[0].bytes)
+
+        self.peer_names = peer_names
+        session.peer_names = peer_names
+
+    def _store_session(self):
+        session_cache = self.context.get_session_cache()
+        if session_cache is None:
+            return
+
+        if self.tls_connection.resumed:
+            session_cache.record_resumption()
+
+        # For TLS 1.3, tlslite keeps a reference to the connection's ticket list inside the session, so tickets sent
+        # by the server after the handshake will be available to later connections through this same object
+        session_cache.set_session(self.server_hostname, self.context.get_profile(), self.tls_connection.session)
+
     def unwrap(self):
+        self.connection_closed()
         self.tls_connection = None
 
+    def connection_closed(self):
+        """
+        Stop counting the connection as active in the client metrics. Called by the streams (or sockets) closing the
+        connection, which may be more than one of them for the same connection.
+        """
+
+        metrics = self._active_metrics
+        if metrics is not None:
+            self._active_metrics = None
+            metrics.connection_closed()
+
     def _get_kwargs(self):
         kwargs = {}
         profile = self.context.get_profile()
@@ -255,6 +724,17 @@ class MockSSLObject:
             kwargs['certChain'] = cert[0]
             kwargs['privateKey'] = cert[1]
 
+        # Offer a previously stored session for resumption, if we have one for this server. Connections which may send
+        # early data take a ticket of their own.
+        session_cache = self.context.get_session_cache()
+        if session_cache is not None:
+            if self.context.get_early_data():
+                session = session_cache.take_session(self.server_hostname, profile)
+            else:
+                session = session_cache.get_session(self.server_hostname, profile)
+            if session is not None:
+                kwargs['session'] = session
+
         # If no profile was passed, then simply above kwargs are required
         if not profile:
             return kwargs
@@ -266,5 +746,146 @@ class MockSSLObject:
         return kwargs_profile
 
 
+class _NoHandshakeHashes:
+    """
+    Stands in for the HandshakeHashes of a tlslite connection whose handshake has completed. tlslite keeps adding the
+    handshake messages exchanged after the handshake (like session tickets) to the transcript, which nothing reads
+    any more.
+    """
+
+    __slots__ = ()
+
+    def update(self, data):
+        pass
+
+    def copy(self):
+        return self
+
+
+NO_HANDSHAKE_HASHES = _NoHandshakeHashes()
+
+
+def release_handshake_state(tls_connection, client_certificate=False):
+    """
+    Drop what a tlslite connection only needs for the handshake once it has completed: the transcript hashes (along
+    with a copy of every handshake message) and the server's certificate chain, which has been verified by then.
 
+    The session is shared with the session cache and the connections which resume it, so the connection is given a
+    copy of it without the chain rather than having the chain removed from the session itself.
 
+    :param tlslite.TLSConnection tls_connection: Connection whose handshake has completed
+    :param bool client_certificate: Whether the connection offered a client certificate
+    :return: None
+    """
+
+    tls_connection._handshake_hash = NO_HANDSHAKE_HASHES
+    # The transcript up to the server's Finished is needed to answer a TLS 1.3 post-handshake CertificateRequest,
+    # which is only sent to clients that offered one with their certificate
+    if not client_certificate:
+        tls_connection._first_handshake_hashes = None
+
+    # Resumed sessions are not verified again, so the chain is only ever read by _verify_peer. The copy still shares
+    # the ticket list, which tlslite adds the tickets sent after the handshake to.
+    session = tls_connection.session
+    if session is not None and session.serverCertChain is not None:
+        session = copy.copy(session)
+        session.serverCertChain = None
+        tls_connection.session = session
+
+
+def _run_blocking(gen):
+    """
+    Exhaust a tlslite generator over a blocking socket and return the last value it produced. Over a blocking socket
+    tlslite never has to wait for the socket to be ready, so that is the return value of the function.
+    """
+
+    ret = None
+    for ret in gen:
+        pass
+    return ret
+
+
+class MockSSLSocket(MockSSLObject):
+    """
+    Stands in for ssl.SSLSocket in the sync httpcore backend. Unlike MockSSLObject, tlslite reads from and writes to
+    the blocking socket directly, so there are no memory BIOs or event loop in between.
+    """
+    __class__ = ssl.SSLSocket
+    __slots__ = ("_sock",)
+
+    def __init__(self, context, server_side, server_hostname, sock):
+        self._sock = sock
+        self._init_connection(context, server_side, server_hostname, CorkedSocket(sock))
+
+    @property
+    def _sslobj(self):
+        # httpcore reads the negotiated ALPN protocol from the SSLObject of an SSLSocket
+        return self
+
+    def pending(self):
+        if self.kernel_tls is not None:
+            return 0
+        return len(self.tls_connection._readBuffer)
+
+    def do_handshake(self):
+        _run_blocking(super().do_handshake())
+
+        # tlslite reads the socket one record at a time, so everything after the handshake is still in the socket
+        if self.context.get_record_backend() == RecordBackends.KERNEL:
+            self.kernel_tls = KernelTLS.install(self._sock, self.tls_connection)
+
+    def recv(self, bufsize, flags=0):
+        if self.kernel_tls is not None:
+            return _run_blocking(self.kernel_tls.recv(bufsize))
+        return bytes(_run_blocking(super().read(bufsize)))
+
+    def read(self, max_bytes=1024):
+        return self.recv(max_bytes)
+
+    def send(self, data, flags=0):
+        if self.kernel_tls is not None:
+            _run_blocking(self.kernel_tls.send(data))
+        else:
+            _run_blocking(super().write(data))
+        return len(data)
+
+    def sendall(self, data, flags=0):
+        self.send(data)
+
+    def write(self, buf):
+        return self.send(buf)
+
+    def settimeout(self, value):
+        self._sock.settimeout(value)
+
+    def gettimeout(self):
+        return self._sock.gettimeout()
+
+    def getsockname(self):
+        return self._sock.getsockname()
+
+    def getpeername(self):
+        return self._sock.getpeername()
+
+    def fileno(self):
+        return self._sock.fileno()
+
+    def setsockopt(self, *args):
+        return self._sock.setsockopt(*args)
+
+    def unwrap(self):
+        super().unwrap()
+        return self._sock
+
+    def close(self):
+        # Only send close_notify if the connection was established, then close the socket regardless
+        self.connection_closed()
+        try:
+            if self.kernel_tls is not None:
+                self.kernel_tls.close()
+            elif self.tls_connection is not None and not self.tls_connection.closed:
+                self.tls_connection.close()
+        except (OSError, TLSError):
+            pass
+        finally:
+            self._sock.close()
@@ -1,11 +1,32 @@
+import sys
 from ._async import patch_async
+from ._sync import patch_sync
 from ._base import Patch
 
 
+def patch_trio():
+    from ._trio import patch_trio
+    patch_trio()
+
+
 def patch():
     patch_async()
+    patch_trio()
+    patch_sync()
+
+
+def patch_for_clients():
+    """
+    Apply the patches our clients need, which they do when they are created rather than when httpx_tls is imported.
+    The trio patch is only applied once trio has been imported, since trio cannot be the running backend otherwise.
+    Patches which are already applied are left as they are, so this can be called any number of times.
+    """
+
+    patch_async()
+    if 'trio' in sys.modules:
+        patch_trio()
+    patch_sync()
 
 
 def unpatch_all():
     Patch.unpatch_all()
-
@@ -3,11 +3,16 @@ import functools
 
 class Patch:
     patch_for = None
-    black_list = ['patch', 'patch_for', '_unpatch', 'unpatch_all']
+    black_list = ['patch', 'patch_for', '_unpatch', 'unpatch_all', 'get_original', 'patched']
     original_funcs = {}
+    patched = False
 
     @classmethod
     def patch(cls):
+        # Patching twice would store our own functions as the originals, so that they could never be unpatched
+        if cls.patched:
+            return
+
         method_list = [func for func in dir(cls)
                        if callable(getattr(cls, func)) and
                        (not func.startswith("__") and func not in cls.black_list)]
@@ -25,6 +30,19 @@ class Patch:
             functools.update_wrapper(partial_function, target_function)
             setattr(cls.patch_for, method, partial_function)
 
+        cls.patched = True
+
+    @classmethod
+    def get_original(cls, name):
+        """
+        Return the unpatched function our method name replaces, whether the patch is currently applied or not
+
+        :param str name: Name of the method
+        :return: Original function
+        """
+
+        return cls.original_funcs.get(name) or getattr(cls.patch_for, name)
+
     @classmethod
     def unpatch_all(cls):
         for child in cls.__subclasses__():
@@ -32,6 +50,10 @@ class Patch:
 
     @classmethod
     def _unpatch(cls):
+        if not cls.patched:
+            return
+
         for name, func in cls.original_funcs.items():
             setattr(cls.patch_for, name, func)
+        cls.patched = False
 
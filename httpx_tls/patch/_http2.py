@@ -0,0 +1,203 @@
+import h2.settings
+from collections import OrderedDict
+from httpcore._async.http2 import has_body_headers
+
+# The h2 state changes below are shared between the async and sync HTTP2 connection patches, which only differ in how
+# they write the outgoing data afterwards.
+
+
+class SettingValues(list):
+    """List of the current and pending values of a setting, with the one deque method h2 uses that lists lack"""
+
+    __slots__ = ()
+
+    def popleft(self):
+        return self.pop(0)
+
+
+class CompactSettings(h2.settings.Settings):
+    """
+    h2.settings.Settings keeps the values of every setting in a deque, each of which allocates room for 64 values up
+    front. A setting has at most a couple of values at any time, so for connections which sit idle in large numbers
+    we keep them in lists instead, which take a tenth of the memory.
+    """
+
+    def __init__(self, client=True, initial_values=None):
+        super().__init__(client=client, initial_values=initial_values)
+        self._settings = {key: SettingValues(values) for key, values in self._settings.items()}
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        # Settings the peer sends for the first time get a deque from h2
+        values = self._settings[key]
+        if type(values) is not SettingValues:
+            self._settings[key] = SettingValues(values)
+
+
+def send_request_headers(h2_state, request, stream_id, profile):
+    """
+    Send the request headers to the h2 state machine using the pseudo-header order and stream window from the
+    profile.
+
+    :param h2.connection.H2Connection h2_state: State machine of the connection
+    :param httpcore.Request request: Request whose headers are sent
+    :param int stream_id: Stream to send the headers on
+    :param httpx_tls.profiles.Http2Profile profile: Profile of the request
+    :return: None
+    """
+
+    # The header order is only read here, so we use the profile's own list rather than a copy for every request
+    header_order = profile.header_order
+    connection_flow = profile.connection_flow if profile.connection_flow else 2 ** 24
+
+    end_stream = not has_body_headers(request)
+
+    # In HTTP/2 the ':authority' pseudo-header is used instead of 'Host'.
+    # In order to gracefully handle HTTP/1.1 and HTTP/2 we always require
+    # HTTP/1.1 style headers, and map them appropriately if we end up on
+    # an HTTP/2 connection.
+    authority = [v for k, v in request.headers if k.lower() == b"host"][0]
+    pseudo_headers = [(b":method", request.method),
+                      (b":authority", authority),
+                      (b":scheme", request.url.scheme),
+                      (b":path", request.url.target)]
+    if header_order:
+        temp = []
+        for header in header_order:
+            for ph in pseudo_headers:
+                if header == ph[0]:
+                    temp.append(ph)
+
+        if len(temp) != len(pseudo_headers):
+            raise ValueError("Incorrect pseudo headers provided for http2 configuration")
+
+        pseudo_headers = temp
+
+    headers = pseudo_headers + [
+        (k.lower(), v)
+        for k, v in request.headers
+        if k.lower() not in (
+            b"host",
+            b"transfer-encoding",
+        )
+    ]
+
+    h2_state.send_headers(stream_id, headers, end_stream=end_stream)
+    h2_state.increment_flow_control_window(connection_flow, stream_id=stream_id)
+
+
+def send_connection_init(h2_state, profile):
+    """
+    Initiate the connection on the h2 state machine with the SETTINGS, WINDOW_UPDATE and PRIORITY frames from the
+    profile.
+
+    :param h2.connection.H2Connection h2_state: State machine of the connection
+    :param httpx_tls.profiles.Http2Profile profile: Profile of the request that opened the connection
+    :return: None
+    """
+
+    # Get the settings from profile. This will be an ordered dict that preserves the order of insertion. An
+    # ordered dict instead of a normal dictionary is used because the preservation of order of insertion became a
+    # language specification only in recent python 3.7 version. So, for previous versions, we'll need an ordered
+    # dict so that the headers are sent in the same order we were asked to send them in. Like the priority frames,
+    # the settings are only read, so we use the profile's own rather than a copy for every connection.
+    settings = profile.h2_settings
+    connection_flow = profile.connection_flow if profile.connection_flow else 2 ** 24
+    max_ts = settings.get(1, 4096)  # Get max table size if provided, else use the rfc default 4096
+    priority_frames = profile.priority_frames
+
+    if not settings:
+        initial_values = {
+            h2.settings.SettingCodes.ENABLE_PUSH: 0,
+            # These two are taken from h2 for safe defaults
+            h2.settings.SettingCodes.MAX_CONCURRENT_STREAMS: 100,
+            h2.settings.SettingCodes.MAX_HEADER_LIST_SIZE: 65536,
+        }
+    else:
+        initial_values = settings
+
+    # Even though we'll directly change the settings object later, we still send the initial_values param because
+    # h2 does its own validation checks against the values + it actually stores the dictionary values in a deque.
+    # Because we don't want our patch to do too much, instead of recreating the logic we leverage the existing
+    # one :)
+    h2_state.local_settings = CompactSettings(
+        client=True,
+        initial_values=initial_values,
+    )
+    local_settings = h2_state.local_settings
+
+    # Nothing has been received yet, so the server's settings are still the defaults h2 started with
+    h2_state.remote_settings = CompactSettings(client=False)
+    if settings:
+        # Next, we must enforce strict order of settings frame, and ensure no other frame than the ones we were
+        # asked to are sent. To do this, we can directly change the inner settings dictionary, without bothering
+        # with the top abstraction layer, to the ordered dict received from the profile.
+        inner_settings = local_settings._settings
+        new_inner_settings = OrderedDict()
+        for key in settings:
+            new_inner_settings[key] = inner_settings[key]
+
+        local_settings._settings = new_inner_settings
+
+    # Now, because httpx does not automatically adjust the maximum header table size, we'll do that here. As per the
+    # RFC, this should actually be done after we have received an ack, but doing it that way would be unnecessarily
+    # *patchy* because, again, httpx does not bother with this at all (plus it's also mostly harmless).
+    h2_state.decoder.max_allowed_table_size = max_ts
+
+    h2_state.initiate_connection()
+    h2_state.increment_flow_control_window(connection_flow)
+
+    if priority_frames:
+        # Lastly, if we are asked to send priority frames, we do so after sending WINDOWS_UPDATE frame
+        for frame_data in priority_frames:
+            h2_state.prioritize(*frame_data['args'], **frame_data['kwargs'])
+
+
+def stream_opened(connection, metrics):
+    """
+    Record a new stream on the connection. The metrics are also stored on the connection so that the stream and
+    connection closing hooks, which have no access to the request, can find them.
+    """
+
+    connection._tls_metrics = metrics
+    connection._tls_stream_count = getattr(connection, '_tls_stream_count', 0) + 1
+    metrics.stream_opened()
+
+
+def stream_closed(connection, stream_id):
+    metrics = getattr(connection, '_tls_metrics', None)
+    if metrics is not None:
+        metrics.stream_closed()
+
+    tuner = getattr(connection, '_tls_flow_control', None)
+    if tuner is not None:
+        tuner.stream_closed(stream_id)
+
+
+def request_sent(connection, request, stream_id):
+    """
+    Tell the connection's flow control tuner (see httpx_tls.flowcontrol) that the headers of a request have been
+    sent. The tuner is created with the first request which asks for adaptive flow control through the
+    'h2_flow_control' extension.
+    """
+
+    tuner = getattr(connection, '_tls_flow_control', None)
+    if tuner is None:
+        flow_control = request.extensions.get('h2_flow_control', None)
+        if flow_control is None:
+            return
+        tuner = connection._tls_flow_control = flow_control.create_tuner(connection._h2_state)
+    tuner.request_sent(stream_id)
+
+
+def event_received(connection, event):
+    tuner = getattr(connection, '_tls_flow_control', None)
+    if tuner is not None:
+        tuner.event_received(event)
+
+
+def connection_closed(connection):
+    metrics = getattr(connection, '_tls_metrics', None)
+    if metrics is not None:
+        metrics.http2_connection_closed(connection._tls_stream_count)
+        connection._tls_metrics = None
@@ -0,0 +1,78 @@
+import threading
+import httpcore
+from ._base import Patch
+from ._http2 import send_request_headers, send_connection_init, stream_opened, stream_closed, \
+    connection_closed, request_sent, event_received
+
+
+class SemaphorePatch(Patch):
+    patch_for = httpcore._synchronization.Semaphore
+
+    @staticmethod
+    def acquire(original_self, original_func):
+        # httpcore creates the semaphore of an HTTP2 connection with every stream of the local MAX_CONCURRENT_STREAMS
+        # setting available, and then acquires all but one of them, one by one, until the server's SETTINGS arrive.
+        # Profiles which do not send that setting leave it at 2**32 + 1. The first acquire instead leaves a single
+        # stream available and breaks out of that loop, which HTTP2ConnectionPatch.handle_request then retries.
+        if not getattr(original_self, '_single_stream', False):
+            original_self._semaphore = threading.Semaphore(1)
+            original_self._single_stream = True
+            raise ValueError
+
+        return original_func(original_self)
+
+
+class HTTP2ConnectionPatch(Patch):
+    patch_for = httpcore._sync.http2.HTTP2Connection
+
+    @staticmethod
+    def _send_request_headers(original_self, original_func, request, stream_id):
+        metrics = request.extensions.get('tls_metrics', None)
+        if metrics is not None:
+            stream_opened(original_self, metrics)
+
+        if not request.extensions.get('h2_profile', None):
+            original_func(original_self, request, stream_id)
+        else:
+            send_request_headers(original_self._h2_state, request, stream_id, request.extensions['h2_profile'])
+            original_self._write_outgoing_data(request)
+        request_sent(original_self, request, stream_id)
+
+    @staticmethod
+    def _receive_stream_event(original_self, original_func, request, stream_id):
+        event = original_func(original_self, request, stream_id)
+        event_received(original_self, event)
+        return event
+
+    @staticmethod
+    def _send_connection_init(original_self, original_func, request):
+        if not request.extensions.get('h2_profile', None):
+            return original_func(original_self, request)
+
+        send_connection_init(original_self._h2_state, request.extensions['h2_profile'])
+        original_self._write_outgoing_data(request)
+
+    @staticmethod
+    def _response_closed(original_self, original_func, stream_id):
+        stream_closed(original_self, stream_id)
+        return original_func(original_self, stream_id)
+
+    @staticmethod
+    def close(original_self, original_func):
+        connection_closed(original_self)
+        return original_func(original_self)
+
+    @staticmethod
+    def handle_request(original_self, original_func, request):
+        try:
+            return original_func(original_self, request)
+        except ValueError:
+            with original_self._state_lock:
+                original_self._request_count -= 1
+
+            return original_func(original_self, request)
+
+
+def patch_sync():
+    SemaphorePatch.patch()
+    HTTP2ConnectionPatch.patch()
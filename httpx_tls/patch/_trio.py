@@ -0,0 +1,32 @@
+import functools
+import trio
+from ._base import Patch
+from ._async import retry_tlslite
+from httpx_tls.mocks import MockSSLObject
+
+# Kept apart from the other async patches so that trio is only imported by applications which use it
+
+
+class TrioSSLStreamPatch(Patch):
+    patch_for = trio._ssl.SSLStream
+
+    @staticmethod
+    async def _retry(original_self, original_func, fn, *args, ignore_want_read=False, is_handshake=False):
+        kwargs = {'ignore_want_read': ignore_want_read, 'is_handshake': is_handshake}
+
+        # Check if tlslite is being used. If not, we pass on the function call without any modifications
+        if not isinstance(original_self._ssl_object, MockSSLObject):
+            return await original_func(original_self, fn, *args, **kwargs)
+
+        return await retry_tlslite(functools.partial(original_func, original_self, **kwargs), fn, *args)
+
+    @staticmethod
+    async def aclose(original_self, original_func):
+        # httpcore creates the stream with https_compatible=True, so closing it never reaches the SSL object
+        if isinstance(original_self._ssl_object, MockSSLObject):
+            original_self._ssl_object.connection_closed()
+        return await original_func(original_self)
+
+
+def patch_trio():
+    TrioSSLStreamPatch.patch()
@@ -1,8 +1,11 @@
 import collections
+import concurrent.futures
 import copy
 from httpx_tls.constants import TLSExtConstants, Http2Constants, TLSVersionConstants
 from tlslite import HandshakeSettings, constants
 from httpx_tls import database
+from httpx_tls.cache import LRUCache
+from httpx_tls.hello import ClientHelloTemplates
 import struct
 
 ja3_str = '771,4865-4866-4867-49195-49199-49196-49200-52393-52392-49171-49172-156-157-47-53,' \
@@ -25,8 +28,13 @@ class Profile:
 
 
 class TLSProfile(Profile):
+    # Maximum plaintext size of the application data records we send. Profiles of a browser from the database use
+    # the browser's (database.Browser.record_size), other profiles the maximum TLS allows.
+    DEFAULT_RECORD_SIZE = 2 ** 14
+    MIN_RECORD_SIZE = 64  # Smallest limit a peer may ask for through the record_size_limit extension (RFC 8449)
 
-    def __init__(self, tls_version=None, ciphers=None, extensions=None, groups=None, settings=None):
+    def __init__(self, tls_version=None, ciphers=None, extensions=None, groups=None, settings=None,
+                 record_size=None):
 
         self.ciphers = ciphers if ciphers else []
         self.extensions = extensions if extensions else []
@@ -34,17 +42,84 @@ class TLSProfile(Profile):
         self.tls_version = tls_version if tls_version else (3, 3)
         self.kwargs = {}
         self.settings = settings
+        self.record_size = record_size if record_size else self.DEFAULT_RECORD_SIZE
+        self.hello_templates = ClientHelloTemplates()
+
+        if not self.MIN_RECORD_SIZE <= self.record_size <= self.DEFAULT_RECORD_SIZE:
+            raise ValueError(f"record size must be between {self.MIN_RECORD_SIZE} and {self.DEFAULT_RECORD_SIZE}")
 
         self._create()
 
     def get_kwargs(self):
-        return self.kwargs
+        # Callers add connection specific kwargs (like SNI) to what we return, and profiles can be shared between
+        # connections and clients, so they must not get our own dictionary. The settings in it are still our own, since
+        # tlslite only works on a validated copy of them.
+        return self.kwargs.copy()
 
     def get_settings(self):
-        return self.settings
+        """
+        :return: Copy of the profile's HandshakeSettings, since the profile (and its settings) may be shared with other
+        clients
+        """
+        return copy.deepcopy(self.settings)
+
+    def get_record_size(self):
+        return self.record_size
+
+    def get_hello_templates(self):
+        """
+        :return: httpx_tls.hello.ClientHelloTemplates created for the profile, shared by all its connections
+        """
+        return self.hello_templates
+
+    def get_key_share_groups(self):
+        """
+        :return: list of ids of the groups key shares are sent for in the ClientHello
+        """
+        return [getattr(constants.GroupName, name) for name in self.settings.keyShares]
+
+    def get_compiled_state(self):
+        """
+        Return everything the profile computed from its fingerprint as builtins only, so that it can be stored by
+        httpx_tls.compiled and turned back into a profile by from_compiled_state without being validated again. Only
+        the HandshakeSettings attributes which differ from a new HandshakeSettings are included.
+
+        :return: tuple
+        """
+
+        defaults = vars(HandshakeSettings())
+        settings_attrs = {name: value for name, value in vars(self.settings).items()
+                          if name not in defaults or defaults[name] != value}
+        kwargs = {key: value for key, value in self.kwargs.items() if key != 'settings'}
+        return (self.tls_version, self.ciphers, self.extensions, self.groups, self.record_size, settings_attrs,
+                kwargs)
 
     @classmethod
-    def create_from_ja3(cls, ja3:str):
+    def from_compiled_state(cls, state):
+        """
+        Create a profile from the output of get_compiled_state, which is trusted to be valid
+
+        :param tuple state: Output of get_compiled_state
+        :return: TLSProfile
+        """
+
+        tls_version, ciphers, extensions, groups, record_size, settings_attrs, kwargs = state
+        settings = HandshakeSettings()
+        vars(settings).update(settings_attrs)
+
+        profile = cls.__new__(cls)
+        profile.tls_version = tls_version
+        profile.ciphers = ciphers
+        profile.extensions = extensions
+        profile.groups = groups
+        profile.record_size = record_size
+        profile.settings = settings
+        profile.kwargs = dict(kwargs, settings=settings)
+        profile.hello_templates = ClientHelloTemplates()
+        return profile
+
+    @classmethod
+    def create_from_ja3(cls, ja3:str, record_size=None):
         ja3 = ja3.strip()
         version, ciphers, extensions, groups, ec_points = ja3.split(',')
 
@@ -68,13 +143,14 @@ class TLSProfile(Profile):
         except KeyError:
             raise ValueError(f"invalid or unsupported tls version ({version}) provided in the ja3 string")
 
-        return cls(tls_version=tls_version, ciphers=cipher_order, extensions=extension_order, groups=groups_order)
+        return cls(tls_version=tls_version, ciphers=cipher_order, extensions=extension_order, groups=groups_order,
+                   record_size=record_size)
 
     @classmethod
     def create_from_version(cls, browser: str, version: int, ios_version: int = None):
         browser_data_class: database.Browser = database.get_browser_data_class(browser)
         ja3 = browser_data_class.get_ja3_from_version(version, ios_version=ios_version)
-        return cls.create_from_ja3(ja3)
+        return cls.create_from_ja3(ja3, record_size=browser_data_class.record_size)
 
     @classmethod
     def create_from_handshake_settings(cls, settings):
@@ -205,6 +281,11 @@ class TLSProfile(Profile):
         for ext in extensions:
             if ext in TLSExtConstants.AUTOMATIC or ext in TLSExtConstants.CONFIGURABLE:
                 continue
+            elif ext == TLSExtConstants.EARLY_DATA:
+                # Early data is only sent when resuming a TLS 1.3 session, which is only offered with these
+                if 43 not in extensions or 45 not in extensions:
+                    raise ValueError(f"sending TLS extension 'early_data' ({ext}) requires the 'supported_versions' "
+                                     f"(43) and 'psk_key_exchange_modes' (45) extensions")
             elif ext in TLSExtConstants.NOT_SUPPORTED:
                 raise ValueError(f"sending TLS extension '{TLSExtConstants.extension_mapping[ext]}' ({ext}) "
                                  f"is not supported yet")
@@ -241,6 +322,35 @@ class Http2Profile(Profile):
         else:
             return self.priority_frames
 
+    def get_compiled_state(self):
+        """
+        Return the validated profile as builtins only, see TLSProfile.get_compiled_state
+
+        :return: tuple
+        """
+
+        h2_settings = [(int(setting), value) for setting, value in self.h2_settings.items()]
+        return h2_settings, self.header_order, self.connection_flow, self.priority_frames
+
+    @classmethod
+    def from_compiled_state(cls, state):
+        """
+        Create a profile from the output of get_compiled_state, which is trusted to be valid
+
+        :param tuple state: Output of get_compiled_state
+        :return: Http2Profile
+        """
+
+        h2_settings, header_order, connection_flow, priority_frames = state
+
+        profile = cls.__new__(cls)
+        profile.h2_settings = collections.OrderedDict((Http2Constants.settings_mapping[setting], value)
+                                                      for setting, value in h2_settings)
+        profile.header_order = header_order
+        profile.connection_flow = connection_flow
+        profile.priority_frames = priority_frames
+        return profile
+
     @classmethod
     def create_from_akamai_str(cls, s: str):
         # Remove all whitespaces from string. Important because some implementations include whitespace right after
@@ -368,10 +478,194 @@ class Http2Profile(Profile):
         self.h2_settings = new_settings
 
 
+UserAgentProfiles = collections.namedtuple('UserAgentProfiles', ['useragent', 'tls_profile', 'h2_profile', 'error'])
+
+
+def _resolve_useragent(useragent: str):
+    """
+    Resolve a user-agent to its ja3 and akamai strings. This runs inside worker processes, so errors are returned
+    instead of raised to keep one bad user-agent from failing the whole batch. That includes whatever the user-agent
+    parser raises for input which is not a user-agent string at all (like None).
+
+    :return: tuple of ja3 string, akamai string, and exception (None if resolved successfully)
+    """
+
+    try:
+        device, browser, version, ios_version = database.get_device_and_browser_from_ua(useragent)
+        browser_data_class: database.Browser = database.get_browser_data_class(browser)
+        ja3 = browser_data_class.get_ja3_from_version(version, ios_version=ios_version)
+        akamai_str = browser_data_class.get_akamai_str_from_version(version, device, ios_version=ios_version)
+    except Exception as e:
+        return None, None, e
+
+    return ja3, akamai_str, None
+
+
+class ProfileFactory:
+    """
+    Creates TLS and HTTP2 profiles like the create_from_* classmethods do, but keeps the created profiles in bounded,
+    thread-safe LRU caches keyed by the canonical fingerprint string. Identical fingerprints therefore share a single
+    profile object instead of being parsed and validated again.
+
+    Profiles returned by the factory are shared, so they must be treated as read-only. Their getters only hand out
+    copies of the settings they hold, and templates can only be added to their ClientHelloTemplates.
+    """
+
+    def __init__(self, maxsize=1024, useragent_maxsize=None, compiled=None):
+        """
+        :param int maxsize: Maximum number of profiles of each type (TLS and HTTP2) to keep. None means unbounded.
+        :param int useragent_maxsize: Maximum number of parsed user-agent strings to keep. Defaults to maxsize.
+        :param compiled: httpx_tls.compiled.CompiledProfiles to take profiles from before creating them, or the path
+            of a file written by export()
+        """
+
+        self.tls_profiles = LRUCache(maxsize)
+        self.h2_profiles = LRUCache(maxsize)
+        self.useragents = LRUCache(maxsize if useragent_maxsize is None else useragent_maxsize)
+
+        if isinstance(compiled, str):
+            from httpx_tls.compiled import CompiledProfiles
+            compiled = CompiledProfiles(compiled)
+        self.compiled = compiled
 
+    @staticmethod
+    def canonical(s: str):
+        return "".join(s.split())
+
+    def tls_from_ja3(self, ja3: str, record_size=None):
+        """
+        :param int record_size: Record size the profile must have (see TLSProfile), or None to take the profile stored
+            for the ja3 string whatever its record size, and the default one for a new profile
+        """
 
+        key = self.canonical(ja3)
+        profile = self.tls_profiles.get(key)
+        if profile is None or record_size is not None and profile.get_record_size() != record_size:
+            if self.compiled is not None:
+                profile = self.compiled.get_tls(key)
+            if profile is None or record_size is not None and profile.get_record_size() != record_size:
+                profile = TLSProfile.create_from_ja3(key, record_size=record_size)
+            self.tls_profiles.set(key, profile)
+
+        return profile
+
+    def h2_from_akamai_str(self, s: str):
+        key = self.canonical(s)
+        profile = self.h2_profiles.get(key)
+        if profile is None:
+            if self.compiled is not None:
+                profile = self.compiled.get_h2(key)
+            if profile is None:
+                profile = Http2Profile.create_from_akamai_str(key)
+            self.h2_profiles.set(key, profile)
+
+        return profile
+
+    def tls_from_version(self, browser: str, version: int, ios_version: int = None):
+        browser_data_class: database.Browser = database.get_browser_data_class(browser)
+        return self.tls_from_ja3(browser_data_class.get_ja3_from_version(version, ios_version=ios_version),
+                                 record_size=browser_data_class.record_size)
 
+    def h2_from_version(self, device: str, browser: str, version: int, ios_version: int = None):
+        browser_data_class: database.Browser = database.get_browser_data_class(browser)
+        akamai_str = browser_data_class.get_akamai_str_from_version(version, device, ios_version=ios_version)
+        return self.h2_from_akamai_str(akamai_str)
 
+    def parse_useragent(self, useragent: str):
+        """
+        Cached version of database.get_device_and_browser_from_ua
+
+        :return: tuple of device, browser, version, ios_version
+        """
+
+        parsed = self.useragents.get(useragent)
+        if parsed is None:
+            parsed = database.get_device_and_browser_from_ua(useragent)
+            self.useragents.set(useragent, parsed)
+
+        return parsed
+
+    def tls_from_useragent(self, useragent: str):
+        device, browser, version, ios_version = self.parse_useragent(useragent)
+        return self.tls_from_version(browser, version, ios_version=ios_version)
+
+    def h2_from_useragent(self, useragent: str):
+        device, browser, version, ios_version = self.parse_useragent(useragent)
+        return self.h2_from_version(device, browser, version, ios_version=ios_version)
+
+    def from_useragent(self, useragent: str):
+        """
+        :return: tuple of TLSProfile and Http2Profile for the user-agent
+        """
+
+        return self.tls_from_useragent(useragent), self.h2_from_useragent(useragent)
+
+    def bulk_from_useragents(self, useragents, max_workers=None, chunksize=256, executor=None):
+        """
+        Resolve a batch of user-agents to their TLS and HTTP2 profiles. Identical user-agents are only resolved once,
+        and user-agent parsing is spread over a process pool. Profiles are then built in this process through the
+        factory caches, so user-agents sharing a fingerprint also share the profile objects.
+
+        Results are yielded in the same order as the input as soon as they are available. A user-agent which cannot
+        be resolved does not raise, its result has the profiles set to None and the exception stored in error.
+
+        :param useragents: Iterable of user-agent strings
+        :param int max_workers: Number of worker processes. 0 resolves everything in this process instead.
+        :param int chunksize: Number of user-agents sent to a worker process at a time
+        :param concurrent.futures.Executor executor: Executor to use instead of creating a new process pool
+        :return: Generator of UserAgentProfiles
+        """
+
+        useragents = list(useragents)
+        unique = list(dict.fromkeys(useragents))
+
+        if executor is None and max_workers == 0:
+            yield from self._bulk_results(useragents, map(_resolve_useragent, unique))
+        elif executor is None:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+                yield from self._bulk_results(useragents, executor.map(_resolve_useragent, unique,
+                                                                       chunksize=chunksize))
+        else:
+            yield from self._bulk_results(useragents, executor.map(_resolve_useragent, unique, chunksize=chunksize))
+
+    def _bulk_results(self, useragents, resolved_iter):
+        # resolved_iter yields results in the order each user-agent first appears in the input, so every user-agent
+        # we have not seen before has its result next in line
+        results = {}
+        for useragent in useragents:
+            if useragent not in results:
+                ja3, akamai_str, error = next(resolved_iter)
+                tls_profile = h2_profile = None
+                if error is None:
+                    try:
+                        tls_profile = self.tls_from_ja3(ja3)
+                        h2_profile = self.h2_from_akamai_str(akamai_str)
+                    except Exception as e:
+                        tls_profile = h2_profile = None
+                        error = e
+
+                results[useragent] = UserAgentProfiles(useragent, tls_profile, h2_profile, error)
+
+            yield results[useragent]
+
+    def export(self, path):
+        """
+        Write every profile currently held by the factory to a compiled profile file, which a factory can be created
+        with later on to skip building and validating them again.
+
+        :param str path: Path of the file to write
+        :return: None
+        """
 
+        from httpx_tls.compiled import dump_profiles
+        dump_profiles(path, dict(self.tls_profiles.items()), dict(self.h2_profiles.items()))
 
+    def stats(self):
+        return {'tls_profiles': self.tls_profiles.stats(),
+                'h2_profiles': self.h2_profiles.stats(),
+                'useragents': self.useragents.stats()}
 
+    def clear(self):
+        self.tls_profiles.clear()
+        self.h2_profiles.clear()
+        self.useragents.clear()
@@ -0,0 +1,899 @@
+import functools
+import os
+import socket
+import ssl
+import time
+import warnings
+import sniffio
+import anyio
+import httpcore
+import httpx
+from httpx import create_ssl_context
+from httpx._config import DEFAULT_LIMITS, SSLConfig
+from httpx._utils import get_ca_bundle_from_env
+from httpx._transports.default import map_httpcore_exceptions
+from httpcore._async.connection import AsyncHTTPConnection
+from httpcore._async.http11 import AsyncHTTP11Connection, HTTPConnectionState
+from httpcore._async.http2 import AsyncHTTP2Connection
+from httpcore._backends.anyio import AnyIOBackend, AnyIOStream
+from httpcore._backends.auto import AutoBackend
+from httpcore._exceptions import ConnectError, ConnectionNotAvailable, ConnectTimeout, ReadTimeout, \
+    RemoteProtocolError, map_exceptions
+from httpcore._models import ByteStream
+from httpcore._synchronization import AsyncShieldCancellation
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.cache import LRUCache, SessionCache
+from httpx_tls.earlydata import SAFE_METHODS
+from httpx_tls.flowcontrol import AdaptiveFlowControl
+from httpx_tls.keyshares import KeySharePool, get_default_key_share_pool
+from httpx_tls.ktls import KernelTLS
+from httpx_tls.metrics import Metrics
+from httpx_tls.mocks import SSLContextProxy
+from httpx_tls.verify import get_trust_store, match_hostname
+from httpx_tls.patch._async import AnyioTLSStreamPatch, AsyncHTTP2ConnectionPatch, retry_tlslite
+from httpx_tls.patch._http2 import send_request_headers, send_connection_init, stream_opened, stream_closed, \
+    connection_closed, request_sent, event_received
+
+__all__ = ["AsyncTLSTransport"]
+
+# Number of hosts each HTTP2 connection remembers whether its certificate is valid for, see
+# TLSHTTP2Connection.can_coalesce
+MAX_COALESCING_CHECKS = 256
+
+
+def create_ssl_context_proxy(tls_config=None, verify=True, cert=None, trust_env=True, session_cache=128,
+                             record_backend=RecordBackends.PYTHON, key_share_pool=None, metrics=False,
+                             coalesce=False):
+    """
+    Resolve the connection options accepted by the clients and the transport, and create the SSLContextProxy which
+    carries them to every connection.
+
+    :return: httpx_tls.mocks.SSLContextProxy
+    """
+
+    # session_cache can either be the maximum number of sessions to store for resumption (0 or None to disable
+    # resumption altogether), or an existing SessionCache to share between clients
+    if not isinstance(session_cache, SessionCache):
+        session_cache = SessionCache(maxsize=session_cache) if session_cache else None
+
+    # record_backend decides what encrypts and decrypts application data once the handshake is done. The
+    # handshake itself always goes through tlslite so that the fingerprint stays the same.
+    if record_backend not in RecordBackends.ALL:
+        raise ValueError(f"unknown record backend '{record_backend}'")
+    if record_backend == RecordBackends.CRYPTOGRAPHY and not cryptography_loaded:
+        warnings.warn("the cryptography package is not installed, falling back to the python record backend")
+        record_backend = RecordBackends.PYTHON
+
+    # key_share_pool can be True to use the process wide pool of pre-generated key shares, or a KeySharePool. We
+    # let the pool know which groups our profile needs so that it can start generating them straight away.
+    if key_share_pool is True:
+        key_share_pool = get_default_key_share_pool()
+    elif not key_share_pool:
+        key_share_pool = None
+    if key_share_pool is not None and not isinstance(key_share_pool, KeySharePool):
+        raise ValueError("key_share_pool must be True, None or a KeySharePool")
+    if key_share_pool is not None and tls_config is not None:
+        key_share_pool.register_groups(tls_config.get_key_share_groups())
+
+    # metrics can be True to collect metrics for this client only, or an existing Metrics to aggregate several
+    # clients. When disabled, none of the counting code is installed at all.
+    if metrics is True:
+        metrics = Metrics()
+    elif not metrics:
+        metrics = None
+    if metrics is not None and not isinstance(metrics, Metrics):
+        raise ValueError("metrics must be True, False or a Metrics")
+
+    context = create_ssl_context(verify=verify, cert=cert, trust_env=trust_env)
+
+    # Server certificates are verified against the CA certificates httpx loaded into the context. The context does not
+    # list all of them (see TrustStore.load_certificates), so we find out which file or directory httpx loaded the
+    # same way it does. The certifi bundle only has CA certificates, which the context lists. Unless verify is an
+    # SSLContext of its own, that file or directory is all httpx loaded, so the trust store can be found by it.
+    if verify is True:
+        ca_bundle = (get_ca_bundle_from_env() if trust_env else None) or SSLConfig.DEFAULT_CA_BUNDLE_PATH
+    else:
+        ca_bundle = verify
+    ca_locations = [ca_bundle] if isinstance(ca_bundle, (str, os.PathLike)) and os.path.exists(ca_bundle) else []
+    trust_store = get_trust_store(context, ca_locations, from_locations=not isinstance(verify, ssl.SSLContext)) \
+        if context.verify_mode != ssl.CERT_NONE else None
+
+    return SSLContextProxy(context, tls_config, session_cache=session_cache, record_backend=record_backend,
+                           key_share_pool=key_share_pool, metrics=metrics, trust_store=trust_store, ca_locations=ca_locations, coalesce=coalesce)
+
+
+# The classes below do what the patches in httpx_tls.patch do, but as subclasses used only by AsyncTLSTransport. The
+# patches may still be applied to their base classes as well, which is why we call the original functions through
+# get_original() rather than super() wherever the patches would otherwise run a second time. The trio classes are in
+# httpx_tls._trio, which is only imported once trio is the running backend.
+
+
+class TLSStream(anyio.streams.tls.TLSStream):
+
+    async def _call_sslobject_method(self, fn, *args):
+        call_original = functools.partial(AnyioTLSStreamPatch.get_original('_call_sslobject_method'), self)
+        return await retry_tlslite(call_original, fn, *args)
+
+    async def aclose(self):
+        self._ssl_object.connection_closed()
+        await AnyioTLSStreamPatch.get_original('aclose')(self)
+
+
+class KernelTLSStream(anyio.abc.ByteStream):
+    """
+    Stream of a connection whose record protection was handed to the kernel once the handshake completed, which reads
+    and writes plaintext on the socket itself instead of going through the TLSStream and its memory BIOs.
+    """
+
+    def __init__(self, tls_stream, sock, kernel_tls):
+        self._tls_stream = tls_stream
+        self._sock = sock
+        self._kernel_tls = kernel_tls
+
+    @classmethod
+    def wrap(cls, tls_stream):
+        """
+        Hand the record protection of a TLSStream whose handshake has completed to the kernel
+
+        :param TLSStream tls_stream: Stream of the connection
+        :return: KernelTLSStream, or None to keep using the TLSStream
+        """
+
+        ssl_object = tls_stream._ssl_object
+        tls_connection = ssl_object.tls_connection
+        transport_stream = tls_stream.transport_stream
+
+        # A handshake left to complete after sending early data is still done by tlslite
+        if ssl_object._pending_handshake is not None:
+            return None
+
+        # Only the asyncio socket streams of anyio, whose transport must have nothing buffered either way. The
+        # records the kernel takes over must still be in the socket, not already received (0.5-RTT data sent along
+        # with the server's Finished for example).
+        transport = getattr(transport_stream, '_transport', None)
+        protocol = getattr(transport_stream, '_protocol', None)
+        raw_socket = transport_stream.extra(anyio.abc.SocketAttribute.raw_socket, None)
+        if transport is None or protocol is None or raw_socket is None:
+            return None
+        transport.pause_reading()
+        if protocol.read_queue or transport.get_write_buffer_size() or tls_stream._read_bio.pending or \
+                ssl_object._tls_socket._lookahead:
+            return None
+
+        # The event loop keeps the transport's file descriptor registered, so the stream waits on a duplicate
+        sock = socket.socket(fileno=os.dup(raw_socket.fileno()))
+        sock.setblocking(False)
+        try:
+            kernel_tls = KernelTLS.install(sock, tls_connection)
+        except Exception:
+            sock.close()
+            raise
+        if kernel_tls is None:
+            sock.close()
+            return None
+
+        ssl_object.kernel_tls = kernel_tls
+        return cls(tls_stream, sock, kernel_tls)
+
+    async def _run(self, gen):
+        result = None
+        try:
+            for result in gen:
+                if result == 0:
+                    await anyio.wait_socket_readable(self._sock)
+                elif result == 1:
+                    await anyio.wait_socket_writable(self._sock)
+        except ssl.SSLError as exc:
+            raise anyio.BrokenResourceError from exc
+        except OSError as exc:
+            if self._sock.fileno() == -1:
+                raise anyio.ClosedResourceError from exc
+            raise anyio.BrokenResourceError from exc
+        return result
+
+    async def receive(self, max_bytes=65536):
+        data = await self._run(self._kernel_tls.recv(max_bytes))
+        if not data:
+            raise anyio.EndOfStream
+        return data
+
+    async def send(self, item):
+        await self._run(self._kernel_tls.send(item))
+
+    async def send_eof(self):
+        raise NotImplementedError("TLS connections cannot be half closed")
+
+    async def aclose(self):
+        self._tls_stream._ssl_object.connection_closed()
+        self._kernel_tls.close()
+        self._sock.close()
+        await self._tls_stream.transport_stream.aclose()
+
+    @property
+    def extra_attributes(self):
+        return self._tls_stream.extra_attributes
+
+
+class TLSAnyIOStream(AnyIOStream):
+
+    async def start_tls(self, ssl_context, server_hostname=None, timeout=None):
+        # Same as AnyIOStream.start_tls, except for the TLSStream class
+        exc_map = {
+            TimeoutError: ConnectTimeout,
+            anyio.BrokenResourceError: ConnectError,
+        }
+        with map_exceptions(exc_map):
+            try:
+                with anyio.fail_after(timeout):
+                    ssl_stream = await TLSStream.wrap(
+                        self._stream,
+                        ssl_context=ssl_context,
+                        hostname=server_hostname,
+                        standard_compatible=False,
+                        server_side=False,
+                    )
+            except Exception as exc:
+                await self.aclose()
+                raise exc
+
+        if ssl_context.get_record_backend() == RecordBackends.KERNEL:
+            kernel_stream = KernelTLSStream.wrap(ssl_stream)
+            if kernel_stream is not None:
+                return AnyIOStream(kernel_stream)
+        return AnyIOStream(ssl_stream)
+
+
+class TLSAnyIOBackend(AnyIOBackend):
+
+    async def connect_tcp(self, *args, **kwargs):
+        stream = await super().connect_tcp(*args, **kwargs)
+        return TLSAnyIOStream(stream._stream)
+
+    async def connect_unix_socket(self, *args, **kwargs):
+        stream = await super().connect_unix_socket(*args, **kwargs)
+        return TLSAnyIOStream(stream._stream)
+
+
+class TLSNetworkBackend(AutoBackend):
+
+    async def _init_backend(self):
+        if not hasattr(self, '_backend'):
+            if sniffio.current_async_library() == 'trio':
+                from httpx_tls._trio import TLSTrioBackend
+                self._backend = TLSTrioBackend()
+            else:
+                self._backend = TLSAnyIOBackend()
+
+
+class StreamSemaphore:
+    """
+    Semaphore limiting the concurrent streams of an HTTP2 connection. httpcore creates its semaphore with every
+    stream of the local MAX_CONCURRENT_STREAMS setting available and then acquires all but one of them, one by one,
+    until the server's SETTINGS arrive. Profiles which do not send that setting leave it at 2**32 + 1, so this one
+    starts with a single stream available instead.
+    """
+
+    __slots__ = ("_bound", "_semaphore")
+
+    def __init__(self, bound):
+        self._bound = bound
+        self._semaphore = None
+
+    async def acquire(self):
+        if self._semaphore is None:
+            if sniffio.current_async_library() == 'trio':
+                import trio
+                self._semaphore = trio.Semaphore(initial_value=1, max_value=self._bound)
+            else:
+                self._semaphore = anyio.Semaphore(initial_value=1, max_value=self._bound)
+
+        await self._semaphore.acquire()
+
+    async def release(self):
+        self._semaphore.release()
+
+
+class TLSHTTP2Connection(AsyncHTTP2Connection):
+
+    def __init__(self, origin, stream, keepalive_expiry=None, metrics=None):
+        super().__init__(origin=origin, stream=stream, keepalive_expiry=keepalive_expiry)
+        self._metrics = metrics
+
+        # Origins besides its own the connection was coalesced for, and whether the server's certificate is valid for
+        # each host checked so far. Both are only created once needed, see TLSConnectionPool._coalesce_origin.
+        self._coalesced_origins = None
+        self._coalescing_checks = None
+
+    def can_handle_request(self, origin):
+        return origin == self._origin or (self._coalesced_origins is not None and
+                                          (origin.scheme, origin.host, origin.port) in self._coalesced_origins)
+
+    def can_coalesce(self, origin):
+        """
+        Check whether the server's certificate is valid for another origin on the same scheme and port. The result
+        is cached by host for as long as the connection is open.
+
+        :param httpcore.Origin origin: Origin which has no connection of its own
+        :return: bool
+        """
+
+        if origin.scheme != self._origin.scheme or origin.port != self._origin.port:
+            return False
+
+        # Only set once the handshake has completed and the certificate was verified, which a connection which sent
+        # early data may still be waiting for
+        peer_names = getattr(self._network_stream.get_extra_info("ssl_object"), "peer_names", None)
+        if peer_names is None:
+            return False
+
+        host = origin.host.decode("ascii")
+        matches = self._coalescing_checks.get(host) if self._coalescing_checks is not None else None
+        if matches is None:
+            matches = match_hostname(*peer_names, host)
+            self._set_coalescing_check(host, matches)
+        return matches
+
+    def _set_coalescing_check(self, host, matches):
+        if self._coalescing_checks is None:
+            self._coalescing_checks = {}
+        elif len(self._coalescing_checks) >= MAX_COALESCING_CHECKS:
+            self._coalescing_checks.clear()
+        self._coalescing_checks[host] = matches
+
+    def coalesce(self, origin):
+        """Let requests for another origin use the connection from now on"""
+        # httpcore.Origin is not hashable
+        if self._coalesced_origins is None:
+            self._coalesced_origins = set()
+        self._coalesced_origins.add((origin.scheme, origin.host, origin.port))
+
+    def uncoalesce(self, origin):
+        """
+        Stop requests for an origin coalesced onto the connection from using it. The server does not answer for the
+        origin's host, so it is not coalesced onto the connection again either.
+        """
+        if self._coalesced_origins is not None:
+            self._coalesced_origins.discard((origin.scheme, origin.host, origin.port))
+        if origin != self._origin:
+            self._set_coalescing_check(origin.host.decode("ascii"), False)
+
+    def get_server_ip(self):
+        server_addr = self._network_stream.get_extra_info("server_addr")
+        return server_addr[0] if isinstance(server_addr, tuple) else None
+
+    async def handle_async_request(self, request):
+        # We send the connection init ourselves, so that httpcore never gets to create its own stream semaphore
+        if not self._sent_connection_init:
+            async with self._init_lock:
+                if not self._sent_connection_init:
+                    await self._init_connection(request)
+
+        return await AsyncHTTP2ConnectionPatch.get_original('handle_async_request')(self, request)
+
+    async def _init_connection(self, request):
+        profile = request.extensions.get('h2_profile', None)
+        try:
+            if profile:
+                send_connection_init(self._h2_state, profile)
+                await self._write_outgoing_data(request)
+            else:
+                await AsyncHTTP2ConnectionPatch.get_original('_send_connection_init')(self, request)
+        except BaseException as exc:
+            with AsyncShieldCancellation():
+                await self.aclose()
+            raise exc
+
+        self._sent_connection_init = True
+        self._max_streams = 1
+        self._max_streams_semaphore = StreamSemaphore(self._h2_state.local_settings.max_concurrent_streams)
+
+    async def prewarm(self, request):
+        """Send the connection preface, which is otherwise only sent before the first request's headers"""
+        if not self._sent_connection_init:
+            async with self._init_lock:
+                if not self._sent_connection_init:
+                    await self._init_connection(request)
+
+    async def _send_request_headers(self, request, stream_id):
+        if self._metrics is not None:
+            stream_opened(self, self._metrics)
+
+        profile = request.extensions.get('h2_profile', None)
+        if not profile:
+            await AsyncHTTP2ConnectionPatch.get_original('_send_request_headers')(self, request, stream_id)
+        else:
+            send_request_headers(self._h2_state, request, stream_id, profile)
+            await self._write_outgoing_data(request)
+        request_sent(self, request, stream_id)
+
+    async def _receive_stream_event(self, request, stream_id):
+        event = await AsyncHTTP2ConnectionPatch.get_original('_receive_stream_event')(self, request, stream_id)
+        event_received(self, event)
+        return event
+
+    async def _response_closed(self, stream_id):
+        stream_closed(self, stream_id)
+        return await AsyncHTTP2ConnectionPatch.get_original('_response_closed')(self, stream_id)
+
+    async def aclose(self):
+        connection_closed(self)
+        return await AsyncHTTP2ConnectionPatch.get_original('aclose')(self)
+
+
+class TLSHTTPConnection(AsyncHTTPConnection):
+    READ_NUM_BYTES = 64 * 1024
+
+    def __init__(self, *args, profiles=(None, None), metrics=None, early_data=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiles = profiles  # (TLS profile, HTTP2 profile) of the requests this connection was created for
+        self.early_data = early_data  # Whether the connection may send its first request as early data
+        self._metrics = metrics
+
+    def can_handle_request(self, origin):
+        if isinstance(self._connection, TLSHTTP2Connection):
+            return self._connection.can_handle_request(origin)
+        return origin == self._origin
+
+    def can_coalesce(self, origin, profiles):
+        """
+        Check whether requests for another origin may use this connection: it must be an available HTTP2 connection
+        made for the same profiles, whose server certificate is valid for the origin. The address the origin's host
+        resolves to is checked by coalesce().
+
+        :param httpcore.Origin origin: Origin which has no connection of its own
+        :param tuple profiles: (TLS profile, HTTP2 profile) of the request
+        :return: bool
+        """
+
+        return profiles == self.profiles and isinstance(self._connection, TLSHTTP2Connection) and \
+            self._connection.is_available() and self._connection.can_coalesce(origin)
+
+    def coalesce(self, origin, addresses):
+        """
+        Let requests for another origin use the connection from now on, if it is connected to one of the addresses
+        the origin's host resolves to. can_coalesce() must have been checked beforehand.
+
+        :param httpcore.Origin origin: Origin to coalesce onto the connection
+        :param set addresses: IP addresses the origin's host resolves to
+        :return: bool, whether the origin was coalesced onto the connection
+        """
+
+        if self._connection.get_server_ip() not in addresses:
+            return False
+        self._connection.coalesce(origin)
+        return True
+
+    def is_coalesced(self, origin):
+        return origin != self._origin and self.can_handle_request(origin)
+
+    def uncoalesce(self, origin):
+        """
+        :param httpcore.Origin origin: Origin to stop using the connection for
+        :return: None
+        """
+        if isinstance(self._connection, TLSHTTP2Connection):
+            self._connection.uncoalesce(origin)
+
+    async def handle_async_request(self, request):
+        # Same as AsyncHTTPConnection.handle_async_request, except for the HTTP2 connection class
+        if not self.can_handle_request(request.url.origin):
+            raise RuntimeError(f"Attempted to send request to {request.url.origin} on connection to {self._origin}")
+
+        async with self._request_lock:
+            if self._connection is None:
+                await self._establish(request)
+            elif not self._connection.is_available():
+                raise ConnectionNotAvailable()
+
+        return await self._connection.handle_async_request(request)
+
+    async def _establish(self, request):
+        try:
+            stream = await self._connect(request)
+
+            ssl_object = stream.get_extra_info("ssl_object")
+            http2_negotiated = ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2"
+            if http2_negotiated or (self._http2 and not self._http1):
+                self._connection = TLSHTTP2Connection(origin=self._origin, stream=stream,
+                                                      keepalive_expiry=self._keepalive_expiry,
+                                                      metrics=self._metrics)
+            else:
+                self._connection = AsyncHTTP11Connection(origin=self._origin, stream=stream,
+                                                         keepalive_expiry=self._keepalive_expiry)
+        except Exception as exc:
+            self._connect_failed = True
+            raise exc
+
+    async def prewarm(self, request):
+        """
+        Connect and, for HTTP2, send the connection preface without sending the request itself. The connection then
+        counts as idle, and expires after keepalive_expiry like any other idle connection.
+
+        :param httpcore.Request request: Request to take the origin, profiles and timeouts from
+        :return: None
+        """
+
+        start = time.monotonic()
+        async with self._request_lock:
+            if self._connection is None:
+                await self._establish(request)
+
+        if isinstance(self._connection, TLSHTTP2Connection):
+            await self._connection.prewarm(request)
+        elif self._connection._state == HTTPConnectionState.NEW:
+            await self._receive_post_handshake(time.monotonic() - start)
+
+            # httpcore only lets the request which created an HTTP/1.1 connection use it while it is new
+            self._connection._state = HTTPConnectionState.IDLE
+
+        if self._keepalive_expiry is not None:
+            self._connection._expire_at = time.monotonic() + self._keepalive_expiry
+
+    async def _receive_post_handshake(self, timeout):
+        # TLS 1.3 servers send their session tickets once the handshake is done. httpcore takes an idle HTTP/1.1
+        # connection with anything left to read for one which the server has closed, so we read the tickets here
+        # rather than have the connection thrown away. They arrive a round trip after the handshake, which connecting
+        # took at least as long as.
+        stream = self._connection._network_stream
+        if stream.get_extra_info("ssl_object") is None:
+            return
+
+        try:
+            data = await stream.read(self.READ_NUM_BYTES, timeout)
+        except ReadTimeout:
+            return
+
+        if not data:
+            raise RemoteProtocolError("Server disconnected while prewarming the connection.")
+        raise RemoteProtocolError("Server sent data on an idle HTTP/1.1 connection.")
+
+
+def is_replayable(request):
+    """
+    Check whether a request can be sent again: its body must be one that can be read again, which httpx and httpcore
+    only use for bodies given as bytes (or no body at all). Other streams are consumed the first time they are sent.
+
+    :param httpcore.Request request: Request which was already sent
+    :return: bool
+    """
+
+    return isinstance(request.stream, (httpx.ByteStream, ByteStream))
+
+
+class TLSConnectionPool(httpcore.AsyncConnectionPool):
+    """
+    Connection pool which keys connections by origin and profile pair instead of just the origin, so that a single
+    pool (and its max_connections limit) can serve requests with different TLS and HTTP2 profiles. A connection is
+    only ever reused by requests with the same profiles as the one it was created for.
+    """
+
+    def __init__(self, *args, metrics=None, max_profiles=128, early_data=False, **kwargs):
+        super().__init__(*args, network_backend=TLSNetworkBackend(), **kwargs)
+        self._metrics = metrics
+        self._early_data = early_data
+
+        # SSLContextProxy for each TLS profile requested so far (and with or without early data), all sharing the
+        # pool's SSL context and options
+        self._profile_contexts = LRUCache(maxsize=max_profiles)
+
+    async def handle_async_request(self, request):
+        coalesced = self._ssl_context.get_coalesce() and await self._coalesce_origin(request)
+        response = await super().handle_async_request(request)
+
+        # A server which does not answer for every name in its certificate tells us with 421 Misdirected Request
+        # (RFC 9110 section 15.5.20), after which the request is sent again on a connection of its own. That is only
+        # possible if its body can be sent again, otherwise the 421 is the response.
+        if coalesced and response.status == 421:
+            async with self._pool_lock:
+                for connection in self._pool:
+                    connection.uncoalesce(request.url.origin)
+            if is_replayable(request):
+                await response.aclose()
+                response = await super().handle_async_request(request)
+
+        # A server which wants a request it received as early data to wait for the handshake answers 425 Too Early
+        # (RFC 8470 section 5.2). The request is then sent again without early data, on a connection which did not
+        # send any.
+        if response.status == 425 and self._early_data and request.method in SAFE_METHODS and \
+                request.extensions.get("early_data", True) and is_replayable(request):
+            await response.aclose()
+            extensions = dict(request.extensions, early_data=False)
+            request = httpcore.Request(request.method, request.url, headers=request.headers, content=request.stream,
+                                       extensions=extensions)
+            response = await super().handle_async_request(request)
+        return response
+
+    async def _coalesce_origin(self, request):
+        """
+        Let an established HTTP2 connection to another origin take over the request's origin, as browsers do, when
+        the origin has no connection of its own. The connection must have been made for the same profiles, with a
+        certificate valid for the origin's host, which must resolve to the address the connection is connected to.
+        The origin's later requests then use the connection too, for as long as it is open.
+
+        :param httpcore.Request request: Request about to be sent
+        :return: bool, whether the request's origin is served by a coalesced connection
+        """
+
+        origin = request.url.origin
+        if origin.scheme != b"https" or self._uds is not None or request.extensions.get("sni_hostname"):
+            return False
+
+        # The origin may have a connection of its own already, or one it was coalesced onto before
+        profiles = self.get_profiles(request)
+        connections = [connection for connection in self._pool
+                       if connection.profiles == profiles and connection.can_handle_request(origin)]
+        if connections:
+            return any(connection.is_coalesced(origin) for connection in connections)
+
+        candidates = [connection for connection in self._pool if connection.can_coalesce(origin, profiles)]
+        if not candidates:
+            return False
+
+        # The name is resolved here as well as when a connection is made for it, which the resolver's cache makes up
+        # for. Failures are left to that connection to report.
+        timeout = request.extensions.get("timeout", {}).get("connect", None)
+        with anyio.move_on_after(timeout):
+            try:
+                address_info = await anyio.getaddrinfo(origin.host.decode("ascii"), origin.port,
+                                                       type=socket.SOCK_STREAM)
+            except OSError:
+                return False
+            addresses = {info[4][0] for info in address_info}
+
+            async with self._pool_lock:
+                for connection in candidates:
+                    if connection in self._pool and connection.can_coalesce(origin, profiles) and \
+                            connection.coalesce(origin, addresses):
+                        return True
+        return False
+
+    def get_profiles(self, request):
+        """
+        Return the (TLS profile, HTTP2 profile) pair a request asked for through its extensions, with the pool's own
+        TLS profile as the default. Profiles are compared by identity, so requests should share profile objects
+        (ProfileFactory does this for equal fingerprints) for their connections to be reused.
+        """
+        tls_profile = request.extensions.get('tls_profile', None) or self._ssl_context.get_profile()
+        return tls_profile, request.extensions.get('h2_profile', None)
+
+    def get_ssl_context(self, tls_profile, early_data=False):
+        """
+        Return the SSLContextProxy to connect with for the given TLS profile.
+
+        :param TLSProfile tls_profile: TLS profile of the request, None for the pool's own
+        :param bool early_data: Whether the connection may send the request as early data
+        :return: SSLContextProxy
+        """
+
+        if tls_profile is None:
+            tls_profile = self._ssl_context.get_profile()
+        if tls_profile is self._ssl_context.get_profile() and not early_data:
+            return self._ssl_context
+
+        # The pool's own context never sends early data, as it is also used for the proxied requests of AsyncTLSClient
+        ssl_context = self._profile_contexts.get((tls_profile, early_data))
+        if ssl_context is None:
+            ssl_context = self._ssl_context.with_profile(tls_profile, early_data=early_data)
+            self._profile_contexts.set((tls_profile, early_data), ssl_context)
+        return ssl_context
+
+    async def _attempt_to_acquire_connection(self, status):
+        # Same as AsyncConnectionPool._attempt_to_acquire_connection, except that connections must also match the
+        # request's profiles to be reused
+        origin = status.request.url.origin
+        profiles = self.get_profiles(status.request)
+
+        # If there are queued requests in front of us, then don't acquire a connection. We handle requests strictly
+        # in order.
+        waiting = [s for s in self._requests if s.connection is None]
+        if waiting and waiting[0] is not status:
+            return False
+
+        # Reuse an existing connection if one is currently available. Requests with early data turned off are kept off
+        # connections which sent early data, since they are sent again after a 425 Too Early.
+        early_data = status.request.extensions.get("early_data", True)
+        for idx, connection in enumerate(self._pool):
+            if connection.can_handle_request(origin) and connection.profiles == profiles and \
+                    connection.is_available() and (early_data or not connection.early_data):
+                self._pool.pop(idx)
+                self._pool.insert(0, connection)
+                status.set_connection(connection)
+                return True
+
+        # If the pool is currently full, attempt to close one idle connection, whichever profile it was for. A new
+        # HTTP2 connection counts as idle until its first stream is opened, so connections already handed to a request
+        # which has not got to use them yet are skipped. Requests for different profiles cannot share connections,
+        # so this happens far more often than with a plain httpcore pool.
+        if len(self._pool) >= self._max_connections:
+            assigned = {status.connection for status in self._requests}
+            for idx, connection in reversed(list(enumerate(self._pool))):
+                if connection.is_idle() and connection not in assigned:
+                    await connection.aclose()
+                    self._pool.pop(idx)
+                    break
+
+        # If the pool is still full, then we cannot acquire a connection.
+        if len(self._pool) >= self._max_connections:
+            return False
+
+        # Otherwise create a new connection. Only requests with a safe method are sent as early data, which an
+        # attacker can replay to the server (see SAFE_METHODS).
+        early_data = self._early_data and early_data and status.request.method in SAFE_METHODS
+        connection = self.create_connection(origin, profiles, early_data=early_data)
+        self._pool.insert(0, connection)
+        status.set_connection(connection)
+        return True
+
+    async def prewarm(self, request):
+        """
+        Open a connection for the request's origin and profiles and park it in the pool, without sending the
+        request. Unlike the connections made for requests, it never closes idle connections to make room for itself
+        and fails if the pool is full instead.
+
+        :param httpcore.Request request: Request to take the origin, profiles and timeouts from
+        :return: None
+        """
+
+        async with self._pool_lock:
+            if len(self._pool) >= self._max_connections:
+                raise ConnectionNotAvailable("the connection pool is full")
+
+            connection = self.create_connection(request.url.origin, self.get_profiles(request))
+            self._pool.insert(0, connection)
+
+        try:
+            await connection.prewarm(request)
+        except BaseException as exc:
+            with AsyncShieldCancellation():
+                await connection.aclose()
+                async with self._pool_lock:
+                    if connection in self._pool:
+                        self._pool.remove(connection)
+
+                    # Requests may have been queued behind the failed connection while the pool was full
+                    for status in self._requests:
+                        if status.connection is None and not await self._attempt_to_acquire_connection(status):
+                            break
+            raise exc
+
+    def create_connection(self, origin, profiles=(None, None), early_data=False):
+        return TLSHTTPConnection(
+            origin=origin,
+            ssl_context=self.get_ssl_context(profiles[0], early_data),
+            keepalive_expiry=self._keepalive_expiry,
+            http1=self._http1,
+            http2=self._http2,
+            retries=self._retries,
+            local_address=self._local_address,
+            uds=self._uds,
+            network_backend=self._network_backend,
+            socket_options=self._socket_options,
+            profiles=profiles,
+            metrics=self._metrics,
+            early_data=early_data,
+        )
+
+
+class AsyncTLSTransport(httpx.AsyncHTTPTransport):
+    """
+    Transport which makes the same connections as AsyncTLSClient, but through its own connection, stream and network
+    backend classes instead of the global patches. Traffic through other transports in the process does not go
+    through any of our code. To be used with a plain httpx.AsyncClient:
+
+        httpx.AsyncClient(transport=AsyncTLSTransport(tls_config, h2_config, http2=True))
+
+    tls_config and h2_config are only the defaults. Each request can ask for its own profiles through the
+    'tls_profile' and 'h2_profile' extensions, and gets a connection made with those profiles:
+
+        await client.get(url, extensions={'tls_profile': tls_config, 'h2_profile': h2_config})
+    """
+
+    def __init__(self, tls_config=None, h2_config=None, verify=True, cert=None, trust_env=True, http1=True,
+                 http2=False, limits=DEFAULT_LIMITS, uds=None, local_address=None, retries=0, session_cache=128,
+                 record_backend=RecordBackends.PYTHON, key_share_pool=None, metrics=False, max_profiles=128,
+                 flow_control=None, early_data=False, coalesce=False):
+        """
+        Takes the arguments of httpx.AsyncHTTPTransport (except for proxies, which are not supported) and the
+        profile and connection options of AsyncTLSClient. verify may also be an SSLContextProxy with the options
+        already applied, in which case tls_config and the other TLS options are not used.
+
+        :param int max_profiles: Number of TLS profiles besides tls_config to keep an SSL context proxy around for.
+            The connection limits in limits apply to all profiles together.
+        :param AdaptiveFlowControl flow_control: Tune the HTTP2 flow control windows of each connection once it is
+            open, with the given bounds (or the default ones if True). Requests can also ask for it through the
+            'h2_flow_control' extension.
+        :param bool early_data: Send the first request of a new connection (and for HTTP2, the connection preface)
+            as TLS 1.3 early data when it resumes a session whose ticket allows it, saving the round trip of the
+            handshake. Only GET, HEAD and OPTIONS requests are sent that way, since an attacker can replay early data
+            to the server. They are sent again once the handshake completes if the server rejects the early data,
+            and on another connection, without early data, if the server answers 425 Too Early. Requests can turn it
+            off with the 'early_data' extension set to False.
+        :param bool coalesce: Let requests for an origin without a connection of its own use an HTTP2 connection
+            made for the same profiles to another origin, if its certificate is valid for the origin and the origin
+            resolves to the address it is connected to (connection coalescing, as browsers do). This is a TLS option,
+            which comes from verify if it is an SSLContextProxy.
+        """
+
+        if isinstance(verify, SSLContextProxy):
+            ssl_context = verify
+        else:
+            ssl_context = create_ssl_context_proxy(tls_config, verify=verify, cert=cert, trust_env=trust_env,
+                                                   session_cache=session_cache, record_backend=record_backend,
+                                                   key_share_pool=key_share_pool, metrics=metrics, coalesce=coalesce)
+        self.h2_config = h2_config
+        self.flow_control = AdaptiveFlowControl() if flow_control is True else flow_control
+        self.session_cache = ssl_context.get_session_cache()
+        self.metrics = ssl_context.get_metrics()
+
+        # httpx.AsyncHTTPTransport.__init__ only creates the pool, which we replace with ours, so it is not called
+        self._pool = TLSConnectionPool(
+            ssl_context=ssl_context,
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=http1,
+            http2=http2,
+            uds=uds,
+            local_address=local_address,
+            retries=retries,
+            metrics=self.metrics,
+            max_profiles=max_profiles,
+            early_data=early_data,
+        )
+
+    async def handle_async_request(self, request):
+        if self.h2_config is not None and request.extensions.get('h2_profile', None) is None:
+            request.extensions['h2_profile'] = self.h2_config
+        if self.flow_control is not None and request.extensions.get('h2_flow_control', None) is None:
+            request.extensions['h2_flow_control'] = self.flow_control
+        return await super().handle_async_request(request)
+
+    async def prewarm(self, origins, connections_per_origin=1, tls_profile=None, h2_profile=None, timeout=None):
+        """
+        Open connections to the given origins ahead of time and park them in the pool, so that the first requests to
+        each origin do not have to wait for the handshake. HTTP2 connections also send their connection preface
+        (with the HTTP2 profile's SETTINGS and priority frames) straight away. All connections are opened
+        concurrently, and count towards the pool limits like any other.
+
+        :param origins: Iterable of origins (str or httpx.URL) to connect to, such as "https://example.com"
+        :param int connections_per_origin: Number of connections to open to each origin
+        :param TLSProfile tls_profile: TLS profile for the connections, the transport's default if None
+        :param Http2Profile h2_profile: HTTP2 profile for the connections, the transport's default if None
+        :param dict timeout: Timeouts for the connections, as in the 'timeout' request extension
+        :return: dict mapping each origin as passed to a dict with the number of connections opened ('connected')
+            and failed ('failed'), the duration of each successful one in seconds ('durations') and the exception
+            raised by each failed one ('errors')
+        """
+
+        extensions = {
+            'timeout': timeout or {},
+            'tls_profile': tls_profile,
+            'h2_profile': h2_profile or self.h2_config,
+        }
+        results = {}
+
+        async def prewarm_connection(request, result):
+            start = time.perf_counter()
+            try:
+                with map_httpcore_exceptions():
+                    await self._pool.prewarm(request)
+            except Exception as exc:
+                result['failed'] += 1
+                result['errors'].append(exc)
+            else:
+                result['connected'] += 1
+                result['durations'].append(time.perf_counter() - start)
+
+        async with anyio.create_task_group() as tg:
+            for origin in origins:
+                url = httpx.URL(origin)
+                request = httpcore.Request(
+                    method=b"GET",
+                    url=httpcore.URL(scheme=url.raw_scheme, host=url.raw_host, port=url.port, target=b"/"),
+                    extensions=extensions,
+                )
+                result = results.setdefault(origin, {'connected': 0, 'failed': 0, 'durations': [], 'errors': []})
+                for _ in range(connections_per_origin):
+                    tg.start_soon(prewarm_connection, request, result)
+
+        return results
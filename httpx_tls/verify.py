@@ -0,0 +1,610 @@
+import calendar
+import hashlib
+import ipaddress
+import os
+import re
+import ssl
+import threading
+import time
+from tlslite.constants import HashAlgorithm
+from tlslite.x509 import X509
+from httpx_tls.cache import LRUCache
+
+__all__ = ["Certificate",
+           "TrustStore",
+           "get_subject_alt_names",
+           "get_trust_store",
+           "match_hostname"]
+
+# Certificate verification is done in pure python, like the rest of the handshake. To keep it off most handshakes:
+#
+# - the CA certificates of an SSL context are only parsed the first time a chain is verified against them, into an
+#   index by subject and subject key identifier which every client with the same CA certificates shares
+# - the chains which were verified are cached along with the hostname they were verified for, so that later
+#   handshakes with the same certificates only need to hash them
+#
+# Failures raise ssl.SSLCertVerificationError with the same verify codes and messages as OpenSSL, so they look the
+# same to callers as they would with the ssl module.
+
+MAX_CHAIN_LENGTH = 10
+
+OID_BASIC_CONSTRAINTS = bytes.fromhex('551d13')
+OID_KEY_USAGE = bytes.fromhex('551d0f')
+OID_EXT_KEY_USAGE = bytes.fromhex('551d25')
+OID_SUBJECT_ALT_NAME = bytes.fromhex('551d11')
+OID_SUBJECT_KEY_ID = bytes.fromhex('551d0e')
+OID_AUTHORITY_KEY_ID = bytes.fromhex('551d23')
+OID_NAME_CONSTRAINTS = bytes.fromhex('551d1e')
+OID_SERVER_AUTH = bytes.fromhex('2b06010505070301')
+
+# Policy extensions are not processed (neither does OpenSSL unless asked to), but may be marked critical
+KNOWN_EXTENSIONS = frozenset([OID_BASIC_CONSTRAINTS, OID_KEY_USAGE, OID_EXT_KEY_USAGE, OID_SUBJECT_ALT_NAME,
+                              OID_SUBJECT_KEY_ID, OID_AUTHORITY_KEY_ID, OID_NAME_CONSTRAINTS,
+                              bytes.fromhex('551d20'),  # certificatePolicies
+                              bytes.fromhex('551d24'),  # policyConstraints
+                              bytes.fromhex('551d36')])  # inhibitAnyPolicy
+
+KEY_USAGE_CERT_SIGN = 0x04  # keyCertSign, bit 5 of the first byte
+
+# Hashes too weak for the signature of anything but a trust anchor (which is trusted as is)
+WEAK_HASHES = frozenset([HashAlgorithm.md5, HashAlgorithm.sha1])
+
+PEM_CERTIFICATE = re.compile(rb'-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----', re.DOTALL)
+
+
+class VerifyCodes:
+    """The OpenSSL verify codes (and messages) of the failures we report"""
+
+    CERT_NOT_YET_VALID = (9, "certificate is not yet valid")
+    CERT_HAS_EXPIRED = (10, "certificate has expired")
+    DEPTH_ZERO_SELF_SIGNED_CERT = (18, "self-signed certificate")
+    SELF_SIGNED_CERT_IN_CHAIN = (19, "self-signed certificate in certificate chain")
+    UNABLE_TO_GET_ISSUER_CERT_LOCALLY = (20, "unable to get local issuer certificate")
+    CERT_SIGNATURE_FAILURE = (7, "certificate signature failure")
+    INVALID_CA = (24, "invalid CA certificate")
+    PATH_LENGTH_EXCEEDED = (25, "path length constraint exceeded")
+    INVALID_PURPOSE = (26, "unsuitable certificate purpose")
+    UNHANDLED_CRITICAL_EXTENSION = (34, "unhandled critical extension")
+    PERMITTED_VIOLATION = (47, "permitted subtree violation")
+    EXCLUDED_VIOLATION = (48, "excluded subtree violation")
+    HOSTNAME_MISMATCH = (62, "Hostname mismatch")
+    CA_MD_TOO_WEAK = (68, "CA signature digest algorithm too weak")
+    NO_PEER_CERTIFICATE = (0, "peer did not return a certificate")
+
+
+def verification_error(code, detail=None):
+    """
+    :param tuple code: One of the VerifyCodes
+    :param str detail: Appended to the message, like the ssl module does for hostname mismatches
+    :return: ssl.SSLCertVerificationError
+    """
+
+    verify_code, verify_message = code
+    message = f"{verify_message}, {detail}" if detail else verify_message
+    exc = ssl.SSLCertVerificationError(1, f"[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed: {message}")
+    exc.reason = 'CERTIFICATE_VERIFY_FAILED'
+    exc.library = 'SSL'
+    exc.verify_code = verify_code
+    exc.verify_message = message
+    return exc
+
+
+def _der_items(data):
+    """
+    Split DER encoded data into its elements
+
+    :return: list of (tag, value, encoding) tuples, where encoding is the whole element
+    """
+
+    items = []
+    pos = 0
+    while pos < len(data):
+        start = pos
+        tag = data[pos]
+        length = data[pos + 1]
+        pos += 2
+        if length & 0x80:
+            size = length & 0x7f
+            length = int.from_bytes(data[pos:pos + size], 'big')
+            pos += size
+        items.append((tag, data[pos:pos + length], data[start:pos + length]))
+        pos += length
+    return items
+
+
+def _parse_time(tag, value):
+    value = value.decode('ascii')
+    if tag == 0x17:  # UTCTime, years 1950 to 2049
+        year = int(value[:2])
+        value = str(year + (2000 if year < 50 else 1900)) + value[2:]
+    return calendar.timegm(time.strptime(value, '%Y%m%d%H%M%SZ'))
+
+
+def _parse_names(data):
+    """Return the dNSNames (lowercase) and iPAddresses in a SEQUENCE OF GeneralName"""
+
+    dns_names = []
+    ip_addresses = []
+    for tag, value, _ in _der_items(data):
+        if tag == 0x82:
+            dns_names.append(value.decode('ascii').lower())
+        elif tag == 0x87:
+            ip_addresses.append(bytes(value))
+    return dns_names, ip_addresses
+
+
+class Certificate:
+    """The parts of an X.509 certificate needed to verify chains, parsed from its DER encoding"""
+
+    def __init__(self, der):
+        """
+        :param bytes der: DER encoded certificate
+        :raise ValueError: If the certificate cannot be parsed
+        """
+
+        self.der = bytes(der)
+        self.fingerprint = hashlib.sha256(self.der).digest()
+
+        # tlslite parses the public key and signature algorithm, and the rest is done here
+        try:
+            x509 = X509()
+            x509.parseBinary(self.der)
+            self.public_key = x509.publicKey
+            self.signature_algorithm = x509.sigalg
+
+            (_, certificate, _), = _der_items(self.der)
+            (_, tbs, self.tbs), _, (_, signature, _) = _der_items(certificate)
+            self.signature = bytearray(signature[1:])  # BIT STRING, leading byte is the number of unused bits
+
+            fields = _der_items(tbs)
+            if fields[0][0] == 0xa0:  # explicit version
+                fields = fields[1:]
+            self.issuer = fields[2][2]
+            self.subject = fields[4][2]
+            self.not_before, self.not_after = (_parse_time(tag, value) for tag, value, _ in _der_items(fields[3][1]))
+
+            self.has_basic_constraints = False
+            self.is_ca = False
+            self.path_length = None
+            self.key_usage = None
+            self.ext_key_usage = None
+            self.dns_names = []
+            self.ip_addresses = []
+            self.key_id = None
+            self.authority_key_id = None
+            self.permitted = None
+            self.excluded = None
+            self.unhandled_critical = False
+
+            for tag, value, _ in fields[6:]:
+                if tag == 0xa3:
+                    (_, extensions, _), = _der_items(value)
+                    for _, extension, _ in _der_items(extensions):
+                        self._parse_extension(_der_items(extension))
+        except Exception as e:
+            raise ValueError(f"cannot parse certificate ({e!r})")
+
+    def _parse_extension(self, parts):
+        oid = parts[0][1]
+        critical = len(parts) == 3 and parts[1][1] == b'\xff'
+        value = parts[-1][1]
+
+        if critical and oid not in KNOWN_EXTENSIONS:
+            self.unhandled_critical = True
+        elif oid == OID_BASIC_CONSTRAINTS:
+            self.has_basic_constraints = True
+            for tag, item, _ in _der_items(_der_items(value)[0][1]):
+                if tag == 0x01:
+                    self.is_ca = item == b'\xff'
+                elif tag == 0x02:
+                    self.path_length = int.from_bytes(item, 'big')
+        elif oid == OID_KEY_USAGE:
+            bits = _der_items(value)[0][1]
+            self.key_usage = bits[1] if len(bits) > 1 else 0
+        elif oid == OID_EXT_KEY_USAGE:
+            self.ext_key_usage = [bytes(item) for _, item, _ in _der_items(_der_items(value)[0][1])]
+        elif oid == OID_SUBJECT_ALT_NAME:
+            self.dns_names, self.ip_addresses = _parse_names(_der_items(value)[0][1])
+        elif oid == OID_SUBJECT_KEY_ID:
+            self.key_id = bytes(_der_items(value)[0][1])
+        elif oid == OID_AUTHORITY_KEY_ID:
+            for tag, item, _ in _der_items(_der_items(value)[0][1]):
+                if tag == 0x80:
+                    self.authority_key_id = bytes(item)
+        elif oid == OID_NAME_CONSTRAINTS:
+            for tag, subtrees, _ in _der_items(_der_items(value)[0][1]):
+                names = [], []
+                for _, subtree, _ in _der_items(subtrees):
+                    dns_names, ip_addresses = _parse_names(_der_items(subtree)[0][2])
+                    names[0].extend(dns_names)
+                    names[1].extend(ip_addresses)
+                if tag == 0xa0:
+                    self.permitted = names
+                elif tag == 0xa1:
+                    self.excluded = names
+
+    @property
+    def self_issued(self):
+        return self.issuer == self.subject
+
+    def check_validity(self, now):
+        if now < self.not_before:
+            raise verification_error(VerifyCodes.CERT_NOT_YET_VALID)
+        if now > self.not_after:
+            raise verification_error(VerifyCodes.CERT_HAS_EXPIRED)
+
+    def is_signed_by(self, issuer):
+        """
+        Check the signature of this certificate with the public key of the issuer
+
+        :param Certificate issuer: Certificate of the supposed issuer
+        :return: bool
+        """
+
+        hash_id, signature_id = self.signature_algorithm
+        try:
+            # TLS 1.3 style schemes: RSA-PSS (4 to 6) and EdDSA (7 and 8)
+            if hash_id == 8:
+                if signature_id in (7, 8):
+                    return issuer.public_key.hashAndVerify(self.signature, self.tbs)
+                hash_name = HashAlgorithm.toRepr(signature_id)
+                return issuer.public_key.hashAndVerify(self.signature, self.tbs, 'PSS', hash_name,
+                                                       hashlib.new(hash_name).digest_size)
+
+            hash_name = HashAlgorithm.toRepr(hash_id)
+            if signature_id == 1:
+                return issuer.public_key.hashAndVerify(self.signature, self.tbs, 'PKCS1', hash_name)
+            if signature_id == 2:
+                return issuer.public_key.hashAndVerify(self.signature, self.tbs, hash_name)
+            return issuer.public_key.hashAndVerify(self.signature, self.tbs, None, hash_name)
+        except Exception:
+            # Mismatched key types and malformed signatures
+            return False
+
+    @property
+    def weak_signature(self):
+        return self.signature_algorithm[0] in WEAK_HASHES
+
+    def matches_hostname(self, hostname):
+        return match_hostname(self.dns_names, self.ip_addresses, hostname)
+
+
+def match_hostname(dns_names, ip_addresses, hostname):
+    """
+    :param list dns_names: dNSNames (lowercase) of a certificate's subjectAltName extension
+    :param list ip_addresses: iPAddresses of the extension, packed
+    :param str hostname: Hostname or IP address the certificate should be valid for
+    :return: bool
+    """
+
+    try:
+        ip = ipaddress.ip_address(hostname)
+    except ValueError:
+        pass
+    else:
+        return ip.packed in ip_addresses
+
+    hostname = hostname.rstrip('.').lower()
+    for name in dns_names:
+        # Only a wildcard making up the whole leftmost label of a name with at least two more labels is accepted, like
+        # the ssl module does
+        if name.startswith('*.') and '.' in name[2:]:
+            host_label, _, host_rest = hostname.partition('.')
+            if host_label and host_rest == name[2:]:
+                return True
+        elif name == hostname:
+            return True
+    return False
+
+
+def get_subject_alt_names(der):
+    """
+    Read the names a certificate is valid for, without parsing the rest of it like Certificate does
+
+    :param bytes der: DER encoded certificate
+    :raise ValueError: If the certificate cannot be parsed
+    :return: tuple of the dNSNames (lowercase) and iPAddresses (packed) of its subjectAltName extension
+    """
+
+    try:
+        (_, certificate, _), = _der_items(der)
+        tbs = _der_items(certificate)[0][1]
+        for tag, value, _ in _der_items(tbs):
+            if tag != 0xa3:
+                continue
+            (_, extensions, _), = _der_items(value)
+            for _, extension, _ in _der_items(extensions):
+                parts = _der_items(extension)
+                if parts[0][1] == OID_SUBJECT_ALT_NAME:
+                    return _parse_names(_der_items(parts[-1][1])[0][1])
+    except Exception as e:
+        raise ValueError(f"cannot parse certificate ({e!r})")
+    return [], []
+
+
+def _dns_name_in_subtree(name, base):
+    base = base.lower()
+    if base.startswith('.'):
+        return name.endswith(base)
+    return name == base or name.endswith('.' + base)
+
+
+def _ip_in_subtree(address, base):
+    # The base of an iPAddress constraint is the address followed by the mask
+    size = len(base) // 2
+    if len(address) != size:
+        return False
+    return all(a & m == b & m for a, b, m in zip(address, base[:size], base[size:]))
+
+
+def _check_name_constraints(leaf, issuer):
+    names = [name[2:] if name.startswith('*.') else name for name in leaf.dns_names]
+
+    if issuer.permitted is not None:
+        dns_bases, ip_bases = issuer.permitted
+        if dns_bases and not all(any(_dns_name_in_subtree(name, base) for base in dns_bases) for name in names):
+            raise verification_error(VerifyCodes.PERMITTED_VIOLATION)
+        if ip_bases and not all(any(_ip_in_subtree(ip, base) for base in ip_bases) for ip in leaf.ip_addresses):
+            raise verification_error(VerifyCodes.PERMITTED_VIOLATION)
+
+    if issuer.excluded is not None:
+        dns_bases, ip_bases = issuer.excluded
+        if any(_dns_name_in_subtree(name, base) for name in names for base in dns_bases):
+            raise verification_error(VerifyCodes.EXCLUDED_VIOLATION)
+        if any(_ip_in_subtree(ip, base) for ip in leaf.ip_addresses for base in ip_bases):
+            raise verification_error(VerifyCodes.EXCLUDED_VIOLATION)
+
+
+class TrustStore:
+    """
+    The CA certificates chains are verified against, indexed by subject and subject key identifier, along with a cache
+    of the chains verified against them. The certificates are only parsed once the first chain is verified.
+    """
+
+    def __init__(self, certificates, cache_size=1024):
+        """
+        :param certificates: Iterable of DER encoded CA certificates
+        :param int cache_size: Maximum number of verified chains to remember
+        """
+
+        self._ders = list(certificates)
+        self._by_subject = None
+        self._by_key_id = None
+        self._lock = threading.Lock()
+        self.verified_chains = LRUCache(maxsize=cache_size)
+
+    def __len__(self):
+        return len(self._ders)
+
+    @classmethod
+    def load_certificates(cls, context, locations=()):
+        """
+        Return the CA certificates loaded in an SSL context. The context only lists the CA certificates it has loaded,
+        while OpenSSL also trusts the other certificates of a cafile (such as a self-signed server certificate) and
+        only loads those in a capath directory when a chain needs them, so these files are read here.
+
+        :param ssl.SSLContext context: The SSL context
+        :param locations: Files and directories loaded through load_verify_locations
+        :return: list of DER encoded certificates
+        """
+
+        certificates = context.get_ca_certs(binary_form=True)
+        for location in locations:
+            if os.path.isdir(location):
+                paths = [os.path.join(location, name) for name in sorted(os.listdir(location))]
+            else:
+                paths = [location]
+            for path in paths:
+                if not os.path.isfile(path):
+                    continue
+                with open(path, 'rb') as f:
+                    data = f.read()
+                for pem in PEM_CERTIFICATE.findall(data):
+                    certificates.append(ssl.PEM_cert_to_DER_cert(pem.decode('ascii')))
+        # The CA certificates of a cafile are listed by the context as well
+        return list(dict.fromkeys(certificates))
+
+    def _index(self):
+        with self._lock:
+            if self._by_subject is not None:
+                return
+
+            by_subject = {}
+            by_key_id = {}
+            for der in self._ders:
+                try:
+                    certificate = Certificate(der)
+                except ValueError:
+                    # OpenSSL skips what it cannot use as well, such as keys tlslite does not support
+                    continue
+                by_subject.setdefault(certificate.subject, []).append(certificate)
+                if certificate.key_id is not None:
+                    by_key_id.setdefault(certificate.key_id, []).append(certificate)
+
+            self._by_key_id = by_key_id
+            self._by_subject = by_subject
+
+    def find_issuers(self, certificate):
+        """
+        :param Certificate certificate: Certificate to find the issuer of
+        :return: list of the trusted certificates which may have issued it
+        """
+
+        if self._by_subject is None:
+            self._index()
+
+        if certificate.authority_key_id is not None:
+            issuers = self._by_key_id.get(certificate.authority_key_id)
+            if issuers:
+                return [issuer for issuer in issuers if issuer.subject == certificate.issuer]
+        return self._by_subject.get(certificate.issuer, [])
+
+    def verify(self, chain, hostname, check_hostname=True, now=None):
+        """
+        Verify a certificate chain sent by a server
+
+        :param list chain: DER encoded certificates, starting with the server's own
+        :param str hostname: Hostname the server was connected to
+        :param bool check_hostname: Whether the server's certificate must be valid for the hostname
+        :param float now: Time to verify the chain at, defaults to the current time
+        :raise ssl.SSLCertVerificationError: If the chain is not valid
+        :return: None
+        """
+
+        if not chain:
+            raise verification_error(VerifyCodes.NO_PEER_CERTIFICATE)
+        if now is None:
+            now = time.time()
+
+        key = (hostname if check_hostname else None,) + tuple(hashlib.sha256(der).digest() for der in chain)
+        validity = self.verified_chains.get(key)
+        if validity is not None and validity[0] <= now <= validity[1]:
+            return
+
+        certificates = []
+        for der in chain[:MAX_CHAIN_LENGTH]:
+            try:
+                certificates.append(Certificate(der))
+            except ValueError:
+                raise verification_error(VerifyCodes.CERT_SIGNATURE_FAILURE, "cannot parse certificate")
+
+        leaf = certificates[0]
+        if check_hostname:
+            if not hostname or not leaf.matches_hostname(hostname):
+                raise verification_error(VerifyCodes.HOSTNAME_MISMATCH,
+                                         f"certificate is not valid for '{hostname}'.")
+        # Like OpenSSL, anyExtendedKeyUsage alone does not make a server certificate
+        if leaf.ext_key_usage is not None and OID_SERVER_AUTH not in leaf.ext_key_usage:
+            raise verification_error(VerifyCodes.INVALID_PURPOSE)
+
+        path = self._build_path(leaf, certificates[1:], [leaf], now)
+        self.verified_chains.set(key, (max(c.not_before for c in path), min(c.not_after for c in path)))
+
+    def _build_path(self, certificate, intermediates, path, now):
+        """
+        Find a path from the certificate to a trusted certificate, trying trusted issuers before the intermediates
+        sent by the server
+
+        :return: list of the certificates in the path, from the leaf to the trust anchor
+        """
+
+        certificate.check_validity(now)
+        if certificate.unhandled_critical:
+            raise verification_error(VerifyCodes.UNHANDLED_CRITICAL_EXTENSION)
+
+        # Trust stores may have more than one certificate with the same subject (an expired root and its renewal, for
+        # example), so a trusted issuer which cannot be used is no reason to stop looking
+        error = None
+        for issuer in self.find_issuers(certificate):
+            try:
+                # A certificate which is trusted itself does not need a trusted issuer (OpenSSL checks its signature
+                # all the same)
+                if issuer.fingerprint != certificate.fingerprint:
+                    self._check_issuer(certificate, issuer, path, trusted=True)
+                if certificate.is_signed_by(issuer):
+                    if issuer.fingerprint != certificate.fingerprint:
+                        issuer.check_validity(now)
+                        return path + [issuer]
+                    return path
+            except ssl.SSLCertVerificationError as e:
+                error = error or e
+
+        for issuer in intermediates:
+            if issuer.subject != certificate.issuer or issuer in path or len(path) >= MAX_CHAIN_LENGTH:
+                continue
+            try:
+                self._check_issuer(certificate, issuer, path, trusted=False)
+                if not certificate.is_signed_by(issuer):
+                    raise verification_error(VerifyCodes.CERT_SIGNATURE_FAILURE)
+                return self._build_path(issuer, intermediates, path + [issuer], now)
+            except ssl.SSLCertVerificationError as e:
+                # Servers may send more than one candidate (cross-signed certificates)
+                error = error or e
+
+        if error is not None:
+            raise error
+        if certificate.self_issued:
+            code = VerifyCodes.DEPTH_ZERO_SELF_SIGNED_CERT if len(path) == 1 else VerifyCodes.SELF_SIGNED_CERT_IN_CHAIN
+            raise verification_error(code)
+        raise verification_error(VerifyCodes.UNABLE_TO_GET_ISSUER_CERT_LOCALLY)
+
+    @staticmethod
+    def _check_issuer(certificate, issuer, path, trusted):
+        # Trust anchors without basic constraints are old (version 1) roots, which OpenSSL accepts as well
+        if issuer.has_basic_constraints or not trusted:
+            if not issuer.is_ca:
+                raise verification_error(VerifyCodes.INVALID_CA)
+        if issuer.key_usage is not None and not issuer.key_usage & KEY_USAGE_CERT_SIGN:
+            raise verification_error(VerifyCodes.INVALID_CA)
+
+        # Self-issued intermediates do not count towards the path length
+        ca_below = sum(1 for c in path[1:] if not c.self_issued)
+        if issuer.path_length is not None and ca_below > issuer.path_length:
+            raise verification_error(VerifyCodes.PATH_LENGTH_EXCEEDED)
+
+        if certificate.weak_signature:
+            raise verification_error(VerifyCodes.CA_MD_TOO_WEAK)
+
+        _check_name_constraints(path[0], issuer)
+
+
+_trust_stores = LRUCache(maxsize=16)
+_trust_stores_by_locations = LRUCache(maxsize=16)
+
+
+def _locations_key(locations):
+    """
+    Identify the contents of CA files and directories by their paths, modification times and sizes, without reading
+    them
+
+    :return: tuple, or None if a location cannot be read
+    """
+
+    key = []
+    try:
+        for location in locations:
+            location = os.path.abspath(location)
+            stat = os.stat(location)
+            key.append((location, stat.st_mtime_ns, stat.st_size))
+            if os.path.isdir(location):
+                for name in sorted(os.listdir(location)):
+                    stat = os.stat(os.path.join(location, name))
+                    key.append((name, stat.st_mtime_ns, stat.st_size))
+    except OSError:
+        return None
+    return tuple(key)
+
+
+def get_trust_store(context, locations=(), from_locations=False):
+    """
+    Return the trust store for the CA certificates of an SSL context. Contexts with the same CA certificates share the
+    same store, and with it the index and the cache of verified chains.
+
+    :param ssl.SSLContext context: The SSL context
+    :param locations: Files and directories loaded through load_verify_locations
+    :param bool from_locations: Whether all the CA certificates of the context were loaded from the locations. The
+        store is then shared by contexts which loaded the same locations, and found without reading them again as
+        long as they are not modified.
+    :return: TrustStore
+    """
+
+    locations_key = _locations_key(locations) if from_locations and locations else None
+    if locations_key is not None:
+        trust_store = _trust_stores_by_locations.get(locations_key)
+        if trust_store is not None:
+            return trust_store
+
+    certificates = TrustStore.load_certificates(context, locations)
+    digest = hashlib.sha256()
+    for der in certificates:
+        digest.update(len(der).to_bytes(4, 'big'))
+        digest.update(der)
+    key = digest.digest()
+
+    trust_store = _trust_stores.get(key)
+    if trust_store is None:
+        trust_store = TrustStore(certificates)
+        _trust_stores.set(key, trust_store)
+    if locations_key is not None:
+        _trust_stores_by_locations.set(locations_key, trust_store)
+    return trust_store
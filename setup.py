@@ -27,5 +27,6 @@ setup(
                       'trio',
                       'user-agents',
                       'h2',
-                      'anyio']
+                      'anyio'],
+    extras_require={'cryptography': ['cryptography']}
 )
\ No newline at end of file
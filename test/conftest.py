@@ -0,0 +1,16 @@
+import pytest
+from servers import generate_certificate, start_server
+
+
+@pytest.fixture(scope='session')
+def certificate(tmp_path_factory):
+    """Self-signed certificate and key files for localhost"""
+    return generate_certificate(str(tmp_path_factory.mktemp('certificate')))
+
+
+@pytest.fixture(scope='session')
+def server(certificate):
+    """Port of the local TLS + HTTP/2 test server, which uses the certificate"""
+    process, port = start_server(*certificate)
+    yield port
+    process.terminate()
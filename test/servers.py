@@ -0,0 +1,384 @@
+"""
+Local servers the tests connect to, each running in a process of its own: an HTTP/2 and HTTP/1.1 server on the ssl
+module, and one on OpenSSL driven through ctypes, which unlike the ssl module accepts TLS 1.3 early data.
+
+Both answer GET /bytes/<n> with n bytes, POST /echo with the request body, GET /stats with the counts of the requests
+they answered (as JSON), and every other request with an empty body.
+"""
+import asyncio
+import ctypes
+import ctypes.util
+import datetime
+import http
+import json
+import multiprocessing
+import os
+import socket
+import ssl
+import threading
+import h2.config
+import h2.connection
+import h2.events
+import h2.exceptions
+
+
+def generate_certificate(directory, names=('localhost',)):
+    """
+    Create a self-signed certificate with the cryptography package
+
+    :param tuple names: DNS names the certificate is valid for, the first of which is also its common name
+    :return: tuple of certificate and key file paths
+    """
+
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ec
+
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, names[0])])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (x509.CertificateBuilder()
+            .subject_name(name)
+            .issuer_name(name)
+            .public_key(key.public_key())
+            .serial_number(x509.random_serial_number())
+            .not_valid_before(now - datetime.timedelta(days=1))
+            .not_valid_after(now + datetime.timedelta(days=1))
+            .add_extension(x509.SubjectAlternativeName([x509.DNSName(name) for name in names]), critical=False)
+            .sign(key, hashes.SHA256()))
+
+    with open(certfile, 'wb') as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(keyfile, 'wb') as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                  serialization.NoEncryption()))
+    return certfile, keyfile
+
+
+# Requests answered by the server process (and how many of those from early data), and requests answered with 425
+STATS = {'requests': 0, 'early': 0, 'too_early': 0}
+STATS_LOCK = threading.Lock()
+
+
+class HTTPServerProtocol(asyncio.Protocol):
+    """
+    Speaks HTTP/2 when negotiated through ALPN and a bare-bones HTTP/1.1 otherwise. Requests are answered once their
+    body has been received.
+    """
+
+    early = False  # Whether the data being received is early data
+    too_early = False  # Whether to answer requests received as early data with 425 Too Early
+
+    def __init__(self):
+        self.transport = None
+        self.conn = None
+        self.requests = {}  # Method, path and body received so far, by stream id
+        self.pending = {}  # Response data waiting for flow control window, by stream id
+        self.buffer = b''
+
+    def connection_made(self, transport):
+        self.transport = transport
+        ssl_object = transport.get_extra_info('ssl_object')
+        if ssl_object is not None and ssl_object.selected_alpn_protocol() == 'h2':
+            self.conn = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False,
+                                                                             header_encoding='utf-8'))
+            self.conn.initiate_connection()
+            self.transport.write(self.conn.data_to_send())
+
+    def data_received(self, data):
+        if self.conn is None:
+            return self._http11_data_received(data)
+
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                headers = dict(event.headers)
+                self.requests[event.stream_id] = (headers[':method'], headers.get(':path', '/'), bytearray())
+                if event.stream_ended is not None:
+                    self._respond(event.stream_id)
+            elif isinstance(event, h2.events.DataReceived):
+                self.requests[event.stream_id][2].extend(event.data)
+                self.conn.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+                if event.stream_ended is not None:
+                    self._respond(event.stream_id)
+            elif isinstance(event, h2.events.WindowUpdated):
+                for stream_id in list(self.pending):
+                    self._send_pending(stream_id)
+            elif isinstance(event, h2.events.StreamReset):
+                self.pending.pop(event.stream_id, None)
+
+        self.transport.write(self.conn.data_to_send())
+
+    def response_for(self, method, path, body):
+        """:return: tuple of the status and body of the response to a request"""
+
+        with STATS_LOCK:
+            if path == '/stats':
+                return 200, json.dumps(STATS).encode()
+            if self.early and self.too_early:
+                STATS['too_early'] += 1
+                return 425, b''
+            STATS['requests'] += 1
+            STATS['early'] += self.early
+
+        if path.startswith('/bytes/'):
+            return 200, bytes(int(path[len('/bytes/'):]))
+        if method == 'POST' and path == '/echo':
+            return 200, bytes(body)
+        return 200, b''
+
+    def _respond(self, stream_id):
+        status, body = self.response_for(*self.requests.pop(stream_id))
+        self.conn.send_headers(stream_id, [(':status', str(status)), ('content-length', str(len(body)))],
+                               end_stream=not body)
+        if body:
+            self.pending[stream_id] = memoryview(body)
+            self._send_pending(stream_id)
+
+    def _send_pending(self, stream_id):
+        data = self.pending[stream_id]
+        while data:
+            window = min(self.conn.local_flow_control_window(stream_id), self.conn.max_outbound_frame_size)
+            if window <= 0:
+                self.pending[stream_id] = data
+                return
+
+            chunk, data = data[:window], data[window:]
+            self.conn.send_data(stream_id, chunk.tobytes(), end_stream=not data)
+
+        del self.pending[stream_id]
+
+    def _http11_data_received(self, data):
+        self.buffer += data
+        while b'\r\n\r\n' in self.buffer:
+            head, rest = self.buffer.split(b'\r\n\r\n', 1)
+            lines = head.split(b'\r\n')
+            method, path = lines[0].decode().split(' ')[:2]
+            headers = dict(line.decode().lower().split(': ', 1) for line in lines[1:] if b': ' in line)
+            length = int(headers.get('content-length', 0))
+            if len(rest) < length:
+                return
+
+            body, self.buffer = rest[:length], rest[length:]
+            status, body = self.response_for(method, path, body)
+            self.transport.write(b'HTTP/1.1 %d %s\r\ncontent-length: %d\r\n\r\n'
+                                 % (status, http.HTTPStatus(status).phrase.encode(), len(body)) + body)
+
+
+def _start(target, *args):
+    parent_conn, child_conn = multiprocessing.Pipe()
+    process = multiprocessing.Process(target=target, args=args + (child_conn,), daemon=True)
+    process.start()
+    if not parent_conn.poll(30):
+        process.terminate()
+        raise RuntimeError("the test server did not start")
+    return process, parent_conn.recv()
+
+
+def _serve(certfile, keyfile, conn):
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    context.set_alpn_protocols(['h2', 'http/1.1'])
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        server = await loop.create_server(HTTPServerProtocol, '127.0.0.1', 0, ssl=context, backlog=4096)
+        conn.send(server.sockets[0].getsockname()[1])
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def start_server(certfile, keyfile):
+    """
+    Start the HTTP server on the ssl module
+
+    :return: tuple of the process and the port it listens on
+    """
+
+    return _start(_serve, certfile, keyfile)
+
+
+# Early data server
+
+SSL_FILETYPE_PEM = 1
+SSL_READ_EARLY_DATA_ERROR = 0
+SSL_READ_EARLY_DATA_FINISH = 2
+SSL_TLSEXT_ERR_OK = 0
+SSL_TLSEXT_ERR_NOACK = 3
+OPENSSL_NPN_NEGOTIATED = 1
+MAX_EARLY_DATA = 16384
+SSL_OP_NO_ANTI_REPLAY = 1 << 24
+
+ALPN_PROTOCOLS = b'\x02h2\x08http/1.1'
+ALPN_SELECT_CB = ctypes.CFUNCTYPE(ctypes.c_int, ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p),
+                                  ctypes.POINTER(ctypes.c_ubyte), ctypes.c_void_p, ctypes.c_uint, ctypes.c_void_p)
+
+
+def load_libssl():
+    """
+    :return: ctypes.CDLL of libssl, or None if there is none with early data support
+    """
+
+    name = ctypes.util.find_library('ssl')
+    if name is None:
+        return None
+
+    libssl = ctypes.CDLL(name)
+    size_p = ctypes.POINTER(ctypes.c_size_t)
+    signatures = {
+        'TLS_server_method': ([], ctypes.c_void_p),
+        'SSL_CTX_new': ([ctypes.c_void_p], ctypes.c_void_p),
+        'SSL_CTX_use_certificate_chain_file': ([ctypes.c_void_p, ctypes.c_char_p], ctypes.c_int),
+        'SSL_CTX_use_PrivateKey_file': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_int], ctypes.c_int),
+        'SSL_CTX_set_max_early_data': ([ctypes.c_void_p, ctypes.c_uint32], ctypes.c_int),
+        'SSL_CTX_set_options': ([ctypes.c_void_p, ctypes.c_uint64], ctypes.c_uint64),
+        'SSL_CTX_set_alpn_select_cb': ([ctypes.c_void_p, ALPN_SELECT_CB, ctypes.c_void_p], None),
+        'SSL_select_next_proto': ([ctypes.POINTER(ctypes.c_void_p), ctypes.POINTER(ctypes.c_ubyte), ctypes.c_char_p,
+                                   ctypes.c_uint, ctypes.c_void_p, ctypes.c_uint], ctypes.c_int),
+        'SSL_new': ([ctypes.c_void_p], ctypes.c_void_p),
+        'SSL_set_fd': ([ctypes.c_void_p, ctypes.c_int], ctypes.c_int),
+        'SSL_read_early_data': ([ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_write_early_data': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_accept': ([ctypes.c_void_p], ctypes.c_int),
+        'SSL_read_ex': ([ctypes.c_void_p, ctypes.c_void_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_write_ex': ([ctypes.c_void_p, ctypes.c_char_p, ctypes.c_size_t, size_p], ctypes.c_int),
+        'SSL_get0_alpn_selected': ([ctypes.c_void_p, ctypes.POINTER(ctypes.c_void_p),
+                                    ctypes.POINTER(ctypes.c_uint)], None),
+        'SSL_free': ([ctypes.c_void_p], None),
+    }
+    for name, (argtypes, restype) in signatures.items():
+        func = getattr(libssl, name, None)
+        if func is None:
+            return None
+        func.argtypes = argtypes
+        func.restype = restype
+    return libssl
+
+
+class BlockingTransport:
+    """Stands in for the asyncio transport (and SSL object) of the protocol, collecting what it writes"""
+
+    def __init__(self, alpn):
+        self.alpn = alpn
+        self.closed = False
+        self._written = []
+
+    def get_extra_info(self, name):
+        return self if name == 'ssl_object' else None
+
+    def selected_alpn_protocol(self):
+        return self.alpn
+
+    def write(self, data):
+        self._written.append(data)
+
+    def close(self):
+        self.closed = True
+
+    def take(self):
+        data, self._written = b''.join(self._written), []
+        return data
+
+
+def _selected_alpn(libssl, ssl_):
+    data = ctypes.c_void_p()
+    size = ctypes.c_uint()
+    libssl.SSL_get0_alpn_selected(ssl_, ctypes.byref(data), ctypes.byref(size))
+    return ctypes.string_at(data, size.value).decode() if size.value else None
+
+
+def _handle_early_data(libssl, ctx, sock, accept_early_data, too_early):
+    ssl_ = libssl.SSL_new(ctx)
+    libssl.SSL_set_fd(ssl_, sock.fileno())
+    buf = ctypes.create_string_buffer(2 ** 16)
+    size = ctypes.c_size_t()
+    transport = protocol = None
+
+    def receive(data, early, write):
+        nonlocal transport, protocol
+        if protocol is None:
+            transport = BlockingTransport(_selected_alpn(libssl, ssl_))
+            protocol = HTTPServerProtocol()
+            protocol.too_early = too_early
+            protocol.connection_made(transport)
+        protocol.early = early
+        if data:
+            protocol.data_received(data)
+        out = transport.take()
+        return not out or write(ssl_, out, len(out), ctypes.byref(size)) == 1
+
+    try:
+        # Early data is answered straight away, before the client's Finished arrives. A server which does not read
+        # early data this way rejects it.
+        while accept_early_data:
+            status = libssl.SSL_read_early_data(ssl_, buf, len(buf), ctypes.byref(size))
+            if status == SSL_READ_EARLY_DATA_ERROR:
+                return
+            if not receive(buf.raw[:size.value], True, libssl.SSL_write_early_data):
+                return
+            if status == SSL_READ_EARLY_DATA_FINISH:
+                break
+
+        if libssl.SSL_accept(ssl_) != 1 or not receive(b'', False, libssl.SSL_write_ex):
+            return
+        while not transport.closed and libssl.SSL_read_ex(ssl_, buf, len(buf), ctypes.byref(size)) == 1:
+            if not receive(buf.raw[:size.value], False, libssl.SSL_write_ex):
+                return
+    finally:
+        libssl.SSL_free(ssl_)
+        sock.close()
+
+
+def _serve_early_data(certfile, keyfile, accept_early_data, too_early, anti_replay, conn):
+    libssl = load_libssl()
+    ctx = libssl.SSL_CTX_new(libssl.TLS_server_method())
+    libssl.SSL_CTX_use_certificate_chain_file(ctx, certfile.encode())
+    libssl.SSL_CTX_use_PrivateKey_file(ctx, keyfile.encode(), SSL_FILETYPE_PEM)
+    # Session tickets only allow early data if the server accepts some
+    libssl.SSL_CTX_set_max_early_data(ctx, MAX_EARLY_DATA)
+    # With OpenSSL's anti-replay protection, every ticket only allows early data once, and the ticket sent on a
+    # resumed connection cannot be resumed in turn
+    if not anti_replay:
+        libssl.SSL_CTX_set_options(ctx, SSL_OP_NO_ANTI_REPLAY)
+
+    @ALPN_SELECT_CB
+    def select_alpn(ssl_, out, outlen, client, client_len, arg):
+        if libssl.SSL_select_next_proto(out, outlen, ALPN_PROTOCOLS, len(ALPN_PROTOCOLS), client,
+                                        client_len) != OPENSSL_NPN_NEGOTIATED:
+            return SSL_TLSEXT_ERR_NOACK
+        return SSL_TLSEXT_ERR_OK
+
+    libssl.SSL_CTX_set_alpn_select_cb(ctx, select_alpn, None)
+
+    server = socket.create_server(('127.0.0.1', 0))
+    conn.send(server.getsockname()[1])
+    while True:
+        sock, _ = server.accept()
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        threading.Thread(target=_handle_early_data, args=(libssl, ctx, sock, accept_early_data, too_early),
+                         daemon=True).start()
+
+
+def start_early_data_server(certfile, keyfile, accept_early_data=True, too_early=False, anti_replay=False):
+    """
+    Start the OpenSSL server, which accepts TLS 1.3 early data. load_libssl() must have found libssl.
+
+    :param bool accept_early_data: Whether to accept early data, or reject it (as servers which do not read it do)
+    :param bool too_early: Whether to answer requests received as early data with 425 Too Early
+    :param bool anti_replay: Whether to keep OpenSSL's anti-replay protection, which accepts early data only once
+        per ticket
+    :return: tuple of the process and the port it listens on
+    """
+
+    return _start(_serve_early_data, certfile, keyfile, accept_early_data, too_early, anti_replay)
@@ -0,0 +1,48 @@
+"""
+Record protection by the cryptography package (httpx_tls.aead), which must seal and open records exactly like the pure
+python ciphers of tlslite it replaces.
+"""
+import os
+import anyio
+import pytest
+from tlslite.utils.cipherfactory import createAESGCM, createCHACHA20
+from httpx_tls import AsyncTLSClient
+from httpx_tls.aead import CryptographyAEAD, RecordBackends, cryptography_loaded
+
+pytestmark = pytest.mark.skipif(not cryptography_loaded, reason="the cryptography package is not installed")
+
+
+@pytest.mark.parametrize('create, key_size', [(createAESGCM, 16), (createAESGCM, 32), (createCHACHA20, 32)])
+def test_same_records_as_tlslite(create, key_size):
+    key = bytearray(os.urandom(key_size))
+    python_aead = create(key, ['python'])
+    aead = CryptographyAEAD(python_aead.name, key)
+    nonce = bytearray(os.urandom(12))
+    plaintext = bytearray(os.urandom(1000))
+    data = bytearray(b'\x17\x03\x03\x03\xf8')
+
+    record = aead.seal(nonce, plaintext, data)
+    assert record == python_aead.seal(nonce, plaintext, data)
+    assert aead.open(nonce, record, data) == python_aead.open(nonce, record, data) == plaintext
+
+    # Like tlslite, a record which fails authentication is None rather than an exception
+    record[0] ^= 1
+    assert aead.open(nonce, record, data) is None
+    assert python_aead.open(nonce, record, data) is None
+
+
+async def request_with_backend(port, certfile, record_backend):
+    async with AsyncTLSClient(verify=certfile, record_backend=record_backend) as client:
+        response = await client.get(f'https://localhost:{port}/bytes/65536')
+        record_layer = response.extensions['network_stream'].get_extra_info('ssl_object').tls_connection._recordLayer
+        return response, record_layer._writeState.encContext, record_layer._readState.encContext
+
+
+@pytest.mark.parametrize('record_backend, implementation', [(RecordBackends.CRYPTOGRAPHY, 'cryptography'),
+                                                            (RecordBackends.PYTHON, 'python')])
+def test_record_backend(certificate, server, record_backend, implementation):
+    response, write_context, read_context = anyio.run(request_with_backend, server, certificate[0], record_backend)
+
+    assert response.status_code == 200
+    assert len(response.content) == 65536
+    assert write_context.implementation == read_context.implementation == implementation
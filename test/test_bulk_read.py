@@ -0,0 +1,66 @@
+"""
+Reads over memory BIOs (MockSSLObject.read, MockTLSSocket.record_pending), which decrypt every complete record
+already received instead of one record per call.
+"""
+import ssl
+import anyio
+import pytest
+from httpx_tls import AsyncTLSClient
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.mocks import MockOpenSSLMemBIO, MockSSLObject, MockTLSSocket
+
+SIZE = 2 ** 20
+
+
+@pytest.mark.parametrize('bio_class', [ssl.MemoryBIO, MockOpenSSLMemBIO])
+def test_record_pending(bio_class):
+    incoming = bio_class()
+    sock = MockTLSSocket(incoming, bio_class())
+    record = b'\x17\x03\x03\x00\x04abcd'
+
+    assert not sock.record_pending()
+    incoming.write(record[:3])
+    assert not sock.record_pending()
+    incoming.write(record[3:7])
+    assert not sock.record_pending()
+    incoming.write(record[7:] + record[:2])
+    assert sock.record_pending()
+
+    # What was moved to the lookahead buffer is read before what is still in the BIO
+    incoming.write(record[2:])
+    assert sock.recv(6) == record[:6]
+    buffer = bytearray(100)
+    assert sock.recv_into(buffer) == len(record) + 2 - 6
+    assert bytes(buffer[:len(record) + 2 - 6]) == record[6:] + record[:2]
+    assert sock.recv(100) == record[2:]
+
+
+async def download(port, certfile, http2):
+    record_backend = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    async with AsyncTLSClient(verify=certfile, http2=http2, record_backend=record_backend) as client:
+        return await client.get(f'https://localhost:{port}/bytes/{SIZE}')
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_bulk_read(certificate, server, monkeypatch, http2):
+    original = MockSSLObject.read
+    calls = []
+
+    def read(self, *args, **kwargs):
+        calls[-1] += 1
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(MockSSLObject, 'read', read)
+    responses = []
+    for bulk_read in (False, True):
+        monkeypatch.setattr(MockSSLObject, 'bulk_read', bulk_read)
+        calls.append(0)
+        responses.append(anyio.run(download, server, certificate[0], http2))
+
+    assert [response.status_code for response in responses] == [200, 200]
+    assert len(responses[0].content) == len(responses[1].content) == SIZE
+    assert responses[0].content == responses[1].content
+
+    # A read call for every record takes at least one call for each 16 KB of the body
+    assert calls[0] >= SIZE // 2 ** 14
+    assert calls[1] < calls[0]
@@ -0,0 +1,78 @@
+"""
+Caches (httpx_tls.cache). Sessions are stood in for by objects with the two members the cache looks at.
+"""
+import threading
+from httpx_tls.cache import LRUCache, SessionCache
+
+
+class Session:
+
+    def __init__(self, valid=True, tickets=()):
+        self.resumable = True
+        self.tickets = list(tickets)
+        self._valid = valid
+
+    def valid(self):
+        return self._valid
+
+
+def test_lru_eviction():
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1
+    cache.set('c', 3)
+
+    # b was the least recently used
+    assert cache.get('b') is None
+    assert [key for key, _ in cache.items()] == ['a', 'c']
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1, 'size': 2, 'maxsize': 2}
+
+
+def test_session_cache():
+    cache = SessionCache()
+    session = Session()
+    cache.set_session('localhost', None, session)
+    assert cache.get_session('localhost', None) is session
+    assert cache.get_session('localhost', object()) is None
+    assert cache.get_session(None, None) is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_invalid_session_is_a_miss():
+    cache = SessionCache()
+    cache.set_session('localhost', None, Session(valid=False))
+    assert cache.get_session('localhost', None) is None
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_session_tickets_taken_once():
+    cache = SessionCache()
+    session = Session(tickets=['first', 'second'])
+    cache.set_session('localhost', None, session)
+
+    taken = [cache.take_session('localhost', None) for _ in range(3)]
+    assert [s.tickets for s in taken] == [['first'], ['second'], []]
+    assert taken[0] is not session and taken[2] is session
+    assert session.tickets == []
+
+
+def test_session_cache_counters_from_threads():
+    cache = SessionCache()
+    cache.set_session('valid', None, Session())
+    lookups = 20000
+
+    def look_up():
+        for i in range(lookups):
+            cache.get_session('valid' if i % 2 else 'missing', None)
+            cache.record_resumption()
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.hits == cache.misses == 4 * lookups
+    assert cache.resumed == 8 * lookups
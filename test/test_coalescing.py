@@ -0,0 +1,65 @@
+"""
+HTTP2 connection coalescing (TLSHTTP2Connection and TLSConnectionPool). The connections are given a stand-in network
+stream with the names of the server's certificate, since coalescing only looks at those and the server's address.
+"""
+import httpcore
+import httpx
+from httpx_tls.transport import TLSHTTP2Connection, is_replayable
+
+
+class NetworkStream:
+
+    def __init__(self, dns_names):
+        self.ssl_object = type('SSLObject', (), {'peer_names': (dns_names, [])})()
+
+    def get_extra_info(self, name):
+        if name == 'ssl_object':
+            return self.ssl_object
+        if name == 'server_addr':
+            return '127.0.0.1', 443
+        return None
+
+
+def origin(host):
+    return httpcore.Origin(b'https', host.encode('ascii'), 443)
+
+
+def test_coalesce():
+    connection = TLSHTTP2Connection(origin('s0.cdn.test'), NetworkStream(['*.cdn.test']))
+    assert connection.can_coalesce(origin('s1.cdn.test'))
+    assert not connection.can_coalesce(origin('other.test'))
+    assert not connection.can_coalesce(httpcore.Origin(b'https', b's1.cdn.test', 8443))
+
+    connection.coalesce(origin('s1.cdn.test'))
+    assert connection.can_handle_request(origin('s1.cdn.test'))
+    assert not connection.can_handle_request(origin('s2.cdn.test'))
+
+
+def test_uncoalesce():
+    connection = TLSHTTP2Connection(origin('s0.cdn.test'), NetworkStream(['*.cdn.test']))
+    connection.coalesce(origin('s1.cdn.test'))
+
+    # After a 421 Misdirected Request, the host is neither served by the connection nor coalesced onto it again
+    connection.uncoalesce(origin('s1.cdn.test'))
+    assert not connection.can_handle_request(origin('s1.cdn.test'))
+    assert not connection.can_coalesce(origin('s1.cdn.test'))
+    assert connection.can_coalesce(origin('s2.cdn.test'))
+
+    # Hosts which were never coalesced onto the connection are not checked again either
+    connection.uncoalesce(origin('s3.cdn.test'))
+    assert not connection.can_coalesce(origin('s3.cdn.test'))
+
+    # The pool uncoalesces the origin from every connection, including the connection of its own
+    connection.uncoalesce(origin('s0.cdn.test'))
+    assert connection.can_handle_request(origin('s0.cdn.test'))
+
+
+def test_is_replayable():
+    async def stream():
+        yield b'body'
+
+    url = 'https://s1.cdn.test/'
+    assert is_replayable(httpcore.Request('GET', url))
+    assert is_replayable(httpcore.Request('POST', url, content=b'body'))
+    assert is_replayable(httpcore.Request('POST', url, content=httpx.ByteStream(b'body')))
+    assert not is_replayable(httpcore.Request('POST', url, content=stream()))
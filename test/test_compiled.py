@@ -0,0 +1,96 @@
+"""
+Compiled profile files (httpx_tls.compiled). Profiles loaded from a file must be the same as the ones built from their
+fingerprint strings, whether the file is trusted or not.
+"""
+import struct
+import pytest
+from httpx_tls import compiled
+from httpx_tls.compiled import CompiledProfiles, dump_profiles
+from httpx_tls.database import Chrome
+from httpx_tls.profiles import Http2Profile, ProfileFactory, TLSProfile
+
+
+@pytest.fixture
+def profile_file(tmp_path):
+    ja3 = Chrome.get_ja3_from_version(110)
+    akamai_str = Chrome.get_akamai_str_from_version(110, 'desktop')
+    path = str(tmp_path / 'profiles.bin')
+    dump_profiles(path, {ja3: TLSProfile.create_from_ja3(ja3, record_size=4096)},
+                  {akamai_str: Http2Profile.create_from_akamai_str(akamai_str)})
+    return path, ja3, akamai_str
+
+
+def check_profiles(profiles, ja3, akamai_str):
+    assert len(profiles) == 2
+    assert profiles.tls_keys() == [ja3] and profiles.h2_keys() == [akamai_str]
+
+    tls_profile = profiles.get_tls(ja3)
+    assert tls_profile.get_record_size() == 4096
+    assert tls_profile.get_compiled_state() == TLSProfile.create_from_ja3(ja3, record_size=4096).get_compiled_state()
+    h2_profile = profiles.get_h2(akamai_str)
+    assert h2_profile.get_compiled_state() == Http2Profile.create_from_akamai_str(akamai_str).get_compiled_state()
+
+    assert profiles.get_tls(akamai_str) is None
+    assert profiles.get_h2(ja3) is None
+
+
+def test_trusted_file(profile_file):
+    profiles = CompiledProfiles(profile_file[0])
+    try:
+        assert profiles.trusted
+        check_profiles(profiles, *profile_file[1:])
+    finally:
+        profiles.close()
+
+
+def test_modified_file_not_trusted(profile_file):
+    path, ja3, akamai_str = profile_file
+    with open(path, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 1]))
+
+    profiles = CompiledProfiles(path)
+    try:
+        assert not profiles.trusted
+        check_profiles(profiles, ja3, akamai_str)
+    finally:
+        profiles.close()
+
+
+def test_other_environment_not_trusted(profile_file, monkeypatch):
+    monkeypatch.setattr(compiled, '_environment', lambda: b'another python')
+    profiles = CompiledProfiles(profile_file[0])
+    try:
+        assert not profiles.trusted
+        check_profiles(profiles, *profile_file[1:])
+    finally:
+        profiles.close()
+
+
+def test_not_a_profile_file(profile_file, tmp_path):
+    path = str(tmp_path / 'other.bin')
+    with open(path, 'wb') as f:
+        f.write(b'not a profile file, but long enough for the header of one' * 2)
+    with pytest.raises(ValueError, match="not a compiled profile file"):
+        CompiledProfiles(path)
+
+    with open(profile_file[0], 'r+b') as f:
+        f.seek(len(compiled.MAGIC))
+        f.write(struct.pack('<H', compiled.FORMAT_VERSION + 1))
+    with pytest.raises(ValueError, match="unsupported compiled profile file version"):
+        CompiledProfiles(profile_file[0])
+
+
+def test_factory_with_compiled_file(profile_file):
+    path, ja3, akamai_str = profile_file
+    factory = ProfileFactory(compiled=path)
+    try:
+        # The record size stored in the file is the one the profile of the browser has
+        assert factory.tls_from_ja3(ja3, record_size=4096).get_record_size() == 4096
+        assert factory.tls_from_ja3(ja3).get_record_size() == 4096
+        assert factory.h2_from_akamai_str(akamai_str).get_compiled_state() == \
+            Http2Profile.create_from_akamai_str(akamai_str).get_compiled_state()
+    finally:
+        factory.compiled.close()
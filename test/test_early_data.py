@@ -0,0 +1,161 @@
+"""
+TLS 1.3 early data (httpx_tls.earlydata). A client first gets a session from a local OpenSSL server with a full
+handshake, then a second client sends its first request on a connection resuming that session. The server counts the
+requests it answered, and how many of them it received as early data.
+"""
+import anyio
+import pytest
+from httpx_tls import AsyncTLSClient
+from servers import load_libssl, start_early_data_server
+from httpx_tls.cache import SessionCache
+from httpx_tls.profiles import TLSProfile
+
+pytestmark = pytest.mark.skipif(load_libssl() is None, reason="libssl with early data support was not found")
+
+CIPHERS = '4865-4866-4867-49195-49199-49196-49200-52393-52392-49171-49172-156-157-47-53'
+# The Chrome 110 profile of the database, and the same with the early_data extension after supported_versions
+JA3 = f'772,{CIPHERS},0-23-65281-10-11-35-16-5-13-18-51-45-43-27-17513,29-23-24,0'
+EARLY_DATA_JA3 = f'772,{CIPHERS},0-23-65281-10-11-35-16-5-13-18-51-45-43-42-27-17513,29-23-24,0'
+
+
+def early_data_server(certificate, **kwargs):
+    process, port = start_early_data_server(*certificate, **kwargs)
+    yield port
+    process.terminate()
+
+
+@pytest.fixture(scope='module')
+def accepting_server(certificate):
+    yield from early_data_server(certificate)
+
+
+@pytest.fixture(scope='module')
+def rejecting_server(certificate):
+    yield from early_data_server(certificate, accept_early_data=False)
+
+
+@pytest.fixture(scope='module')
+def too_early_server(certificate):
+    yield from early_data_server(certificate, too_early=True)
+
+
+async def get_stats(client, base_url):
+    return (await client.get(base_url + '/stats')).json()
+
+
+async def resumed_request(port, certfile, http2, method='GET', extensions=None, tls_config=None):
+    """
+    :return: tuple of the response to a request on a resumed connection, the changes of the server's counts, the
+        number of resumed connections, and the number of handshakes the second client made
+    """
+
+    base_url = f'https://localhost:{port}'
+    session_cache = SessionCache()
+    async with AsyncTLSClient(tls_config, verify=certfile, http2=http2, session_cache=session_cache,
+                              early_data=True) as client:
+        (await client.get(base_url + '/bytes/16')).raise_for_status()
+        # Reading the response also reads the session tickets sent after the handshake
+        before = await get_stats(client, base_url)
+
+    async with AsyncTLSClient(tls_config, verify=certfile, http2=http2, session_cache=session_cache,
+                              early_data=True, metrics=True) as client:
+        response = await client.request(method, base_url + '/bytes/1024', extensions=extensions)
+        handshakes = client.metrics.handshakes
+        after = await get_stats(client, base_url)
+
+    changes = {name: after[name] - before[name] for name in after}
+    return response, changes, session_cache.resumed, handshakes
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_first_request_sent_as_early_data(certificate, accepting_server, http2):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, accepting_server, certificate[0], http2)
+
+    assert response.status_code == 200 and len(response.content) == 1024
+    assert resumed == 1
+    assert changes == {'requests': 1, 'early': 1, 'too_early': 0}
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_rejected_early_data_sent_again(certificate, rejecting_server, http2):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, rejecting_server, certificate[0], http2)
+
+    assert response.status_code == 200 and len(response.content) == 1024
+    assert resumed == 1
+    assert changes == {'requests': 1, 'early': 0, 'too_early': 0}
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_too_early_sent_again_without_early_data(certificate, too_early_server, http2):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, too_early_server, certificate[0], http2)
+
+    assert response.status_code == 200 and len(response.content) == 1024
+    assert changes == {'requests': 1, 'early': 0, 'too_early': 1}
+    # The request is sent again on a connection of its own
+    assert handshakes == 2
+
+
+@pytest.mark.parametrize('method', ['POST', 'PUT', 'DELETE'])
+def test_unsafe_method_not_sent_as_early_data(certificate, accepting_server, method):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, accepting_server, certificate[0], True,
+                                                       method)
+
+    assert response.status_code == 200
+    assert resumed == 1
+    assert changes == {'requests': 1, 'early': 0, 'too_early': 0}
+
+
+def test_early_data_turned_off_by_extension(certificate, accepting_server):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, accepting_server, certificate[0], True, 'GET',
+                                                       {'early_data': False})
+
+    assert response.status_code == 200
+    assert resumed == 1
+    assert changes == {'requests': 1, 'early': 0, 'too_early': 0}
+
+
+@pytest.mark.parametrize('ja3, early', [(EARLY_DATA_JA3, 1), (JA3, 0)])
+def test_early_data_only_for_profiles_listing_it(certificate, accepting_server, ja3, early):
+    response, changes, resumed, handshakes = anyio.run(resumed_request, accepting_server, certificate[0], True, 'GET',
+                                                       None, TLSProfile.create_from_ja3(ja3))
+
+    assert response.status_code == 200
+    assert resumed == 1
+    assert changes == {'requests': 1, 'early': early, 'too_early': 0}
+
+
+def test_early_data_extension_requires_resumption():
+    with pytest.raises(ValueError, match="early_data"):
+        TLSProfile.create_from_ja3(f'772,{CIPHERS},0-23-65281-10-11-35-16-5-13-18-51-43-42-27,29-23-24,0')
+
+
+async def parallel_resumed_requests(port, certfile, connections):
+    """
+    :return: tuple of the changes of the server's counts, and the tickets the session had before the connections
+    """
+
+    base_url = f'https://localhost:{port}'
+    session_cache = SessionCache()
+    async with AsyncTLSClient(verify=certfile, session_cache=session_cache, early_data=True) as client:
+        (await client.get(base_url + '/bytes/16')).raise_for_status()
+        before = await get_stats(client, base_url)
+    tickets = list(session_cache.get_session('localhost', None).tickets)
+
+    async def request():
+        async with AsyncTLSClient(verify=certfile, session_cache=session_cache, early_data=True) as client:
+            (await client.get(base_url + '/bytes/16')).raise_for_status()
+
+    async with anyio.create_task_group() as tg:
+        for _ in range(connections):
+            tg.start_soon(request)
+
+    async with AsyncTLSClient(verify=certfile) as client:
+        after = await get_stats(client, base_url)
+    return {name: after[name] - before[name] for name in after}, tickets
+
+
+def test_parallel_connections_send_early_data_with_a_ticket_each(certificate, accepting_server):
+    changes, tickets = anyio.run(parallel_resumed_requests, accepting_server, certificate[0], 2)
+
+    assert len(tickets) == 2
+    assert changes == {'requests': 2, 'early': 2, 'too_early': 0}
@@ -0,0 +1,139 @@
+"""
+Adaptive HTTP2 flow control (httpx_tls.flowcontrol). A client and a server h2 state machine exchange a response, with
+the client acknowledging data the way httpcore does, while the clock the tuner reads is moved forward by hand.
+"""
+import anyio
+import h2.config
+import h2.connection
+import h2.events
+import pytest
+from httpx_tls import AsyncTLSClient, flowcontrol
+from httpx_tls.aead import RecordBackends, cryptography_loaded
+from httpx_tls.flowcontrol import AdaptiveFlowControl
+
+RTT = 0.01
+CHUNK = 2 ** 12
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(flowcontrol.time, 'monotonic', clock)
+    return clock
+
+
+def exchange(client, server, clock, tuner=None, seconds_per_chunk=0.0):
+    """
+    Pass everything the server sent to the client and back, and return the events the client received
+
+    :return: list of h2.events.Event
+    """
+
+    received = []
+    while True:
+        data = server.data_to_send()
+        if not data:
+            break
+        for event in client.receive_data(data):
+            received.append(event)
+            if tuner is not None:
+                tuner.event_received(event)
+            if isinstance(event, h2.events.DataReceived):
+                clock.now += seconds_per_chunk * event.flow_controlled_length / CHUNK
+                client.acknowledge_received_data(event.flow_controlled_length, event.stream_id)
+        server.receive_data(client.data_to_send())
+    return received
+
+
+def open_stream(config, clock):
+    client = h2.connection.H2Connection(h2.config.H2Configuration(client_side=True))
+    server = h2.connection.H2Connection(h2.config.H2Configuration(client_side=False))
+    client.initiate_connection()
+    server.initiate_connection()
+    server.receive_data(client.data_to_send())
+    exchange(client, server, clock)
+
+    tuner = config.create_tuner(client)
+    client.send_headers(1, [(':method', 'GET'), (':scheme', 'https'), (':authority', 'localhost'), (':path', '/')],
+                        end_stream=True)
+    tuner.request_sent(1)
+    server.receive_data(client.data_to_send())
+    clock.now += RTT
+    server.send_headers(1, [(':status', '200')])
+    exchange(client, server, clock, tuner)
+    assert tuner.rtt == pytest.approx(RTT)
+    return client, server, tuner
+
+
+def send_response(client, server, clock, tuner, size, seconds_per_chunk):
+    sent = 0
+    while sent < size:
+        window = min(server.local_flow_control_window(1), server.max_outbound_frame_size, CHUNK, size - sent)
+        assert window > 0, "the client did not hand the window back"
+        server.send_data(1, b'x' * window)
+        sent += window
+        exchange(client, server, clock, tuner, seconds_per_chunk)
+
+
+def windows(client):
+    return (client._inbound_flow_control_window_manager.max_window_size,
+            client.streams[1]._inbound_window_manager.max_window_size)
+
+
+def test_windows_grow_when_data_arrives_fast(clock):
+    config = AdaptiveFlowControl(max_window=2 ** 20, max_stream_window=2 ** 19)
+    client, server, tuner = open_stream(config, clock)
+    assert windows(client) == (65535, 65535)
+
+    # Half of a window takes a fraction of a round trip
+    send_response(client, server, clock, tuner, 2 ** 21, RTT / 100)
+    assert windows(client) == (2 ** 20, 2 ** 19)
+
+
+def test_windows_shrink_when_data_arrives_slowly(clock):
+    config = AdaptiveFlowControl(min_window=2 ** 13)
+    client, server, tuner = open_stream(config, clock)
+
+    # Half of a window takes many round trips
+    send_response(client, server, clock, tuner, 2 ** 20, RTT * 10)
+    assert windows(client) == (2 ** 13, 2 ** 13)
+
+
+def test_windows_above_the_upper_bound_brought_down(clock):
+    config = AdaptiveFlowControl(min_window=2 ** 12, max_window=2 ** 14)
+    client, server, tuner = open_stream(config, clock)
+
+    send_response(client, server, clock, tuner, 2 ** 18, RTT / 100)
+    assert windows(client) == (2 ** 14, 2 ** 14)
+
+
+def test_window_bounds():
+    with pytest.raises(ValueError):
+        AdaptiveFlowControl(min_window=2 ** 20, max_window=2 ** 16)
+    with pytest.raises(ValueError):
+        AdaptiveFlowControl(max_window=2 ** 31)
+    with pytest.raises(ValueError):
+        AdaptiveFlowControl(max_window=2 ** 20, max_stream_window=2 ** 21)
+
+
+async def download(port, certfile, flow_control):
+    record_backend = RecordBackends.CRYPTOGRAPHY if cryptography_loaded else RecordBackends.PYTHON
+    async with AsyncTLSClient(verify=certfile, http2=True, flow_control=flow_control,
+                              record_backend=record_backend) as client:
+        return [await client.get(f'https://localhost:{port}/bytes/{2 ** 20}') for _ in range(2)]
+
+
+def test_download_with_adaptive_flow_control(certificate, server):
+    responses = anyio.run(download, server, certificate[0], AdaptiveFlowControl(min_window=2 ** 14,
+                                                                                max_window=2 ** 16))
+    assert [(response.http_version, response.status_code, len(response.content)) for response in responses] == \
+        [('HTTP/2', 200, 2 ** 20)] * 2
@@ -0,0 +1,171 @@
+"""
+ClientHellos created from the profile templates (httpx_tls.hello) must be byte for byte the same as the ones tlslite
+creates itself, since templates would otherwise change the fingerprint. ClientHellos are captured on a loopback
+listener with templates and without them. The random, session ID, key shares and PSK are different on every
+connection, so only their lengths are compared.
+"""
+import socket
+import struct
+import threading
+import pytest
+from tlslite.constants import ExtensionType
+from httpx_tls.bench import database_profiles
+from httpx_tls.cache import SessionCache
+from httpx_tls.profiles import TLSProfile
+from httpx_tls.transport import create_ssl_context_proxy
+
+# Server names of different lengths change the padding
+SERVER_NAMES = ['localhost', 'a.io', 'www.' + 'long-hostname.' * 8 + 'example.com', None]
+JA3_STRINGS = list(dict.fromkeys(ja3 for _, ja3, _ in database_profiles()))
+
+
+class CaptureServer:
+    """Loopback listener which keeps the first record every client sends and closes the connection"""
+
+    def __init__(self):
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        self.hellos = []
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _read(self, conn, length):
+        data = b''
+        while len(data) < length:
+            chunk = conn.recv(length - len(data))
+            if not chunk:
+                break
+            data += chunk
+        return data
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            with conn:
+                header = self._read(conn, 5)
+                if len(header) < 5:
+                    continue
+                self.hellos.append(header + self._read(conn, struct.unpack('>H', header[3:5])[0]))
+
+    def capture(self, proxy, server_name, templates):
+        """Connect with the proxy and return the ClientHello record it sent"""
+
+        del self.hellos[:]
+        sock = socket.create_connection(('127.0.0.1', self.port))
+        ssl_sock = proxy.wrap_socket(sock, server_hostname=server_name, do_handshake_on_connect=False)
+        if not templates:
+            ssl_sock.tls_connection.hello_templates = None
+        try:
+            ssl_sock.do_handshake()
+        except Exception:
+            pass
+        finally:
+            sock.close()
+        return self.hellos[0]
+
+    def close(self):
+        self.sock.close()
+
+
+@pytest.fixture(scope='module')
+def capture_server():
+    capture_server = CaptureServer()
+    yield capture_server
+    capture_server.close()
+
+
+def extensions(record):
+    """Return the type, offset and length of the body of every extension in a ClientHello record"""
+
+    pos = 5 + 4 + 2 + 32
+    pos += 1 + record[pos]
+    pos += 2 + struct.unpack_from('>H', record, pos)[0]
+    pos += 1 + record[pos]
+    end = pos + 2 + struct.unpack_from('>H', record, pos)[0]
+    pos += 2
+
+    found = []
+    while pos < end:
+        ext_type, length = struct.unpack_from('>HH', record, pos)
+        found.append((ext_type, pos + 4, length))
+        pos += 4 + length
+    return found
+
+
+def mask(record):
+    """Zero the parts of a ClientHello record which are different on every connection, but not their lengths"""
+
+    data = bytearray(record)
+    pos = 5 + 4 + 2
+    data[pos:pos + 32] = bytes(32)
+    pos += 32
+    data[pos + 1:pos + 1 + data[pos]] = bytes(data[pos])
+
+    for ext_type, body, length in extensions(record):
+        if ext_type == ExtensionType.key_share:
+            share = body + 2
+            while share < body + length:
+                share_length = struct.unpack_from('>H', data, share + 2)[0]
+                data[share + 4:share + 4 + share_length] = bytes(share_length)
+                share += 4 + share_length
+        elif ext_type == ExtensionType.pre_shared_key:
+            data[body:body + length] = bytes(length)
+    return bytes(data)
+
+
+def store_session(proxy, port):
+    """Do a full handshake with the local server, so that the proxy's session cache has a session for localhost"""
+
+    sock = socket.create_connection(('127.0.0.1', port))
+    ssl_sock = proxy.wrap_socket(sock, server_hostname='localhost')
+    # The session tickets arrive before the response
+    ssl_sock.sendall(b"GET /bytes/0 HTTP/1.1\r\nHost: localhost\r\n\r\n")
+    ssl_sock.recv(65536)
+    sock.close()
+
+
+def assert_identical(capture_server, proxy, profile, server_name):
+    # The first ClientHello with templates is still created by tlslite, and becomes the template
+    hellos = [capture_server.capture(proxy, server_name, templates) for templates in (False, True, True)]
+
+    assert all(profile.get_hello_templates().values()), "no template was created for the profile"
+    baseline = mask(hellos[0])
+    assert mask(hellos[1]) == baseline
+    assert mask(hellos[2]) == baseline
+    assert hellos[1] != hellos[2], "the random and key shares must change"
+    return hellos
+
+
+@pytest.mark.parametrize('server_name', SERVER_NAMES)
+@pytest.mark.parametrize('ja3', JA3_STRINGS)
+def test_client_hello_identical(capture_server, ja3, server_name):
+    profile = TLSProfile.create_from_ja3(ja3)
+    proxy = create_ssl_context_proxy(tls_config=profile, verify=False, session_cache=None)
+    proxy.set_alpn_protocols(['h2', 'http/1.1'])
+
+    assert_identical(capture_server, proxy, profile, server_name)
+
+
+@pytest.mark.parametrize('ja3', [ja3 for ja3 in JA3_STRINGS if ja3.startswith('772,')])
+def test_resumed_client_hello_identical(capture_server, server, ja3):
+    profile = TLSProfile.create_from_ja3(ja3)
+    session_cache = SessionCache(maxsize=16)
+    proxy = create_ssl_context_proxy(tls_config=profile, verify=False, session_cache=session_cache)
+    proxy.set_alpn_protocols(['http/1.1'])
+    store_session(proxy, server)
+    assert session_cache.get_session('localhost', profile) is not None
+
+    hellos = assert_identical(capture_server, proxy, profile, 'localhost')
+    for hello in hellos:
+        # The PSK must come last, since its binders sign the rest of the ClientHello
+        assert extensions(hello)[-1][0] == ExtensionType.pre_shared_key
+
+    # The binders are left out of the comparison, so the server has to accept them for the session to be resumed
+    sock = socket.create_connection(('127.0.0.1', server))
+    try:
+        ssl_sock = proxy.wrap_socket(sock, server_hostname='localhost')
+        assert ssl_sock.session_reused
+    finally:
+        sock.close()
@@ -0,0 +1,64 @@
+"""
+Idle connections (httpx_tls.mocks.release_handshake_state). Once the handshake completes, a connection drops what only
+the handshake needed, and is still used for later requests, while the session it stored stays whole for the
+connections which resume it. The HTTP2 settings of a connection are kept in lists rather than deques
+(httpx_tls.patch._http2.CompactSettings).
+"""
+import anyio
+from h2.settings import SettingCodes
+from httpx_tls import AsyncTLSClient
+from httpx_tls.cache import SessionCache
+from httpx_tls.mocks import NO_HANDSHAKE_HASHES
+from httpx_tls.patch._http2 import CompactSettings, SettingValues
+
+
+async def requests_on_released_connection(port, certfile):
+    base_url = f'https://localhost:{port}'
+    session_cache = SessionCache()
+    async with AsyncTLSClient(verify=certfile, session_cache=session_cache, coalesce=True) as client:
+        first = await client.get(base_url + '/bytes/16')
+        ssl_object = first.extensions['network_stream'].get_extra_info('ssl_object')
+        second = await client.get(base_url + '/bytes/16384')
+        stream = second.extensions['network_stream']
+    stored = dict(session_cache.items())[('localhost', None)]
+
+    async with AsyncTLSClient(verify=certfile, session_cache=session_cache, coalesce=True) as client:
+        resumed = await client.get(base_url + '/bytes/16')
+        resumed_ssl_object = resumed.extensions['network_stream'].get_extra_info('ssl_object')
+
+    return (first, second, stream is first.extensions['network_stream'], ssl_object, stored, resumed,
+            resumed_ssl_object, session_cache)
+
+
+def test_released_connection_reused(certificate, server):
+    first, second, same_stream, ssl_object, stored, resumed, resumed_ssl_object, session_cache = \
+        anyio.run(requests_on_released_connection, server, certificate[0])
+
+    assert first.status_code == second.status_code == 200
+    assert len(second.content) == 16384
+    assert same_stream
+
+    # The connection dropped the transcript and the certificate chain, but the session it stored in the cache kept
+    # the chain
+    assert ssl_object.tls_connection._handshake_hash is NO_HANDSHAKE_HASHES
+    assert ssl_object.tls_connection._first_handshake_hashes is None
+    assert ssl_object.tls_connection.session.serverCertChain is None
+    assert stored.serverCertChain is not None
+    assert ssl_object.peer_names == stored.peer_names and stored.peer_names is not None
+
+    # The connection resuming the session keeps the names of the certificate, which it did not receive
+    assert resumed.status_code == 200
+    assert session_cache.resumed == 1
+    assert resumed_ssl_object.peer_names == ssl_object.peer_names
+
+
+def test_compact_settings():
+    settings = CompactSettings(client=True)
+    settings[SettingCodes.INITIAL_WINDOW_SIZE] = 2 ** 20
+    settings[0xfa] = 1
+    assert settings[SettingCodes.INITIAL_WINDOW_SIZE] == 65535
+
+    changes = settings.acknowledge()
+    assert changes[SettingCodes.INITIAL_WINDOW_SIZE].new_value == 2 ** 20
+    assert settings[SettingCodes.INITIAL_WINDOW_SIZE] == 2 ** 20 and settings[0xfa] == 1
+    assert all(type(values) is SettingValues for values in settings._settings.values())
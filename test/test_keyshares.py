@@ -0,0 +1,74 @@
+"""
+Pre-generated TLS 1.3 key shares (httpx_tls.keyshares). Every key share the pool generates must be handed out once at
+most, since a connection reusing the key share of another one would give away its secrets.
+"""
+import threading
+import time
+import anyio
+from tlslite.constants import GroupName
+from httpx_tls import AsyncTLSClient
+from httpx_tls.keyshares import KeySharePool
+
+
+def wait_until_ready(pool, group, count):
+    deadline = time.monotonic() + 30
+    while pool.stats()['ready'].get(GroupName.toRepr(group), 0) < count:
+        assert time.monotonic() < deadline, "the pool did not refill"
+        time.sleep(0.01)
+
+
+def test_key_shares_handed_out_once():
+    pool = KeySharePool(depth=4)
+    try:
+        pool.register_groups([GroupName.x25519])
+        wait_until_ready(pool, GroupName.x25519, 4)
+        taken = []
+
+        def take():
+            for _ in range(25):
+                entry = pool.take(GroupName.x25519)
+                if entry is not None:
+                    taken.append(entry)
+
+        threads = [threading.Thread(target=take) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(taken) == pool.hits >= 4
+        assert pool.hits + pool.misses == 100
+        assert len({bytes(entry.key_exchange) for entry in taken}) == len(taken)
+        assert all(entry.group == GroupName.x25519 for entry in taken)
+
+        # The pool fills up again after it was emptied
+        wait_until_ready(pool, GroupName.x25519, 4)
+    finally:
+        pool.close()
+
+
+def test_group_without_key_shares():
+    pool = KeySharePool()
+    try:
+        assert pool.take(GroupName.secp256r1) is None
+        assert (pool.hits, pool.misses) == (0, 1)
+    finally:
+        pool.close()
+
+
+async def requests_with_pool(port, certfile, pool):
+    async with AsyncTLSClient(verify=certfile, key_share_pool=pool) as client:
+        return await client.get(f'https://localhost:{port}/bytes/16')
+
+
+def test_client_uses_key_share_pool(certificate, server):
+    pool = KeySharePool(depth=2)
+    try:
+        pool.register_groups([GroupName.x25519])
+        wait_until_ready(pool, GroupName.x25519, 2)
+        response = anyio.run(requests_with_pool, server, certificate[0], pool)
+
+        assert response.status_code == 200
+        assert pool.hits == 1
+    finally:
+        pool.close()
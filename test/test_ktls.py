@@ -0,0 +1,92 @@
+"""
+Kernel TLS (httpx_tls.ktls). The keys must be packed the way linux/tls.h lays them out, and connections the kernel
+cannot take over (no tls module, an unsupported cipher, trio) must keep working on tlslite.
+"""
+import struct
+import anyio
+import pytest
+from tlslite.recordlayer import ConnectionState
+from tlslite.utils.cipherfactory import createAES, createAESGCM, createCHACHA20
+from httpx_tls import AsyncTLSClient, TLSClient, ktls
+from httpx_tls.aead import RecordBackends
+from httpx_tls.ktls import crypto_info
+
+
+def connection_state(context, nonce, seqnum=5):
+    state = ConnectionState()
+    state.encContext = context
+    state.fixedNonce = nonce
+    state.seqnum = seqnum
+    return state
+
+
+def test_crypto_info_aes_gcm():
+    key = bytearray(range(16))
+    nonce = bytearray(range(100, 112))
+    info = crypto_info((3, 4), connection_state(createAESGCM(key, ['python']), nonce))
+    # version, cipher, iv, key, salt, rec_seq
+    assert info == struct.pack('=HH', 0x0304, 51) + nonce[4:] + key + nonce[:4] + (5).to_bytes(8, 'big')
+
+    # TLS 1.2 only has the salt, and the explicit part of the nonce is the sequence number
+    info = crypto_info((3, 3), connection_state(createAESGCM(key, ['python']), nonce[:4]))
+    seq = (5).to_bytes(8, 'big')
+    assert info == struct.pack('=HH', 0x0303, 51) + seq + key + nonce[:4] + seq
+
+    assert crypto_info((3, 4), connection_state(createAESGCM(bytearray(32), ['python']), nonce))[2:4] == \
+        struct.pack('=H', 52)
+
+
+def test_crypto_info_chacha20():
+    key = bytearray(range(32))
+    nonce = bytearray(range(12))
+    info = crypto_info((3, 4), connection_state(createCHACHA20(key, ['python']), nonce))
+    assert info == struct.pack('=HH', 0x0304, 54) + nonce + key + (5).to_bytes(8, 'big')
+
+    # The draft construction of TLS 1.2, with a 4 byte fixed nonce
+    assert crypto_info((3, 3), connection_state(createCHACHA20(key, ['python']), nonce[:4])) is None
+
+
+def test_crypto_info_unsupported():
+    key = bytearray(16)
+    assert crypto_info((3, 3), connection_state(createAES(key, bytearray(16), ['python']), bytearray())) is None
+    assert crypto_info((3, 2), connection_state(createAESGCM(key, ['python']), bytearray(4))) is None
+    assert crypto_info((3, 4), connection_state(None, bytearray(12))) is None
+
+
+@pytest.fixture
+def kernel_tls_untried(monkeypatch):
+    # Whether the kernel has the tls module is only found out once per process
+    monkeypatch.setattr(ktls, '_kernel_tls_loaded', None)
+
+
+def check_connection(response, ssl_object):
+    assert response.status_code == 200
+    assert response.content == bytes(range(256)) * 256
+    if ktls._kernel_tls_loaded is False or not ktls.kernel_tls_supported:
+        assert ssl_object.kernel_tls is None
+
+
+def test_sync_client(certificate, server, kernel_tls_untried):
+    with TLSClient(verify=certificate[0], record_backend=RecordBackends.KERNEL) as client:
+        responses = [client.post(f'https://localhost:{server}/echo', content=bytes(range(256)) * 256)
+                     for _ in range(2)]
+        ssl_object = responses[0].extensions['network_stream'].get_extra_info('ssl_object')
+    for response in responses:
+        check_connection(response, ssl_object)
+
+
+async def async_requests(port, certfile, http2):
+    async with AsyncTLSClient(verify=certfile, http2=http2, record_backend=RecordBackends.KERNEL) as client:
+        responses = [await client.post(f'https://localhost:{port}/echo', content=bytes(range(256)) * 256)
+                     for _ in range(2)]
+        return responses, responses[0].extensions['network_stream'].get_extra_info('ssl_object')
+
+
+@pytest.mark.parametrize('backend', ['asyncio', 'trio'])
+@pytest.mark.parametrize('http2', [True, False])
+def test_async_client(certificate, server, kernel_tls_untried, backend, http2):
+    responses, ssl_object = anyio.run(async_requests, server, certificate[0], http2, backend=backend)
+    for response in responses:
+        check_connection(response, ssl_object)
+    if backend == 'trio':
+        assert ssl_object.kernel_tls is None
@@ -0,0 +1,69 @@
+"""
+Client metrics (httpx_tls.metrics), counted while the client talks to the local test server.
+"""
+import ssl
+import anyio
+import pytest
+from httpx_tls import AsyncTLSClient
+from httpx_tls.cache import SessionCache
+from httpx_tls.metrics import Histogram
+
+
+def test_histogram_buckets():
+    histogram = Histogram((1, 10))
+    for value in (0.5, 1, 5, 50):
+        histogram.observe(value)
+    assert histogram.snapshot() == {'bounds': (1, 10), 'counts': [2, 1, 1], 'count': 4, 'sum': 56.5}
+
+
+async def metered_requests(port, certfile, http2):
+    base_url = f'https://localhost:{port}'
+    session_cache = SessionCache()
+    async with AsyncTLSClient(verify=certfile, http2=http2, metrics=True, session_cache=session_cache) as client:
+        responses = [await client.get(base_url + '/bytes/32768') for _ in range(2)]
+        during = client.metrics.snapshot()
+    after = client.metrics.snapshot()
+
+    async with AsyncTLSClient(verify=certfile, http2=http2, metrics=client.metrics,
+                              session_cache=session_cache) as client:
+        responses.append(await client.get(base_url + '/bytes/16'))
+    return responses, during, after, client.metrics.snapshot()
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_counters(certificate, server, http2):
+    responses, during, after, resumed = anyio.run(metered_requests, server, certificate[0], http2)
+    assert [response.status_code for response in responses] == [200] * 3
+
+    assert (during['handshakes'], during['resumed_handshakes'], during['handshake_failures']) == (1, 0, 0)
+    assert during['handshake_duration']['count'] == 1
+    assert during['active_connections'] == 1
+    assert during['bytes_received'] > 2 * 32768
+    assert during['bytes_sent'] > 0
+    # Each response is too large for a single record
+    assert during['records_received'] > 4
+    assert during['records_sent'] > 0
+
+    assert after['active_connections'] == 0
+    if http2:
+        assert during['streams_opened'] == 2 and during['active_streams'] == 0
+        assert after['streams_per_connection']['count'] == 1 and after['streams_per_connection']['sum'] == 2
+    else:
+        assert during['streams_opened'] == 0
+
+    # Clients passed the same Metrics add up
+    assert (resumed['handshakes'], resumed['resumed_handshakes']) == (2, 1)
+    assert resumed['active_connections'] == 0
+
+
+async def failed_handshake(port):
+    # The test server's certificate is self-signed, so it is not trusted by default
+    async with AsyncTLSClient(metrics=True) as client:
+        with pytest.raises(ssl.SSLCertVerificationError):
+            await client.get(f'https://localhost:{port}/bytes/16')
+        return client.metrics.snapshot()
+
+
+def test_failed_handshake(server):
+    snapshot = anyio.run(failed_handshake, server)
+    assert (snapshot['handshakes'], snapshot['handshake_failures'], snapshot['active_connections']) == (0, 1, 0)
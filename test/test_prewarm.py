@@ -0,0 +1,67 @@
+"""
+Prewarmed connections (AsyncTLSClient.prewarm), which requests must use instead of making connections of their own.
+"""
+import socket
+import anyio
+import httpx
+import pytest
+from httpx_tls import AsyncTLSClient
+
+
+def closed_port():
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+async def prewarm_and_request(port, certfile, http2, limits=httpx.Limits()):
+    origin = f'https://localhost:{port}'
+    unreachable = f'https://localhost:{closed_port()}'
+    async with AsyncTLSClient(verify=certfile, http2=http2, metrics=True, limits=limits) as client:
+        results = await client.prewarm([origin, unreachable], connections_per_origin=3)
+        prewarmed = client.metrics.snapshot()
+
+        responses = []
+
+        async def request():
+            responses.append(await client.get(origin + '/bytes/16'))
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(3):
+                tg.start_soon(request)
+        return results, prewarmed, client.metrics.snapshot(), responses, origin, unreachable
+
+
+@pytest.mark.parametrize('http2', [True, False])
+def test_requests_use_prewarmed_connections(certificate, server, http2):
+    results, prewarmed, after, responses, origin, unreachable = \
+        anyio.run(prewarm_and_request, server, certificate[0], http2)
+
+    assert results[origin]['connected'] == 3 and results[origin]['failed'] == 0
+    assert len(results[origin]['durations']) == 3 and not results[origin]['errors']
+    assert results[unreachable]['connected'] == 0 and results[unreachable]['failed'] == 3
+    assert all(isinstance(error, httpx.ConnectError) for error in results[unreachable]['errors'])
+
+    assert prewarmed['handshakes'] == prewarmed['active_connections'] == 3
+    assert [response.status_code for response in responses] == [200] * 3
+    assert after['handshakes'] == 3
+
+
+def test_prewarm_with_a_full_pool(certificate, server):
+    results, prewarmed, after, responses, origin, unreachable = \
+        anyio.run(prewarm_and_request, server, certificate[0], False, httpx.Limits(max_connections=2))
+
+    # Prewarming never closes connections to make room, and the failed connections gave their places back
+    assert results[origin]['connected'] + results[unreachable]['connected'] == 2
+    assert results[origin]['failed'] + results[unreachable]['failed'] == 4
+    assert [response.status_code for response in responses] == [200] * 3
+
+
+async def prewarm_with_transport(certfile):
+    async with AsyncTLSClient(verify=certfile, transport=httpx.AsyncHTTPTransport()) as client:
+        await client.prewarm(['https://localhost'])
+
+
+def test_prewarm_requires_own_transport(certificate):
+    with pytest.raises(ValueError, match="own transport"):
+        anyio.run(prewarm_with_transport, certificate[0])
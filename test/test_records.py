@@ -0,0 +1,75 @@
+"""
+Outgoing records (MockTLSSocket.cork, TLSProfile.record_size). The records of a single write reach the BIO together,
+and are no larger than the record size of the profile.
+"""
+import anyio
+import pytest
+from httpx_tls import AsyncTLSClient
+from httpx_tls.database import Chrome
+from httpx_tls.mocks import MockOpenSSLMemBIO, MockTLSSocket
+from httpx_tls.profiles import ProfileFactory, TLSProfile
+
+JA3 = '771,4865-4866-4867-49195-49199-49196-49200-52393-52392-49171-49172-156-157-47-53,' \
+      '0-23-65281-10-11-35-16-5-13-18-51-45-43-27-17513,29-23-24,0'
+
+
+def test_cork():
+    outgoing = MockOpenSSLMemBIO()
+    sock = MockTLSSocket(MockOpenSSLMemBIO(), outgoing)
+
+    sock.cork()
+    assert sock.send(b'first record') == 12
+    sock.sendall(b'second record')
+    assert outgoing.pending == 0
+    sock.uncork()
+    # Written to the BIO as a single chunk, which a single read takes as is
+    assert outgoing.pending == 25
+    assert outgoing.read(25) == b'first recordsecond record'
+
+    sock.send(b'uncorked')
+    assert outgoing.read() == b'uncorked'
+    # Nothing to write
+    sock.cork()
+    sock.uncork()
+    assert outgoing.pending == 0
+
+
+def test_record_size_limits():
+    assert TLSProfile.create_from_ja3(JA3).get_record_size() == TLSProfile.DEFAULT_RECORD_SIZE
+    assert TLSProfile.create_from_ja3(JA3, record_size=1024).get_record_size() == 1024
+    for record_size in (TLSProfile.MIN_RECORD_SIZE - 1, TLSProfile.DEFAULT_RECORD_SIZE + 1):
+        with pytest.raises(ValueError, match="record size"):
+            TLSProfile.create_from_ja3(JA3, record_size=record_size)
+
+
+def test_record_size_of_browser(monkeypatch):
+    monkeypatch.setattr(Chrome, 'record_size', 4096)
+    assert TLSProfile.create_from_version('chrome', 110).get_record_size() == 4096
+
+    factory = ProfileFactory()
+    profile = factory.tls_from_version('chrome', 110)
+    assert profile.get_record_size() == 4096
+    assert factory.tls_from_version('chrome', 110) is profile
+    # The profile stored for the ja3 string is only used if it has the record size asked for
+    ja3 = Chrome.get_ja3_from_version(110)
+    assert factory.tls_from_ja3(ja3) is profile
+    assert factory.tls_from_ja3(ja3, record_size=2048).get_record_size() == 2048
+
+
+async def echo(port, certfile, tls_config, body):
+    async with AsyncTLSClient(tls_config, verify=certfile, metrics=True) as client:
+        response = await client.post(f'https://localhost:{port}/echo', content=body)
+        tls_connection = response.extensions['network_stream'].get_extra_info('ssl_object').tls_connection
+        return response, tls_connection.recordSize, client.metrics.snapshot()['records_sent']
+
+
+def test_records_sent_with_record_size(certificate, server):
+    body = bytes(range(256)) * 40
+    response, record_size, records_sent = anyio.run(echo, server, certificate[0],
+                                                    TLSProfile.create_from_ja3(JA3, record_size=1024), body)
+
+    assert response.status_code == 200
+    assert response.content == body
+    assert record_size == 1024
+    # The body alone takes 10 records of 1024 bytes, and the Finished message another one
+    assert records_sent > len(body) // 1024
@@ -0,0 +1,26 @@
+"""
+The sync client (TLSClient) over HTTP2, with an HTTP2 profile that, like Firefox's, does not send
+MAX_CONCURRENT_STREAMS. The requests run in a thread of their own so that a hang fails the test instead of the run.
+"""
+import threading
+from httpx_tls import TLSClient
+from httpx_tls.profiles import Http2Profile
+
+
+def test_http2_without_max_concurrent_streams(certificate, server):
+    h2_profile = Http2Profile.create_from_version('desktop', 'firefox', 110)
+    assert 3 not in h2_profile.get_settings()
+    responses = []
+
+    def requests():
+        with TLSClient(h2_config=h2_profile, verify=certificate[0], http2=True) as client:
+            for _ in range(3):
+                responses.append(client.get(f'https://localhost:{server}/bytes/1024'))
+
+    thread = threading.Thread(target=requests, daemon=True)
+    thread.start()
+    thread.join(30)
+
+    assert not thread.is_alive()
+    assert [(response.http_version, response.status_code, len(response.content)) for response in responses] == \
+        [('HTTP/2', 200, 1024)] * 3
@@ -0,0 +1,47 @@
+"""
+AsyncTLSTransport with a plain httpx.AsyncClient, which must work without any of the global patches applied.
+"""
+import anyio
+import httpx
+import pytest
+from httpx_tls import unpatch_all
+from httpx_tls.patch import Patch
+from httpx_tls.profiles import TLSProfile
+from httpx_tls.transport import AsyncTLSTransport
+
+JA3 = '771,4865-4866-4867-49195-49199-49196-49200-52393-52392-49171-49172-156-157-47-53,' \
+      '0-23-65281-10-11-35-16-5-13-18-51-45-43-27-17513,29-23-24,0'
+
+
+@pytest.fixture
+def unpatched():
+    # Clients created by other tests applied the patches, and the next one to be created applies them again
+    unpatch_all()
+    yield
+    assert not any(patch.patched for patch in Patch.__subclasses__())
+
+
+async def requests(port, certfile, http2):
+    base_url = f'https://localhost:{port}'
+    tls_config = TLSProfile.create_from_ja3(JA3)
+    other_tls_config = TLSProfile.create_from_ja3(JA3)
+    transport = AsyncTLSTransport(tls_config, verify=certfile, http2=http2)
+    async with httpx.AsyncClient(transport=transport) as client:
+        responses = [await client.get(base_url + '/bytes/1024') for _ in range(2)]
+        responses.append(await client.get(base_url + '/bytes/1024', extensions={'tls_profile': other_tls_config}))
+        responses.append(await client.post(base_url + '/echo', content=b'x' * 100000))
+
+    ssl_objects = [response.extensions['network_stream'].get_extra_info('ssl_object') for response in responses]
+    return responses, [ssl_object.context.get_profile() for ssl_object in ssl_objects], tls_config, other_tls_config
+
+
+@pytest.mark.parametrize('backend', ['asyncio', 'trio'])
+@pytest.mark.parametrize('http2', [True, False])
+def test_transport_without_patches(certificate, server, unpatched, backend, http2):
+    responses, profiles, tls_config, other_tls_config = anyio.run(requests, server, certificate[0], http2,
+                                                                  backend=backend)
+
+    assert [response.status_code for response in responses] == [200] * 4
+    assert {response.http_version for response in responses} == {'HTTP/2' if http2 else 'HTTP/1.1'}
+    assert [len(response.content) for response in responses] == [1024, 1024, 1024, 100000]
+    assert profiles == [tls_config, tls_config, other_tls_config, tls_config]
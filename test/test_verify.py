@@ -0,0 +1,336 @@
+"""
+Certificate verification (httpx_tls.verify). Chains of a local PKI, valid and broken in every way verification is
+meant to catch, are verified against their trust store directly, and presented by a loopback TLS server to a tlslite
+connection and an ssl module connection, which must both accept them or both reject them with the same OpenSSL verify
+message.
+"""
+import datetime
+import ipaddress
+import os
+import socket
+import ssl
+import threading
+import pytest
+
+x509 = pytest.importorskip('cryptography.x509')
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, rsa
+from cryptography.x509.oid import ExtendedKeyUsageOID, NameOID
+from httpx_tls.transport import create_ssl_context_proxy
+from httpx_tls.verify import TrustStore, VerifyCodes, get_trust_store
+
+HOSTNAME = 'www.verify.localhost'
+KINDS = ['rsa', 'p256', 'p384']
+
+
+def new_key(kind):
+    if kind == 'rsa':
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    return ec.generate_private_key(ec.SECP256R1() if kind == 'p256' else ec.SECP384R1())
+
+
+def issue(name, key, issuer_name=None, issuer_key=None, ca=False, path_length=None, dns_names=(), days=30,
+          offset_days=-1, eku=(ExtendedKeyUsageOID.SERVER_AUTH,), name_constraints=None, extensions=()):
+    now = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(days=offset_days)
+    subject = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, name)])
+    builder = x509.CertificateBuilder() \
+        .subject_name(subject) \
+        .issuer_name(issuer_name or subject) \
+        .public_key(key.public_key()) \
+        .serial_number(x509.random_serial_number()) \
+        .not_valid_before(now) \
+        .not_valid_after(now + datetime.timedelta(days=days)) \
+        .add_extension(x509.SubjectKeyIdentifier.from_public_key(key.public_key()), critical=False) \
+        .add_extension(x509.AuthorityKeyIdentifier.from_issuer_public_key((issuer_key or key).public_key()),
+                       critical=False)
+    if ca is not None:
+        builder = builder.add_extension(x509.BasicConstraints(ca=ca, path_length=path_length), critical=True)
+    if ca:
+        builder = builder.add_extension(x509.KeyUsage(digital_signature=False, content_commitment=False,
+                                                      key_encipherment=False, data_encipherment=False,
+                                                      key_agreement=False, key_cert_sign=True, crl_sign=True,
+                                                      encipher_only=False, decipher_only=False), critical=True)
+    if name_constraints is not None:
+        permitted, excluded = ([x509.DNSName(name) for name in names] if names is not None else None
+                               for names in name_constraints)
+        builder = builder.add_extension(x509.NameConstraints(permitted, excluded), critical=True)
+    if dns_names:
+        builder = builder.add_extension(x509.SubjectAlternativeName([x509.DNSName(n) for n in dns_names]),
+                                        critical=False)
+        builder = builder.add_extension(x509.ExtendedKeyUsage(list(eku)), critical=False)
+    for extension, critical in extensions:
+        builder = builder.add_extension(extension, critical=critical)
+    return builder.sign(issuer_key or key, hashes.SHA256())
+
+
+def pem(*certificates):
+    return b''.join(c.public_bytes(serialization.Encoding.PEM) for c in certificates)
+
+
+def der(*certificates):
+    return [c.public_bytes(serialization.Encoding.DER) for c in certificates]
+
+
+class PKI:
+    """A root, an intermediate and chains (from the leaf up, root excluded) for every case, all with one key type"""
+
+    def __init__(self, kind):
+        self.root_key, self.intermediate_key, self.leaf_key = new_key(kind), new_key(kind), new_key(kind)
+        self.root = issue(f'{kind} root', self.root_key, ca=True)
+        self.intermediate = issue(f'{kind} intermediate', self.intermediate_key, self.root.subject, self.root_key,
+                                  ca=True, path_length=0)
+        self.leaf = self.leaf_of(self.intermediate, self.intermediate_key)
+
+        other_root_key = new_key(kind)
+        other_root = issue(f'{kind} other root', other_root_key, ca=True)
+        not_ca = issue(f'{kind} not a CA', self.intermediate_key, self.root.subject, self.root_key, ca=False)
+        # The intermediate has a path length of 0, so it must not issue another CA
+        deep_key = new_key(kind)
+        deep = issue(f'{kind} deep', deep_key, self.intermediate.subject, self.intermediate_key, ca=True)
+
+        def constrained(name_constraints):
+            return issue(f'{kind} constrained', self.intermediate_key, self.root.subject, self.root_key, ca=True,
+                         name_constraints=name_constraints)
+
+        permitted = constrained((['verify.localhost'], None))
+        not_permitted = constrained((['other.localhost'], None))
+        excluded = constrained((None, ['verify.localhost']))
+        unknown_extension = x509.UnrecognizedExtension(x509.ObjectIdentifier('1.3.6.1.4.1.55555.1'), b'\x05\x00')
+        intermediate, key = self.intermediate, self.intermediate_key
+
+        # Name of the case, chain, and the error it must fail with (None if it is valid)
+        self.cases = {
+            'valid': ([self.leaf, intermediate], None),
+            'wildcard': ([self.leaf_of(intermediate, key, dns_names=['*.verify.localhost']), intermediate], None),
+            'wildcard too wide': ([self.leaf_of(intermediate, key, dns_names=['*.localhost']), intermediate],
+                                  VerifyCodes.HOSTNAME_MISMATCH),
+            'wrong hostname': ([self.leaf_of(intermediate, key, dns_names=['other.localhost']), intermediate],
+                               VerifyCodes.HOSTNAME_MISMATCH),
+            'expired': ([self.leaf_of(intermediate, key, days=2, offset_days=-10), intermediate],
+                        VerifyCodes.CERT_HAS_EXPIRED),
+            'not yet valid': ([self.leaf_of(intermediate, key, offset_days=5), intermediate],
+                              VerifyCodes.CERT_NOT_YET_VALID),
+            'missing intermediate': ([self.leaf], VerifyCodes.UNABLE_TO_GET_ISSUER_CERT_LOCALLY),
+            'untrusted root': ([self.leaf_of(other_root, other_root_key), other_root],
+                               VerifyCodes.SELF_SIGNED_CERT_IN_CHAIN),
+            'self-signed': ([issue(HOSTNAME, self.leaf_key, dns_names=[HOSTNAME])],
+                            VerifyCodes.DEPTH_ZERO_SELF_SIGNED_CERT),
+            'intermediate not a CA': ([self.leaf_of(not_ca, key), not_ca], VerifyCodes.INVALID_CA),
+            'path length exceeded': ([self.leaf_of(deep, deep_key), deep, intermediate],
+                                     VerifyCodes.PATH_LENGTH_EXCEEDED),
+            'client auth only': ([self.leaf_of(intermediate, key, eku=[ExtendedKeyUsageOID.CLIENT_AUTH]),
+                                  intermediate], VerifyCodes.INVALID_PURPOSE),
+            'any purpose only': ([self.leaf_of(intermediate, key, eku=[ExtendedKeyUsageOID.ANY_EXTENDED_KEY_USAGE]),
+                                  intermediate], VerifyCodes.INVALID_PURPOSE),
+            'name permitted': ([self.leaf_of(permitted, key), permitted], None),
+            'name not permitted': ([self.leaf_of(not_permitted, key), not_permitted],
+                                   VerifyCodes.PERMITTED_VIOLATION),
+            'name excluded': ([self.leaf_of(excluded, key), excluded], VerifyCodes.EXCLUDED_VIOLATION),
+            'unhandled critical extension': ([self.leaf_of(intermediate, key,
+                                                           extensions=[(unknown_extension, True)]), intermediate],
+                                             VerifyCodes.UNHANDLED_CRITICAL_EXTENSION),
+        }
+
+    def leaf_of(self, issuer, issuer_key, **kwargs):
+        kwargs.setdefault('dns_names', [HOSTNAME])
+        return issue(HOSTNAME, self.leaf_key, issuer.subject, issuer_key, **kwargs)
+
+    def trust_store(self, *roots):
+        return TrustStore(der(*(roots or (self.root,))))
+
+
+@pytest.fixture(scope='module', params=KINDS)
+def pki(request):
+    return PKI(request.param)
+
+
+CASES =['valid', 'wildcard', 'wildcard too wide', 'wrong hostname', 'expired', 'not yet valid',
+         'missing intermediate', 'untrusted root', 'self-signed', 'intermediate not a CA', 'path length exceeded',
+         'client auth only', 'any purpose only', 'name permitted', 'name not permitted', 'name excluded',
+         'unhandled critical extension']
+
+
+def assert_verify_error(code, verify):
+    with pytest.raises(ssl.SSLCertVerificationError) as info:
+        verify()
+    assert info.value.verify_code == code[0]
+    assert info.value.verify_message.startswith(code[1])
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_verify(pki, case):
+    chain, code = pki.cases[case]
+    store = pki.trust_store()
+    if code is None:
+        store.verify(der(*chain), HOSTNAME)
+    else:
+        assert_verify_error(code, lambda: store.verify(der(*chain), HOSTNAME))
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_verify_cached(pki, case):
+    # Chains are only cached once they verified, so broken ones keep failing
+    chain, code = pki.cases[case]
+    store = pki.trust_store()
+    for _ in range(2):
+        if code is None:
+            store.verify(der(*chain), HOSTNAME)
+        else:
+            assert_verify_error(code, lambda: store.verify(der(*chain), HOSTNAME))
+
+
+def test_hostname_checked_per_cached_chain(pki):
+    store = pki.trust_store()
+    chain = der(pki.leaf, pki.intermediate)
+    store.verify(chain, HOSTNAME)
+    assert_verify_error(VerifyCodes.HOSTNAME_MISMATCH, lambda: store.verify(chain, 'other.localhost'))
+    store.verify(chain, 'other.localhost', check_hostname=False)
+
+
+def test_ip_address():
+    pki = PKI('p256')
+    leaf = issue('127.0.0.1', pki.leaf_key, pki.intermediate.subject, pki.intermediate_key,
+                 extensions=[(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address('127.0.0.1'))]),
+                              False)])
+    store = pki.trust_store()
+    store.verify(der(leaf, pki.intermediate), '127.0.0.1')
+    assert_verify_error(VerifyCodes.HOSTNAME_MISMATCH, lambda: store.verify(der(leaf, pki.intermediate), '127.0.0.2'))
+
+
+def test_expired_trusted_root_with_renewal():
+    # Both roots have the same subject and key, and the expired one comes first in the store
+    pki = PKI('p256')
+    expired_root = issue('p256 root', pki.root_key, ca=True, days=2, offset_days=-10)
+    store = pki.trust_store(expired_root, pki.root)
+    store.verify(der(pki.leaf, pki.intermediate), HOSTNAME)
+
+    assert_verify_error(VerifyCodes.CERT_HAS_EXPIRED,
+                        lambda: pki.trust_store(expired_root).verify(der(pki.leaf, pki.intermediate), HOSTNAME))
+
+
+def test_unusable_trusted_certificate_with_same_subject():
+    # A trusted certificate with the subject of the root which is not a CA must not hide the root
+    pki = PKI('p256')
+    not_ca = issue('p256 root', pki.root_key, ca=False)
+    pki.trust_store(not_ca, pki.root).verify(der(pki.leaf, pki.intermediate), HOSTNAME)
+
+
+def test_expired_trusted_intermediate_falls_back_to_chain():
+    # The store has an expired copy of the intermediate, while the server sends the current one
+    pki = PKI('p256')
+    expired_intermediate = issue('p256 intermediate', pki.intermediate_key, pki.root.subject, pki.root_key, ca=True,
+                                 path_length=0, days=2, offset_days=-10)
+    store = pki.trust_store(expired_intermediate, pki.root)
+    store.verify(der(pki.leaf, pki.intermediate), HOSTNAME)
+
+
+def test_no_certificate():
+    assert_verify_error(VerifyCodes.NO_PEER_CERTIFICATE, lambda: PKI('p256').trust_store().verify([], HOSTNAME))
+
+
+class Server:
+    """Loopback TLS server (ssl module) presenting a certificate chain until closed"""
+
+    def __init__(self, certfile, keyfile):
+        self.context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        self.context.load_cert_chain(certfile, keyfile)
+        self.sock = socket.create_server(('127.0.0.1', 0))
+        self.port = self.sock.getsockname()[1]
+        threading.Thread(target=self._serve, daemon=True).start()
+
+    def _serve(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            try:
+                with self.context.wrap_socket(conn, server_side=True) as tls:
+                    tls.recv(1)
+            except (OSError, ssl.SSLError):
+                pass
+
+    def close(self):
+        self.sock.close()
+
+
+def outcome(connect):
+    try:
+        connect()
+    except ssl.SSLCertVerificationError as e:
+        # The codes of some errors are different from one OpenSSL version to the next, the messages are not
+        return e.verify_message
+    return 'ok'
+
+
+def connect_ssl(cafile, port):
+    context = ssl.create_default_context(cafile=cafile)
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        context.wrap_socket(sock, server_hostname=HOSTNAME).close()
+
+
+def connect_tlslite(cafile, port):
+    proxy = create_ssl_context_proxy(verify=cafile)
+    with socket.create_connection(('127.0.0.1', port)) as sock:
+        proxy.wrap_socket(sock, server_hostname=HOSTNAME)
+
+
+@pytest.mark.parametrize('case', CASES)
+def test_same_as_ssl_module(pki, case, tmp_path):
+    chain, code = pki.cases[case]
+    cafile, certfile, keyfile = str(tmp_path / 'ca.pem'), str(tmp_path / 'chain.pem'), str(tmp_path / 'key.pem')
+    with open(cafile, 'wb') as f:
+        f.write(pem(pki.root))
+    with open(certfile, 'wb') as f:
+        f.write(pem(*chain))
+    with open(keyfile, 'wb') as f:
+        f.write(pki.leaf_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                           serialization.NoEncryption()))
+
+    server = Server(certfile, keyfile)
+    try:
+        expected = outcome(lambda: connect_ssl(cafile, server.port))
+        got = outcome(lambda: connect_tlslite(cafile, server.port))
+    finally:
+        server.close()
+    assert got == expected
+    assert (expected == 'ok') == (code is None)
+
+
+def test_trust_store_shared_by_locations(tmp_path, monkeypatch):
+    pki = PKI('p256')
+    cafile = str(tmp_path / 'ca.pem')
+    with open(cafile, 'wb') as f:
+        f.write(pem(pki.root))
+
+    first = create_ssl_context_proxy(verify=cafile).get_trust_store()
+    assert len(first) == 1
+
+    # The CA file is not read again as long as it is not modified
+    def load_certificates(*args):
+        raise AssertionError("the CA certificates were loaded again")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(TrustStore, 'load_certificates', load_certificates)
+        assert create_ssl_context_proxy(verify=cafile).get_trust_store() is first
+
+    other = PKI('p256')
+    with open(cafile, 'wb') as f:
+        f.write(pem(pki.root, other.root))
+    stat = os.stat(cafile)
+    os.utime(cafile, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    second = create_ssl_context_proxy(verify=cafile).get_trust_store()
+    assert second is not first and len(second) == 2
+
+
+def test_trust_store_of_ssl_context(tmp_path):
+    pki = PKI('p256')
+    cafile = str(tmp_path / 'ca.pem')
+    with open(cafile, 'wb') as f:
+        f.write(pem(pki.root))
+
+    # A context of the caller's own may have CA certificates from anywhere, so it is never looked up by location
+    context = ssl.create_default_context(cafile=cafile)
+    store = get_trust_store(context, [cafile])
+    assert get_trust_store(ssl.create_default_context(cafile=cafile), [cafile]) is store
+    store.verify(der(pki.leaf, pki.intermediate), HOSTNAME)